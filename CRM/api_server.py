@@ -0,0 +1,405 @@
+"""
+Local JSON query API.
+
+Serves the analytics and the lead store to other internal tools, next to the
+app and over the same data directory:
+
+    python api_server.py --port 8502 --workers 4
+
+Endpoints (GET only):
+
+    /health                               liveness check
+    /version                              dataset and lead store versions
+    /analytics                            names of the analyses
+    /analytics/<name>                     one analysis, e.g. /analytics/lifetime_value
+        ?start=YYYY-MM-DD&end=YYYY-MM-DD  only the payments within the range
+        &customer=<name or email>         only that customer's rows (or payments)
+        &gap_months=3                     cancellation gap, for cancellation_months
+    /leads?q=<text>&status=&source=       lead search, as on the Kanban board
+    /leads/funnel                         funnel metrics of the lead event log
+
+Analyses are served from the app's materialized views. Every response
+carries an ETag made of the dataset (or lead store) version and the query, so
+clients can revalidate with If-None-Match and get 304 until the next upload
+(or, for analyses measured against today, until the next day);
+encoded responses are also kept in a small in-process LRU cache. Requests run
+on a bounded pool of worker threads, and connections beyond the pool and its
+backlog are answered with 503 instead of piling up.
+"""
+import argparse
+import hashlib
+import json
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from utils.analytics import ANALYSES, DATED_ANALYSES, AnalysisError, find_column, run_analysis
+from utils.analytics.columns import NAME_CANDIDATES
+from utils.customer_keys import (
+    CUSTOMER_KEY_COLUMN,
+    EMAIL_COLUMNS,
+    get_customer_keys,
+    normalize_name,
+    normalize_names
+)
+from utils.lead_index import LeadSearchIndex
+from utils.state_manager import StateManager
+
+DEFAULT_PORT = 8502
+
+# Analyses with one row per customer; a customer filter selects rows of the
+# result instead of payments, so scores stay relative to every customer
+CUSTOMER_ANALYSES = {'customer_lifetime', 'lifetime_value', 'rfm_segments'}
+
+# Encoded responses kept in memory
+RESPONSE_CACHE_SIZE = 256
+
+
+class APIError(Exception):
+    """A request that cannot be answered, with its HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_date(query, name):
+    value = query.get(name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise APIError(400, f"'{name}' must be a date as YYYY-MM-DD, got '{value}'")
+
+
+def parse_int(query, name, default, minimum=1):
+    value = query.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        raise APIError(400, f"'{name}' must be an integer of at least {minimum}, got '{value}'")
+    return number
+
+
+def customer_payments(data, customer):
+    """
+    Rows of the payments of a customer, matched by email or by name.
+
+    :param data: Preprocessed payment DataFrame
+    :param customer: Email (anything containing '@') or customer name
+    :return: Boolean array aligned with the rows of data
+    """
+    if '@' in customer:
+        email_column = next((column for column in EMAIL_COLUMNS if column in data.columns), None)
+        if email_column is None:
+            raise APIError(400, "The dataset has no email column; filter customers by name")
+        emails = data[email_column].astype('string').str.strip().str.lower()
+        return (emails == customer.strip().lower()).fillna(False).to_numpy()
+    nome_column = find_column(data, NAME_CANDIDATES)
+    return (normalize_names(data[nome_column]) == normalize_name(customer)).fillna(False).to_numpy()
+
+
+def frame_records(frame):
+    """JSON-ready records of a DataFrame; dates as ISO strings, NaN as null."""
+    return json.loads(frame.to_json(orient='records', date_format='iso'))
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of encoded responses keyed by version and query."""
+
+    def __init__(self, size=RESPONSE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+class QueryAPI:
+    """
+    The endpoints, independent of HTTP.
+
+    The uploaded dataset and the lead search index are loaded once per
+    version and shared by every request thread.
+    """
+
+    def __init__(self, state_manager=None):
+        self.state_manager = state_manager or StateManager()
+        self.cache = ResponseCache()
+        self.lock = threading.Lock()
+        self.dataset = (None, None)
+        self.lead_index = (None, None, None)
+
+    def data(self, version):
+        """The uploaded dataset of a version, read from the partitions once."""
+        with self.lock:
+            loaded_version, data = self.dataset
+            if loaded_version != version:
+                data = self.state_manager.load_uploaded_data()
+                self.dataset = (version, data)
+        if data is None:
+            raise APIError(404, "No data uploaded yet")
+        return data
+
+    def leads(self, version):
+        """Current leads and their search index, rebuilt when the lead store changes."""
+        with self.lock:
+            loaded_version, leads, index = self.lead_index
+            if loaded_version != version:
+                leads = self.state_manager.load_lead_log().current_leads()
+                index = LeadSearchIndex(leads)
+                self.lead_index = (version, leads, index)
+        return leads, index
+
+    def handle(self, path, query):
+        """
+        Answer a GET request.
+
+        :param path: URL path
+        :param query: Dictionary of query parameters (last value of each)
+        :return: Tuple of (status, encoded JSON body, ETag or None)
+        """
+        parts = [part for part in path.split('/') if part]
+        if parts in ([], ['health']):
+            return 200, self.encode({'status': 'ok'}), None
+        if parts == ['version']:
+            return 200, self.encode(self.versions()), None
+        if parts == ['analytics']:
+            return 200, self.encode({'analyses': list(ANALYSES)}), None
+
+        if parts[:1] == ['analytics'] and len(parts) == 2:
+            version = self.state_manager.uploaded_data_version()
+            version_tag = f'd{version}'
+            if parts[1] in DATED_ANALYSES:
+                # The result also changes with the day it is measured against
+                version_tag += f'-{date.today().isoformat()}'
+            return self.cached(version_tag, path, query, lambda: self.analysis(parts[1], query, version))
+        if parts[:1] == ['leads'] and len(parts) <= 2:
+            version = self.state_manager.leads_version()
+            if parts[1:] == ['funnel']:
+                return self.cached(f'l{version}', path, query, lambda: {'lead_version': version, 'funnel': self.state_manager.load_lead_funnel()})
+            if len(parts) == 1:
+                return self.cached(f'l{version}', path, query, lambda: self.search_leads(query, version))
+        raise APIError(404, f"Unknown endpoint: {path}")
+
+    def versions(self):
+        return {
+            'dataset_version': self.state_manager.uploaded_data_version(),
+            'lead_version': self.state_manager.leads_version()
+        }
+
+    def cached(self, version_tag, path, query, compute):
+        """Serve a response from the cache, computing and encoding it on a miss."""
+        key = (version_tag, path, tuple(sorted(query.items())))
+        entry = self.cache.get(key)
+        if entry is None:
+            digest = hashlib.md5(repr(key[1:]).encode()).hexdigest()[:12]
+            entry = (self.encode(compute()), f'"{version_tag}-{digest}"')
+            self.cache.put(key, entry)
+        body, etag = entry
+        return 200, body, etag
+
+    @staticmethod
+    def encode(payload):
+        return json.dumps(payload, default=str).encode()
+
+    def analysis(self, name, query, version):
+        if name not in ANALYSES:
+            raise APIError(404, f"Unknown analysis '{name}'; available: {', '.join(ANALYSES)}")
+        start, end = parse_date(query, 'start'), parse_date(query, 'end')
+        date_range = (start, end) if start or end else None
+        gap_months = parse_int(query, 'gap_months', 3)
+        customer = query.get('customer')
+        data = self.data(version)
+
+        if customer is None:
+            result = self.state_manager.load_analysis(name, data, version, gap_months, date_range)
+            table = result.to_frame()
+        else:
+            selected = customer_payments(data, customer)
+            if name in CUSTOMER_ANALYSES:
+                result = self.state_manager.load_analysis(name, data, version, gap_months, date_range)
+                table = self.customer_rows(result.to_frame(), data, selected)
+            else:
+                # Month-level analyses are recomputed over the customer's payments
+                result = run_analysis(name, data[selected], gap_months, date_range=date_range)
+                table = result.to_frame()
+
+        return {
+            'analysis': name,
+            'dataset_version': version,
+            'start': start,
+            'end': end,
+            'customer': customer,
+            'diagnostics': {
+                'rows': result.diagnostics.rows,
+                'rows_used': result.diagnostics.rows_used,
+                'warnings': result.diagnostics.warnings,
+                'materialized': result.diagnostics.materialized
+            },
+            'rows': frame_records(table)
+        }
+
+    @staticmethod
+    def customer_rows(table, data, selected):
+        """Rows of a per-customer table that belong to the customers of the selected payments."""
+        keys = np.unique(get_customer_keys(data, find_column(data, NAME_CANDIDATES))[selected])
+        # Names can be shared by several customers, so rows are matched by customer key
+        return table[table[CUSTOMER_KEY_COLUMN].isin(keys[keys >= 0])]
+
+    def search_leads(self, query, version):
+        _, index = self.leads(version)
+        matches = index.search(query.get('q', ''), status=query.get('status'), source=query.get('source'))
+        return {
+            'lead_version': version,
+            'leads': index.get_leads(matches)
+        }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    HTTP front of QueryAPI; the server provides the api attribute.
+
+    Responses close the connection (HTTP/1.0), so an idle client never holds a worker.
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            status, body, etag = self.server.api.handle(url.path, query)
+        except APIError as e:
+            status, body, etag = e.status, QueryAPI.encode({'error': str(e)}), None
+        except AnalysisError as e:
+            status, body, etag = 422, QueryAPI.encode({'error': str(e)}), None
+        except Exception as e:
+            print(f"Error serving {self.path}: {e!r}")
+            status, body, etag = 500, QueryAPI.encode({'error': 'Internal error'}), None
+
+        if etag is not None and etag in (self.headers.get('If-None-Match') or '').split(', '):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTP server handing connections to a bounded thread pool.
+
+    At most workers connections are served at once and backlog more wait for
+    a worker; any further connection gets an immediate 503.
+    """
+
+    def __init__(self, address, api, workers=4, backlog=16, quiet=False):
+        super().__init__(address, QueryHandler)
+        self.api = api
+        self.quiet = quiet
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api')
+        self.slots = threading.BoundedSemaphore(workers + backlog)
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.reject(request)
+            return
+        self.pool.submit(self.process_request_in_pool, request, client_address)
+
+    def process_request_in_pool(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def reject(self, request):
+        body = QueryAPI.encode({'error': 'Server busy, retry shortly'})
+        try:
+            request.sendall(
+                b'HTTP/1.1 503 Service Unavailable\r\n'
+                b'Content-Type: application/json\r\n'
+                b'Retry-After: 1\r\n'
+                b'Connection: close\r\n'
+                + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+            )
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def make_server(host='127.0.0.1', port=DEFAULT_PORT, workers=4, backlog=16, quiet=False):
+    """
+    Build the API server over the data directory of StateManager (CRM_DATA_DIR if set).
+
+    :param port: TCP port (0 picks a free one)
+    :param workers: Requests served concurrently
+    :param backlog: Connections that may wait for a worker before new ones get 503
+    :return: PooledHTTPServer; call serve_forever() to run it
+    """
+    return PooledHTTPServer((host, port), QueryAPI(), workers, backlog, quiet)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the CRM analytics and lead store as a local JSON API.")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="TCP port")
+    parser.add_argument('--workers', type=int, default=4, help="Requests served concurrently")
+    parser.add_argument('--backlog', type=int, default=16, help="Requests that may wait for a worker")
+    parser.add_argument('--quiet', action='store_true', help="Do not log every request")
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.workers, args.backlog, args.quiet)
+    print(f"Serving the CRM API on http://{args.host}:{server.server_address[1]} ({args.workers} workers)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
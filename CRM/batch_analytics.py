@@ -0,0 +1,203 @@
+"""
+Headless batch analytics.
+
+Ingests a payment export and precomputes the analyses shown on the Finance and
+Product screens, without Streamlit:
+
+    python batch_analytics.py data/payments.csv --output-dir utils/data/analytics --jobs 4
+
+With --sharded, the analyses run one after the other and the per-customer
+ones spread their customers over the --jobs workers instead, which scales
+better on long payment histories.
+
+With --materialize, no file is read: the dataset last uploaded to the app is
+analyzed into its materialized views and anomaly baselines,
+so the first page views after an upload do not have to compute them:
+
+    python batch_analytics.py --materialize
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from utils.analytics import ANALYSES, load_and_preprocess_data, run_analysis
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utils', 'data', 'analytics')
+
+TASKS = tuple(ANALYSES)
+
+
+def run_task(name, data, gap_months, jobs=1, date_range=None):
+    """
+    Run one analysis and return it as a flat DataFrame ready for columnar storage.
+
+    :param name: Analysis name
+    :param data: Preprocessed payment DataFrame
+    :param gap_months: Months without payment that count as a cancellation
+    :param jobs: Worker processes sharing the customers of a per-customer analysis
+    :param date_range: Optional (start, end) tuple the analysis is limited to
+    :return: Tuple of (name, result DataFrame, seconds elapsed, diagnostic warnings)
+    """
+    start = time.perf_counter()
+    result = run_analysis(name, data, gap_months, jobs, date_range)
+    return name, result.to_frame(), time.perf_counter() - start, result.diagnostics.warnings
+
+
+def file_fingerprint(path):
+    """SHA-256 of the input file, recorded so consumers can tell which data a result came from."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_batch(input_file, output_dir, jobs=1, gap_months=3, tasks=TASKS, sharded=False, date_range=None):
+    """
+    Ingest a file, compute every analysis and write the results as Parquet files.
+
+    :param input_file: CSV or XLSX payment export
+    :param output_dir: Directory receiving one <analysis>.parquet per analysis and manifest.json
+    :param jobs: Number of worker processes (1 runs everything in this process)
+    :param gap_months: Months without payment that count as a cancellation
+    :param tasks: Analyses to run
+    :param sharded: Use the workers inside each per-customer analysis instead of
+                    running the analyses in parallel
+    :param date_range: Optional (start, end) tuple; only payments within it are analyzed
+    :return: Manifest dictionary with rows and timings
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    print(f"Ingesting {input_file}...")
+    ingest_report = {}
+    with open(input_file, 'rb') as f:
+        data = load_and_preprocess_data(f, ingest_report)
+    ingest_seconds = time.perf_counter() - started
+    print(f"Ingested {len(data):,} rows in {ingest_seconds:.2f}s "
+          f"({ingest_report['throughput']['rows_per_second']:,.0f} rows/s)")
+
+    timings = {}
+    rows = {}
+    warnings = {}
+
+    def store(name, result, seconds, task_warnings):
+        result.to_parquet(os.path.join(output_dir, f'{name}.parquet'), index=False)
+        timings[name] = round(seconds, 3)
+        rows[name] = len(result)
+        if task_warnings:
+            warnings[name] = task_warnings
+        print(f"[{len(timings)}/{len(tasks)}] {name}: {len(result):,} rows in {seconds:.2f}s")
+        for warning in task_warnings:
+            print(f"    {warning}")
+
+    if sharded:
+        for name in tasks:
+            store(*run_task(name, data, gap_months, jobs, date_range))
+    elif jobs > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+            futures = [pool.submit(run_task, name, data, gap_months, 1, date_range) for name in tasks]
+            for future in as_completed(futures):
+                store(*future.result())
+    else:
+        for name in tasks:
+            store(*run_task(name, data, gap_months, 1, date_range))
+
+    manifest = {
+        'source': os.path.abspath(input_file),
+        'source_sha256': file_fingerprint(input_file),
+        'input_rows': len(data),
+        'gap_months': gap_months,
+        'date_range': [str(bound) if bound is not None else None for bound in date_range] if date_range else None,
+        'jobs': jobs,
+        'sharded': sharded,
+        'created_at': pd.Timestamp.now().isoformat(),
+        'ingest_seconds': round(ingest_seconds, 3),
+        'ingest_rows_per_second': round(ingest_report['throughput']['rows_per_second'] or 0),
+        'task_seconds': timings,
+        'result_rows': rows,
+        'warnings': warnings,
+        'total_seconds': round(time.perf_counter() - started, 3)
+    }
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+def load_batch_results(output_dir):
+    """
+    Load precomputed results written by run_batch.
+
+    :param output_dir: Directory written by run_batch
+    :return: Tuple of (dictionary of result DataFrames, manifest), or (None, None) if missing
+    """
+    manifest_file = os.path.join(output_dir, 'manifest.json')
+    if not os.path.exists(manifest_file):
+        return None, None
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    results = {
+        name: pd.read_parquet(os.path.join(output_dir, f'{name}.parquet'))
+        for name in manifest['result_rows']
+    }
+    return results, manifest
+
+
+def materialize_uploaded_data():
+    """Precompute the views of the dataset uploaded to the app (CRM_DATA_DIR or utils/data)."""
+    from utils.state_manager import StateManager
+
+    try:
+        version = StateManager().materialize()
+    except Exception as e:
+        print(f"Materializing the uploaded data failed: {e}", file=sys.stderr)
+        return 1
+    if version is None:
+        print("No uploaded data to materialize", file=sys.stderr)
+        return 1
+    print(f"Materialized version {version} of the uploaded data")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute CRM analytics from a payment export without Streamlit.")
+    parser.add_argument('input_file', nargs='?', help="CSV or XLSX payment export")
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help="Directory for the Parquet results")
+    parser.add_argument('--jobs', type=int, default=1, help="Worker processes used to run the analyses in parallel")
+    parser.add_argument('--gap-months', type=int, default=3, help="Months without payment that count as a cancellation")
+    parser.add_argument('--sharded', action='store_true', help="Shard each per-customer analysis across the workers")
+    parser.add_argument('--start', help="Only analyze payments on or after this date (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Only analyze payments on or before this date (YYYY-MM-DD)")
+    parser.add_argument('--only', nargs='+', choices=TASKS, default=list(TASKS), help="Run only these analyses")
+    parser.add_argument('--materialize', action='store_true',
+                        help="Precompute the app's views of the uploaded dataset instead of reading input_file")
+    args = parser.parse_args(argv)
+
+    if args.materialize:
+        return materialize_uploaded_data()
+    if args.input_file is None:
+        parser.error("input_file is required unless --materialize is given")
+
+    try:
+        date_range = (args.start, args.end) if args.start or args.end else None
+        manifest = run_batch(args.input_file, args.output_dir, args.jobs, args.gap_months, args.only, args.sharded, date_range)
+    except Exception as e:
+        print(f"Batch analytics failed: {e}", file=sys.stderr)
+        return 1
+
+    print(f"\nIngest: {manifest['ingest_seconds']:.2f}s")
+    for name, seconds in manifest['task_seconds'].items():
+        print(f"{name:>20}: {seconds:.2f}s ({manifest['result_rows'][name]:,} rows)")
+    print(f"{'total':>20}: {manifest['total_seconds']:.2f}s")
+    print(f"Results written to {args.output_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""
+Concurrent-session load test.
+
+Drives the app headlessly with Streamlit's AppTest, one simulated analyst per
+process, against a synthetic dataset in a temporary data directory:
+
+    python load_test.py --sessions 8 --rounds 3 --rows 200000
+
+Each session navigates every screen, moves the Product and Finance sliders
+and creates a lead on the Kanban board; one session uploads a fresh dataset
+every round, so the others reload it on their next rerun. The run reports
+p50/p95/p99 rerun latency (overall and per step), memory per session and
+reruns per second, and appends the report to a JSON Lines history file so
+capacity can be tracked over time.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+DEFAULT_HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utils', 'data', 'load_test_history.jsonl')
+
+PERCENTILES = (50, 95, 99)
+
+
+def synthetic_payments(rows, customers, months=36, seed=0):
+    """
+    Payment export with the columns of the real one.
+
+    :param rows: Number of payments
+    :param customers: Number of distinct customers
+    :param months: Months of history ending today
+    :param seed: Random seed
+    :return: Raw DataFrame (Nome, Email, Data de confirmação, Valor, Status)
+    """
+    rng = np.random.default_rng(seed)
+    customer = rng.integers(0, customers, rows)
+    end = pd.Timestamp.now().normalize()
+    days = rng.integers(0, months * 30, rows)
+    return pd.DataFrame({
+        'Nome': pd.Series(customer).map(lambda c: f'Customer {c}'),
+        'Email': pd.Series(customer).map(lambda c: f'customer{c}@example.com'),
+        'Data de confirmação': (end - pd.to_timedelta(days, unit='D')).strftime('%d/%m/%Y'),
+        'Valor': rng.choice([49.9, 97.0, 197.0, 497.0], rows),
+        'Status': rng.choice(['Pago', 'Cancelado'], rows, p=[0.8, 0.2])
+    })
+
+
+def ingest(raw):
+    """Run a raw export through the same ingestion as the Upload screen."""
+    from utils.analytics import load_and_preprocess_data
+
+    buffer = io.BytesIO(raw.to_csv(index=False).encode())
+    buffer.name = 'load_test.csv'
+    return load_and_preprocess_data(buffer)
+
+
+def rss_mb():
+    """Resident memory of this process (peak resident memory where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentiles(values):
+    if not values:
+        return {f'p{p}': None for p in PERCENTILES}
+    points = np.percentile(values, PERCENTILES)
+    return {f'p{p}': round(float(point) * 1000, 1) for p, point in zip(PERCENTILES, points)}
+
+
+class Session:
+    """One simulated analyst: an AppTest instance and the latencies of its reruns."""
+
+    def __init__(self, session_id, timeout, rng):
+        from streamlit.testing.v1 import AppTest
+
+        self.session_id = session_id
+        self.app = AppTest.from_file(APP_FILE, default_timeout=timeout)
+        self.rng = rng
+        self.latencies = []
+        self.errors = []
+
+    def rerun(self, step):
+        start = time.perf_counter()
+        self.app.run()
+        self.latencies.append((step, time.perf_counter() - start))
+        for exception in self.app.exception:
+            self.errors.append(f"{step}: {exception.value}")
+
+    def navigate(self, page):
+        self.app.button(key=page).click()
+        self.rerun(page)
+
+    def move_sliders(self, step):
+        for slider in self.app.slider:
+            slider.set_value(self.rng.randint(slider.min, slider.max))
+            self.rerun(step)
+
+    def create_lead(self):
+        self.app.button(key='add-lead-btn').click()
+        self.rerun('open lead form')
+        lead = f'Load Test Lead {self.session_id}-{self.rng.randrange(10 ** 6)}'
+        self.app.text_input(key='lead_name').input(lead)
+        self.app.text_input(key='lead_email').input(f'{lead.replace(" ", ".").lower()}@example.com')
+        save = next(button for button in self.app.button if button.label == 'Save')
+        save.click()
+        self.rerun('save lead')
+
+    def data_mb(self):
+        """Memory held by the session's uploaded DataFrame."""
+        if 'data' not in self.app.session_state:
+            return 0.0
+        return self.app.session_state['data'].memory_usage(deep=True).sum() / 1024 ** 2
+
+    def round(self):
+        """One pass of the scripted workflow."""
+        self.navigate("Finance")
+        self.move_sliders('finance slider')
+        self.navigate("Product")
+        self.move_sliders('product slider')
+        self.navigate("Lead Management")
+        self.create_lead()
+        self.navigate("Home")
+
+
+def upload(raw, seed, latencies):
+    """
+    Save a fresh copy of the dataset as the Upload screen does.
+
+    AppTest cannot drive st.file_uploader, so the upload goes through
+    StateManager directly; sessions then reload the new version on their
+    next rerun, exactly as after an upload in another browser tab.
+    """
+    from utils.state_manager import StateManager
+
+    start = time.perf_counter()
+    data = ingest(raw.sample(frac=1.0, random_state=seed))
+    StateManager().save_uploaded_data(data)
+    latencies.append(('upload', time.perf_counter() - start))
+
+
+def run_session(session_id, rounds, rows, customers, timeout, seed, barrier, results):
+    """
+    Worker process: one session running the scripted workflow.
+
+    AppTest swaps a process-wide runtime on every run, so two sessions cannot
+    rerun concurrently in one process; each session gets its own process.
+    """
+    # Import the app's modules first, so the memory measured below is the session's own
+    import main  # noqa: F401
+
+    rng = random.Random(seed + session_id)
+    session = Session(session_id, timeout, rng)
+    upload_latencies = []
+    report = {'session_id': session_id, 'uploads': upload_latencies}
+    raw = synthetic_payments(rows, customers, seed=seed) if session_id == 0 else None
+    try:
+        before_mb = rss_mb()
+        session.rerun('first load')
+        report['rss_mb'] = rss_mb() - before_mb
+    except Exception as e:
+        session.errors.append(f"first load: {e!r}")
+
+    try:
+        # Every process waits here, even after a failed first load, so the others are not stuck
+        barrier.wait()
+        started = time.perf_counter()
+        for round_number in range(rounds):
+            try:
+                if raw is not None and round_number > 0:
+                    upload(raw, seed + round_number, upload_latencies)
+                session.round()
+            except Exception as e:
+                session.errors.append(f"round {round_number}: {e!r}")
+        report['seconds'] = time.perf_counter() - started
+        report['data_mb'] = session.data_mb()
+    except Exception as e:
+        session.errors.append(repr(e))
+    finally:
+        report.update(latencies=session.latencies, errors=session.errors)
+        results.put(report)
+
+
+def run_load_test(sessions=4, rounds=3, rows=100_000, customers=10_000, timeout=120, seed=0):
+    """
+    Run the scripted workflow in concurrent sessions and measure the reruns.
+
+    Must be called with CRM_DATA_DIR pointing at a scratch directory, which
+    the session processes inherit.
+
+    :param sessions: Number of concurrent simulated sessions
+    :param rounds: Workflow passes per session
+    :param rows: Payments in the synthetic dataset
+    :param customers: Distinct customers in the synthetic dataset
+    :param timeout: Seconds a single rerun may take before it counts as failed
+    :param seed: Random seed of the dataset and the scripted inputs
+    :return: Report dictionary
+    """
+    upload_latencies = []
+    upload(synthetic_payments(rows, customers, seed=seed), seed, upload_latencies)
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(sessions + 1)
+    results = context.Queue()
+    workers = [
+        context.Process(target=run_session, args=(session_id, rounds, rows, customers, timeout, seed, barrier, results))
+        for session_id in range(sessions)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # Every session has rendered its first page; start the clock together
+    barrier.wait()
+    started = time.perf_counter()
+    reports = [results.get() for _ in workers]
+    wall_seconds = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+
+    latencies = [tuple(latency) for report in reports for latency in report['latencies'] if latency[0] != 'first load']
+    first_loads = [seconds for report in reports for step, seconds in report['latencies'] if step == 'first load']
+    upload_latencies += [tuple(latency) for report in reports for latency in report['uploads']]
+    by_step = {}
+    for step, seconds in latencies:
+        by_step.setdefault(step, []).append(seconds)
+
+    return {
+        'created_at': pd.Timestamp.now().isoformat(),
+        'sessions': sessions,
+        'rounds': rounds,
+        'rows': rows,
+        'customers': customers,
+        'reruns': len(latencies),
+        'wall_seconds': round(wall_seconds, 2),
+        'reruns_per_second': round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        'latency_ms': percentiles([seconds for _, seconds in latencies]),
+        'latency_ms_by_step': {step: dict(percentiles(values), count=len(values)) for step, values in by_step.items()},
+        'first_load_ms': percentiles(first_loads),
+        'upload_ms': percentiles([seconds for _, seconds in upload_latencies]),
+        'memory_mb': {
+            'rss_per_session': round(float(np.mean([report.get('rss_mb', 0.0) for report in reports])), 1),
+            'session_data': round(float(np.mean([report.get('data_mb', 0.0) for report in reports])), 1)
+        },
+        'errors': [error for report in reports for error in report['errors']]
+    }
+
+
+def print_report(report):
+    latency = report['latency_ms']
+    print(f"\n{report['sessions']} sessions x {report['rounds']} rounds on {report['rows']:,} payments")
+    print(f"{report['reruns']} reruns in {report['wall_seconds']:.1f}s ({report['reruns_per_second']} reruns/s)")
+    print(f"Rerun latency: p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms")
+    for step, stats in sorted(report['latency_ms_by_step'].items()):
+        print(f"{step:>20}: p50 {stats['p50']:>8} ms  p95 {stats['p95']:>8} ms  p99 {stats['p99']:>8} ms  ({stats['count']} reruns)")
+    memory = report['memory_mb']
+    print(f"Memory: {memory['rss_per_session']} MB RSS per session, {memory['session_data']} MB of data per session")
+    print(f"First load: p50 {report['first_load_ms']['p50']} ms; upload: p50 {report['upload_ms']['p50']} ms")
+    if report['errors']:
+        print(f"{len(report['errors'])} errors, first: {report['errors'][0]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the app's reruns across concurrent headless sessions.")
+    parser.add_argument('--sessions', type=int, default=4, help="Concurrent simulated sessions")
+    parser.add_argument('--rounds', type=int, default=3, help="Workflow passes per session")
+    parser.add_argument('--rows', type=int, default=100_000, help="Payments in the synthetic dataset")
+    parser.add_argument('--customers', type=int, default=10_000, help="Distinct customers in the synthetic dataset")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds a single rerun may take")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--history', default=DEFAULT_HISTORY_FILE, help="JSON Lines file the report is appended to")
+    args = parser.parse_args(argv)
+
+    # Keep the run's uploads, views and leads away from the real data directory
+    data_dir = tempfile.mkdtemp(prefix='crm-load-test-')
+    os.environ['CRM_DATA_DIR'] = data_dir
+    try:
+        report = run_load_test(args.sessions, args.rounds, args.rows, args.customers, args.timeout, args.seed)
+    except Exception as e:
+        print(f"Load test failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_report(report)
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    with open(args.history, 'a') as f:
+        f.write(json.dumps(report) + '\n')
+    print(f"Report appended to {args.history}")
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,7 +7,7 @@ from screens.home_screen import show_home_screen
 from screens.upload_screen import upload_file_screen
 from screens.finance_screen import finance_screen
 from screens.product_screen import product_screen
-from screens.kanban_screen import show_kanban_screen, handle_component_events 
+from screens.kanban_screen import show_kanban_screen, handle_component_events, sync_leads
 
 def load_custom_css():
     # Load custom CSS
@@ -29,6 +29,26 @@ def initialize_session_state():
         st.session_state.edit_mode = False
     if 'current_lead' not in st.session_state:
         st.session_state.current_lead = None
+    if 'date_range' not in st.session_state:
+        st.session_state.date_range = None
+
+def date_range_filter(state_manager):
+    """
+    Sidebar date range applied to every screen.
+
+    :return: Tuple of (start, end) dates, or None when the whole dataset is selected
+    """
+    bounds = state_manager.uploaded_data_bounds()
+    if bounds is None:
+        return None
+    first, last = (bound.date() for bound in bounds)
+    selected = st.sidebar.date_input("Date range", value=(first, last), min_value=first, max_value=last)
+    if not isinstance(selected, (tuple, list)) or len(selected) != 2:
+        # The picker returns a single date until the end of the range is picked
+        return st.session_state.get('date_range')
+    if tuple(selected) == (first, last):
+        return None
+    return tuple(selected)
 
 def main():
     # Set page config before any other Streamlit commands
@@ -41,9 +61,12 @@ def main():
     # Load custom styles
     load_custom_css()
     
-    # Load leads if not already loaded
-    if not st.session_state.leads:
-        st.session_state.leads = state_manager.load_leads() or []
+    # Pull lead changes from other workers; the version check is a single small file read
+    leads_version = state_manager.leads_version()
+    if not st.session_state.leads or st.session_state.get('leads_version') != leads_version:
+        sync_leads(state_manager.load_leads() or [])
+        st.session_state.leads_version = leads_version
+    
      
     # Title
     st.title("Financial and Product Analysis App")
@@ -76,6 +99,19 @@ def main():
                 st.session_state.edit_mode = False
                 st.session_state.current_lead = None
     
+    # Reload the uploaded data only when a worker saved a new version or the
+    # date range changed; only the partitions overlapping the range are read
+    data_version = state_manager.uploaded_data_version()
+    date_range = date_range_filter(state_manager)
+    if (not st.session_state.uploaded or st.session_state.get('data_version') != data_version
+            or st.session_state.get('date_range') != date_range):
+        data = state_manager.load_uploaded_data(*(date_range or (None, None)))
+        if data is not None:
+            st.session_state.data = data
+            st.session_state.uploaded = True
+        st.session_state.data_version = data_version
+        st.session_state.date_range = date_range
+    
     # Render the appropriate screen based on current page
     if st.session_state.current_page == "Home":
         show_home_screen()
@@ -89,12 +125,5 @@ def main():
         handle_component_events()
         show_kanban_screen()
 
-    # Load any existing data if not already loaded
-    if not st.session_state.uploaded:
-        data = state_manager.load_uploaded_data()
-        if data is not None:
-            st.session_state.data = data
-            st.session_state.uploaded = True
-
 if __name__ == "__main__":
     main()
\ No newline at end of file
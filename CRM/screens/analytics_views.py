@@ -0,0 +1,86 @@
+import streamlit as st
+
+from utils.analytics import AnalysisError
+from utils.state_manager import StateManager
+
+
+def show_diagnostics(diagnostics):
+    """Show the data problems an analysis worked around and how much of the data it used."""
+    for warning in diagnostics.warnings:
+        st.warning(warning)
+    if diagnostics.rows:
+        timing = "materialized view" if diagnostics.materialized else f"{diagnostics.seconds * 1000:.0f} ms"
+        st.caption(f"Based on {diagnostics.rows_used:,} of {diagnostics.rows:,} rows ({timing}).")
+
+
+def render_analysis(analysis, *args, empty_message="No data found.", **kwargs):
+    """
+    Run a compute-core analysis and report its outcome on the page.
+
+    :param analysis: Function from utils.analytics
+    :param empty_message: Warning shown when the analysis produced no rows
+    :return: The result object, or None when there is nothing to display
+    """
+    try:
+        result = analysis(*args, **kwargs)
+    except AnalysisError as e:
+        st.error(str(e))
+        return None
+
+    show_diagnostics(result.diagnostics)
+    if result.empty:
+        st.warning(empty_message)
+        return None
+    return result
+
+
+def load_view(name, data, gap_months=3):
+    """
+    Result of a standard analysis of the session's dataset, served from its
+    materialized view when one was stored for the session's data version and
+    date range.
+
+    :param name: Analysis name (key of utils.analytics.ANALYSES)
+    :param data: The session's uploaded DataFrame
+    :param gap_months: Months without payment that count as a cancellation
+    :return: Result object
+    """
+    data_version = st.session_state.get('data_version', 0)
+    date_range = st.session_state.get('date_range')
+    return StateManager().load_analysis(name, data, data_version, gap_months, date_range)
+
+
+def load_forecast(data, horizon=6, segment_column=None):
+    """
+    Revenue forecast of the session's dataset, from the stored models when the
+    session sees the full history and its monthly series did not change.
+
+    :param data: The session's uploaded DataFrame
+    :param horizon: Number of months to forecast
+    :param segment_column: Optional column splitting the revenue into segments
+    :return: ForecastResult
+    """
+    return StateManager().load_forecast(data, horizon, segment_column, st.session_state.get('date_range'))
+
+
+def load_anomalies(data):
+    """
+    Revenue drops in the session's dataset, continuing the stored baselines
+    when the session sees the full history.
+
+    :param data: The session's uploaded DataFrame
+    :return: AnomalyResult
+    """
+    return StateManager().load_anomalies(data, st.session_state.get('date_range'))
+
+
+def load_sketches():
+    """
+    Sketches behind the approximate metrics of the session's dataset, or None
+    when they were not built for its version or the session is limited to a
+    date range.
+
+    :return: Dictionary of sketches (see utils.metric_sketches.MetricSketches.load)
+    """
+    data_version = st.session_state.get('data_version', 0)
+    return StateManager().load_sketches(data_version, st.session_state.get('date_range'))
@@ -2,12 +2,19 @@ import streamlit as st
 import plotly.express as px
 import pandas as pd  # Add this import
 from datetime import datetime
+from utils.charting import forecast_chart, line_chart
+from screens.analytics_views import load_anomalies, load_forecast, load_view, render_analysis
+
+# Low-cardinality columns the revenue forecast can be split by
+FORECAST_SEGMENT_COLUMNS = ['status']
 
 def finance_screen():
     if 'uploaded' in st.session_state and st.session_state.uploaded:
         data = st.session_state.data
         display_financial_data(data)
         visualize_data(data)
+        show_revenue_forecast(data)
+        show_revenue_anomalies(data)
     else:
         st.warning("Please upload your data first in the 'Upload New Data' section.")
 
@@ -19,12 +26,11 @@ def visualize_data(df):
     st.header("Data Visualization")
     
     # Monthly Revenue Plot
-    df['month'] = df['data_de_confirmacao'].dt.to_period('M')
-    monthly_revenue = df.groupby('month')['valor'].sum().reset_index()
-    monthly_revenue['month'] = monthly_revenue['month'].dt.to_timestamp()
-    
-    fig = px.line(monthly_revenue, x='month', y='valor', title='Monthly Revenue')
-    st.plotly_chart(fig)
+    result = render_analysis(load_view, 'monthly_revenue', df,
+                             empty_message="No revenue data found.")
+    if result is not None:
+        fig = line_chart(result.table, x='month', y='valor', title='Monthly Revenue')
+        st.plotly_chart(fig)
     
     # Yearly Revenue Analysis
     st.header("Yearly Revenue Analysis")
@@ -59,4 +65,73 @@ def visualize_data(df):
         uniformtext_mode='hide',
         xaxis=dict(type='category')
     )
-    st.plotly_chart(fig_yearly)
\ No newline at end of file
+    st.plotly_chart(fig_yearly)
+
+def show_revenue_forecast(df):
+    st.header("Revenue Forecast")
+    segment_options = ['None'] + [column for column in FORECAST_SEGMENT_COLUMNS if column in df.columns]
+    col1, col2 = st.columns(2)
+    with col1:
+        horizon = st.slider("Months to forecast", min_value=1, max_value=24, value=6)
+    with col2:
+        segment = st.selectbox("Split by", segment_options)
+    segment_column = None if segment == 'None' else segment
+
+    result = render_analysis(load_forecast, df, horizon, segment_column,
+                             empty_message="Not enough monthly revenue to forecast.")
+    if result is None:
+        return
+
+    sources = list(result.sources.values())
+    st.caption(f"Models: {sources.count('cached')} cached, {sources.count('updated')} updated with new months, "
+               f"{sources.count('fitted')} fitted.")
+    for name, forecast in result.table.groupby('segment', sort=False):
+        history = result.history[result.history['segment'] == name]
+        fig = forecast_chart(history, forecast, x='month', y='valor', title=f'Revenue Forecast - {name}')
+        st.plotly_chart(fig)
+
+    table = result.table.copy()
+    table['month'] = table['month'].dt.strftime('%m/%Y')
+    for column in ['forecast', 'lower', 'upper']:
+        table[column] = table[column].apply(lambda x: f"R$ {x:,.2f}")
+    st.dataframe(table)
+
+def show_revenue_anomalies(df):
+    st.header("Revenue Anomalies")
+    result = render_analysis(load_anomalies, df,
+                             empty_message="No sudden drops in revenue or customer payments were flagged.")
+    if result is None:
+        return
+
+    sources = result.sources
+    st.caption(f"Baselines: {sources.get('continued', 0)} series continued from the last run, "
+               f"{sources.get('computed', 0)} computed from scratch; {sources.get('observations', 0):,} new observations filtered.")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Flagged Periods", len(result.table))
+    with col2:
+        st.metric("Flagged Customer Payments", len(result.customers))
+
+    st.subheader("Revenue Drops")
+    if result.table.empty:
+        st.info("No drops in daily or monthly revenue.")
+    else:
+        periods = result.table.copy()
+        for column in ['period_start', 'period_end']:
+            periods[column] = periods[column].dt.strftime('%d/%m/%Y')
+        for column in ['revenue', 'baseline']:
+            periods[column] = periods[column].apply(lambda x: f"R$ {x:,.2f}")
+        periods['drop'] = periods['drop'].apply(lambda x: f"{x:.0%}")
+        st.dataframe(periods.round({'z_score': 1}))
+
+    st.subheader("Customer Payment Drops")
+    if result.customers.empty:
+        st.info("No drops in customer payment amounts.")
+    else:
+        customers = result.customers.copy()
+        customers['date'] = customers['date'].dt.strftime('%d/%m/%Y')
+        for column in ['amount', 'baseline']:
+            customers[column] = customers[column].apply(lambda x: f"R$ {x:,.2f}")
+        customers['drop'] = customers['drop'].apply(lambda x: f"{x:.0%}")
+        st.dataframe(customers.round({'z_score': 1}))
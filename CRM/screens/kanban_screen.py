@@ -1,8 +1,52 @@
 import streamlit as st
 from utils.state_manager import StateManager
+from utils.lead_customers import LeadCustomerIndex
+from utils.lead_index import LeadSearchIndex
 import time
 import json
 
+def get_lead_index():
+    """Return the session's lead search index, building it from the loaded leads once."""
+    if 'lead_index' not in st.session_state:
+        st.session_state.lead_index = LeadSearchIndex(st.session_state.leads)
+    return st.session_state.lead_index
+
+def get_lead_customers():
+    """
+    Return the session's lead-to-customer join index, or None without uploaded data.
+
+    The index is built once per dataset version and date range; lead changes
+    are applied to it one lead at a time.
+    """
+    if not st.session_state.get('uploaded'):
+        return None
+    version = (st.session_state.get('data_version'), st.session_state.get('date_range'))
+    if st.session_state.get('lead_customers_version') != version:
+        try:
+            st.session_state.lead_customers = LeadCustomerIndex(st.session_state.data, st.session_state.leads)
+        except KeyError as e:
+            print(f"Error linking leads to customers: {e}")
+            st.session_state.lead_customers = None
+        st.session_state.lead_customers_version = version
+    return st.session_state.lead_customers
+
+def sync_leads(leads):
+    """Replace the session's leads, re-indexing only the leads that changed."""
+    indexes = [st.session_state.get(name) for name in ('lead_index', 'lead_customers')]
+    indexes = [index for index in indexes if index is not None]
+    if indexes:
+        previous = {lead['id']: lead for lead in st.session_state.get('leads', [])}
+        current_ids = set()
+        for lead in leads:
+            current_ids.add(lead['id'])
+            if previous.get(lead['id']) != lead:
+                for index in indexes:
+                    index.update(lead)
+        for lead_id in previous.keys() - current_ids:
+            for index in indexes:
+                index.remove(lead_id)
+    st.session_state.leads = leads
+
 def show_kanban_screen():
     state_manager = StateManager()
     
@@ -29,6 +73,15 @@ def show_kanban_screen():
     
     # Define statuses
     statuses = ["New Lead", "Contacted", "Pitched", "Converted"]
+    lead_index = get_lead_index()
+    lead_customers = get_lead_customers()
+    
+    # Search and filter the board through the lead index
+    search_col1, search_col2 = st.columns([3,1])
+    with search_col1:
+        query = st.text_input("Search leads", key="lead_search", placeholder="Name, email, company...")
+    with search_col2:
+        status_filter = st.selectbox("Status", ["All"] + statuses, key="lead_status_filter")
     
     # Show modal for both new lead and edit lead
     if st.session_state.show_modal:
@@ -37,6 +90,7 @@ def show_kanban_screen():
                 st.subheader("Edit Lead")
                 initial_name = st.session_state.current_lead.get('name', '')
                 initial_email = st.session_state.current_lead.get('email', '')
+                initial_status = st.session_state.current_lead.get('status', statuses[0])
             else:
                 st.subheader("Add New Lead")
                 initial_name = ''
@@ -44,6 +98,8 @@ def show_kanban_screen():
             
             name = st.text_input("Name*", value=initial_name, key="lead_name")
             email = st.text_input("Email*", value=initial_email, key="lead_email")
+            if st.session_state.edit_mode and st.session_state.current_lead:
+                status = st.selectbox("Status", statuses, index=statuses.index(initial_status) if initial_status in statuses else 0, key="lead_status")
             
             col1, col2 = st.columns(2)
             with col1:
@@ -60,10 +116,17 @@ def show_kanban_screen():
                     if st.session_state.edit_mode and st.session_state.current_lead:
                         # Update existing lead
                         lead_id = st.session_state.current_lead['id']
+                        saved = state_manager.record_lead_event('update', lead_id, name=name, email=email)
+                        if saved and status != st.session_state.current_lead.get('status'):
+                            saved = state_manager.record_lead_event('move', lead_id, status=status)
                         for lead in st.session_state.leads:
                             if lead['id'] == lead_id:
                                 lead['name'] = name
                                 lead['email'] = email
+                                lead['status'] = status
+                                lead_index.update(lead)
+                                if lead_customers is not None:
+                                    lead_customers.update(lead)
                         success_msg = "Lead updated successfully!"
                     else:
                         # Create new lead
@@ -73,11 +136,18 @@ def show_kanban_screen():
                             "email": email if email else "No Email",
                             "status": "New Lead"
                         }
+                        saved = state_manager.record_lead_event(
+                            'create', new_lead['id'],
+                            **{key: value for key, value in new_lead.items() if key != 'id'}
+                        )
                         st.session_state.leads.append(new_lead)
+                        lead_index.add(new_lead)
+                        if lead_customers is not None:
+                            lead_customers.update(new_lead)
                         success_msg = "New lead created successfully!"
                     
-                    # Save to file
-                    if state_manager.save_leads(st.session_state.leads):
+                    # Changes are appended to the lead event log
+                    if saved:
                         st.success(success_msg)
                         st.session_state.show_modal = False
                         st.session_state.edit_mode = False
@@ -88,12 +158,26 @@ def show_kanban_screen():
                 else:
                     st.error("Please fill in all required fields")
 
+    # Funnel metrics maintained incrementally by the lead event log
+    with st.expander("Funnel"):
+        st.dataframe(state_manager.load_lead_funnel(), use_container_width=True)
+    
     # Render Kanban board
-    kanban_html = create_kanban_component(st.session_state.leads, statuses)
+    leads = st.session_state.leads
+    if query or status_filter != "All":
+        matching_ids = lead_index.search(query, status=None if status_filter == "All" else status_filter)
+        leads = lead_index.get_leads(matching_ids)
+        st.caption(f"{len(leads)} of {len(st.session_state.leads)} leads match")
+    kanban_html = create_kanban_component(leads, statuses, lead_customers)
     st.components.v1.html(kanban_html, height=700, scrolling=False)
 
-def create_kanban_component(leads, statuses):
-    """Create the HTML/JS component for the Kanban board."""
+def create_kanban_component(leads, statuses, lead_customers=None):
+    """
+    Create the HTML/JS component for the Kanban board.
+
+    Leads linked to a paying customer show the customer's lifetime value,
+    read from the join index without scanning the payments.
+    """
     with open('styles/custom_styles.css', 'r') as css_file:
         custom_css = css_file.read()
 
@@ -120,6 +204,7 @@ def create_kanban_component(leads, statuses):
                 </div>
                 <h4>{lead['name']}</h4>
                 <p>{lead['email']}</p>
+                {customer_badge(lead_customers, lead['id'])}
             </div>
             """
         
@@ -156,6 +241,14 @@ def create_kanban_component(leads, statuses):
 
     return board_html
 
+def customer_badge(lead_customers, lead_id):
+    """Card line with the LTV of the customer a lead converted into, if any."""
+    customer = lead_customers.customer(lead_id) if lead_customers is not None else None
+    if customer is None:
+        return ""
+    return (f'<p class="card-ltv">LTV R$ {customer["ltv"]:,.2f} · '
+            f'{customer["payments"]} payments</p>')
+
 def handle_component_events():
     """Handle component events from JavaScript."""
     if 'edit_lead' in st.session_state:
@@ -170,8 +263,11 @@ def handle_component_events():
     if 'delete_lead' in st.session_state:
         lead_id = st.session_state.delete_lead
         st.session_state.leads = [lead for lead in st.session_state.leads if lead['id'] != lead_id]
+        get_lead_index().remove(lead_id)
+        if st.session_state.get('lead_customers') is not None:
+            st.session_state.lead_customers.remove(lead_id)
         state_manager = StateManager()
-        if state_manager.save_leads(st.session_state.leads):
+        if state_manager.record_lead_event('delete', lead_id):
             st.success("Lead deleted successfully!")
         else:
             st.error("Failed to delete lead. Please try again.")
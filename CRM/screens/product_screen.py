@@ -3,28 +3,8 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objs as go
 import numpy as np
-
-# Import the existing analysis functions from your previous implementation
-from utils.data_processing import (
-    calculate_customer_lifetime, 
-    calculate_lifetime_value, 
-    find_top_months, 
-    find_cancellation_months
-)
-
-def process_customer_data(df):
-    """
-    Process customer data and return comprehensive analytics.
-    :param df: DataFrame with customer payment data
-    :return: Dictionary containing all analytics
-    """
-    results = {
-        'customer_lifetime': calculate_customer_lifetime(df, 'Nome', 'Data de confirmação'),
-        'lifetime_value': calculate_lifetime_value(df, 'Nome', 'Valor'),
-        'top_months': find_top_months(df, 'Data de confirmação'),
-        'cancellation_months': find_cancellation_months(df, 'Nome', 'Data de confirmação')
-    }
-    return results
+from utils.charting import histogram_chart, box_chart
+from screens.analytics_views import load_sketches, load_view, render_analysis
 
 def product_screen():
     st.header("Product and Customer Analysis")
@@ -40,29 +20,39 @@ def product_screen():
     # Print available columns for debugging
     # st.write("Available columns:", list(data.columns))
     
+    # Sketched metrics are read from the sketches built at upload, without computing any table
+    sketches = None
+    if st.checkbox("Approximate metrics", help="Read distinct customers, enrollment trends and lifetime/LTV "
+                   "percentiles from the sketches built at upload instead of computing the full tables."):
+        sketches = load_sketches()
+        if sketches is None:
+            st.info("Approximate metrics cover the full history of the latest upload; "
+                    "showing exact metrics.")
+    
     # Tabs for different analyses
-    tab1, tab2, tab3, tab4 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5 = st.tabs([
         "Customer Lifetime", 
         "Lifetime Value", 
         "Enrollment Trends", 
-        "Cancellation Analysis"
+        "Cancellation Analysis",
+        "RFM Segments"
     ])
     
     with tab1:
         try:
-            show_customer_lifetime(data)
+            show_customer_lifetime(data, sketches)
         except Exception as e:
             st.error(f"Error in Customer Lifetime analysis: {e}")
     
     with tab2:
         try:
-            show_lifetime_value(data)
+            show_lifetime_value(data, sketches)
         except Exception as e:
             st.error(f"Error in Lifetime Value analysis: {e}")
     
     with tab3:
         try:
-            show_enrollment_trends(data)
+            show_enrollment_trends(data, sketches)
         except Exception as e:
             st.error(f"Error in Enrollment Trends analysis: {e}")
     
@@ -71,46 +61,108 @@ def product_screen():
             show_cancellation_analysis(data)
         except Exception as e:
             st.error(f"Error in Cancellation Analysis: {e}")
+    
+    with tab5:
+        try:
+            show_rfm_segments(data)
+        except Exception as e:
+            st.error(f"Error in RFM Segments analysis: {e}")
 
 
-def show_customer_lifetime(data):
-    """Display customer lifetime metrics."""
+PERCENTILES = [10, 25, 50, 75, 90, 99]
+
+def percentile_table(sketch, column):
+    """Percentiles of a quantile sketch as a table."""
+    return pd.DataFrame({
+        'percentile': [f"p{p}" for p in PERCENTILES],
+        column: [sketch.quantile(p / 100) for p in PERCENTILES]
+    })
+
+def show_customer_lifetime(data, sketches=None):
+    """Display customer lifetime metrics, from the sketches alone when given."""
     st.subheader("Customer Lifetime Analysis")
     
-    lifetime = calculate_customer_lifetime(data, 'Nome', 'Data de confirmação')
+    if sketches and 'customer_lifetime_months' in sketches:
+        show_approximate_lifetime(data, sketches)
+        return
+    
+    result = render_analysis(load_view, 'customer_lifetime', data,
+                             empty_message="No customer lifetime data found.")
+    if result is None:
+        return
+    lifetime = result.table
     
     # Visualize distribution of customer lifetimes
-    fig = px.histogram(
-        lifetime.reset_index(), 
-        x='customer_lifetime_months', 
+    fig = histogram_chart(
+        lifetime['customer_lifetime_months'],
         title='Distribution of Customer Lifetimes',
-        labels={'customer_lifetime_months': 'Lifetime (Months)'}
+        x_label='Lifetime (Months)'
     )
     st.plotly_chart(fig)
     
     # Key statistics
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
         st.metric("Average Lifetime", f"{lifetime['customer_lifetime_months'].mean():.1f} months")
     with col2:
         st.metric("Median Lifetime", f"{lifetime['customer_lifetime_months'].median():.1f} months")
     with col3:
         st.metric("Max Lifetime", f"{lifetime['customer_lifetime_months'].max():.1f} months")
+    with col4:
+        show_distinct_customers(data)
     
     # Detailed customer lifetime table
     st.dataframe(lifetime)
 
-def show_lifetime_value(data):
-    """Display lifetime value metrics."""
+def show_approximate_lifetime(data, sketches):
+    """Display customer lifetime metrics read from the sketches."""
+    sketch = sketches['customer_lifetime_months']
+    error = sketch.relative_accuracy
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Average Lifetime", f"{sketch.mean:.1f} months")
+    with col2:
+        st.metric("Median Lifetime", f"{sketch.quantile(0.5):.1f} months", help=f"Within ±{error:.0%} of the exact median")
+    with col3:
+        st.metric("90th Percentile", f"{sketch.quantile(0.9):.1f} months", help=f"Within ±{error:.0%} of the exact percentile")
+    with col4:
+        show_distinct_customers(data, sketches)
+    st.caption(f"Approximate: percentiles within ±{error:.0%} of the exact values, "
+               f"distinct customers within ±{2 * sketches['customers'].relative_error:.1%} "
+               f"(95% of estimates); the average is exact.")
+    
+    st.dataframe(percentile_table(sketch, 'customer_lifetime_months').style.format({'customer_lifetime_months': '{:.1f}'}),
+                 use_container_width=True)
+    st.caption("Uncheck Approximate metrics for the lifetime of each customer.")
+
+def show_distinct_customers(data, sketches=None):
+    """Display the number of distinct customers, estimated from the sketches when given."""
+    if sketches:
+        customers = sketches['customers']
+        st.metric("Distinct Customers", f"≈ {customers.count():,.0f}",
+                  help=f"Within ±{2 * customers.relative_error:.1%} for 95% of estimates")
+    elif 'customer_key' in data.columns:
+        st.metric("Distinct Customers", f"{data['customer_key'].nunique():,}")
+
+def show_lifetime_value(data, sketches=None):
+    """Display lifetime value metrics, from the sketches alone when given."""
     st.subheader("Lifetime Value (LTV) Analysis")
     
-    ltv_data = calculate_lifetime_value(data, 'Nome', 'Valor')
+    if sketches and 'total_value' in sketches:
+        show_approximate_lifetime_value(sketches['total_value'])
+        return
+    
+    result = render_analysis(load_view, 'lifetime_value', data,
+                             empty_message="No lifetime value data found.")
+    if result is None:
+        return
+    ltv_data = result.table
     
     # Visualize LTV distribution
-    fig = px.box(
-        ltv_data.reset_index(), 
-        x='total_value', 
-        title='Distribution of Customer Lifetime Values'
+    fig = box_chart(
+        ltv_data['total_value'],
+        title='Distribution of Customer Lifetime Values',
+        x_label='total_value'
     )
     st.plotly_chart(fig)
     
@@ -127,19 +179,90 @@ def show_lifetime_value(data):
     st.subheader("Top 10 Customers by Lifetime Value")
     st.dataframe(ltv_data.nlargest(10, 'total_value'))
 
+def show_approximate_lifetime_value(sketch):
+    """Display lifetime value metrics read from the LTV sketch."""
+    error = sketch.relative_accuracy
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Total LTV", f"R$ {sketch.sum:,.2f}")
+    with col2:
+        st.metric("Average LTV", f"R$ {sketch.mean:,.2f}")
+    with col3:
+        st.metric("Median LTV", f"R$ {sketch.quantile(0.5):,.2f}", help=f"Within ±{error:.0%} of the exact median")
+    st.caption(f"Approximate: percentiles within ±{error:.0%} of the exact values; total and average are exact.")
+    
+    st.dataframe(percentile_table(sketch, 'total_value').style.format({'total_value': 'R$ {:,.2f}'}),
+                 use_container_width=True)
+    st.caption("Uncheck Approximate metrics for the top customers by lifetime value.")
+
+def show_rfm_segments(data):
+    """Display recency, frequency and monetary segments."""
+    st.subheader("RFM Segmentation")
+    
+    result = render_analysis(load_view, 'rfm_segments', data,
+                             empty_message="No RFM segment data found.")
+    if result is None:
+        return
+    rfm = result.table
+    segments = result.segments()
+    
+    # Segment sizes next to their share of the revenue
+    fig = go.Figure(data=[
+        go.Bar(name='Customers', x=segments.index, y=segments['customer_share'] * 100),
+        go.Bar(name='Revenue', x=segments.index, y=segments['revenue_share'] * 100)
+    ])
+    fig.update_layout(
+        title='Share of Customers and Revenue by Segment',
+        xaxis_title='Segment',
+        yaxis_title='Share (%)',
+        barmode='group'
+    )
+    st.plotly_chart(fig)
+    
+    # Key RFM statistics
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Customers Scored", f"{len(rfm):,}")
+    with col2:
+        st.metric("Median Recency", f"{rfm['recency_days'].median():.0f} days")
+    with col3:
+        champions = segments['revenue_share'].get('Champions', 0.0)
+        st.metric("Champions' Revenue Share", f"{champions:.1%}")
+    
+    st.dataframe(segments.style.format({
+        'customer_share': '{:.1%}',
+        'revenue': 'R$ {:,.2f}',
+        'revenue_share': '{:.1%}',
+        'recency_days': '{:.0f}',
+        'frequency': '{:.1f}'
+    }), use_container_width=True)
+    
+    # Customers of one segment
+    segment = st.selectbox("Customers in segment", segments.index)
+    st.dataframe(rfm[rfm['segment'] == segment])
+
 # In screens/product_screen.py
 
-def show_enrollment_trends(data):
-    """Display enrollment trends over time as a bar chart."""
+def show_enrollment_trends(data, sketches=None):
+    """Display enrollment trends over time as a bar chart, estimated from the sketches when given."""
     st.subheader("Enrollment Trends Analysis")
     
     try:
-        # Get enrollment trends using 'Data de confirmação'
-        enrollment_trends, total_years = find_top_months(data, 'Data de confirmação')
-        
-        if enrollment_trends.empty:
-            st.warning("No enrollment trend data found.")
-            return
+        if sketches:
+            # New clients of each month estimated from the per-month customer sketches
+            result = sketches['top_months']
+            if result.empty:
+                st.warning("No enrollment trend data found.")
+                return
+            st.caption(f"Approximate: each month's new clients are within about "
+                       f"±{2 * sketches['customers'].relative_error:.1%} of the customers seen up to that month.")
+        else:
+            # Get enrollment trends using 'Data de confirmação'
+            result = render_analysis(load_view, 'top_months', data,
+                                     empty_message="No enrollment trend data found.")
+            if result is None:
+                return
+        enrollment_trends, total_years = result.counts, result.total_years
         
         # Create a bar chart to visualize the number of enrollments per month
         fig = go.Figure(data=go.Bar(
@@ -186,11 +309,11 @@ def show_cancellation_analysis(data):
     
     try:
         # Get cancellation trends using default parameters
-        cancellation_trends, total_years = find_cancellation_months(data)
-        
-        if cancellation_trends.empty:
-            st.warning("No cancellation trend data found.")
+        result = render_analysis(load_view, 'cancellation_months', data,
+                                 empty_message="No cancellation trend data found.")
+        if result is None:
             return
+        cancellation_trends, total_years = result.counts, result.total_years
         
         # Create a bar chart to visualize the number of cancellations per month
         fig = go.Figure(data=go.Bar(
@@ -233,7 +356,8 @@ def show_cancellation_analysis(data):
         
         # Rerun analysis with selected gap if different from default
         if gap_months != 3:
-            cancellation_trends, total_years = find_cancellation_months(data, gap_months=gap_months)
+            result = load_view('cancellation_months', data, gap_months=gap_months)
+            cancellation_trends, total_years = result.counts, result.total_years
             
             # Update chart with new data
             fig = go.Figure(data=go.Bar(
@@ -1,5 +1,5 @@
 import streamlit as st
-from utils.data_processing import load_and_preprocess_data
+from utils.analytics import AnalysisError, load_and_preprocess_data
 from utils.state_manager import StateManager
 
 def upload_file_screen():
@@ -7,17 +7,73 @@ def upload_file_screen():
     
     st.header("Upload your financial data file")
     
-    # Check if there's existing data
-    existing_data = state_manager.load_uploaded_data()
-    if existing_data is not None:
+    # Existing data is loaded by main whenever its version changes
+    if st.session_state.get('uploaded'):
         st.success("Previous data loaded successfully!")
-        st.session_state.data = existing_data
-        st.session_state.uploaded = True
     
     uploaded_file = st.file_uploader("Choose a file", type=["csv", "xlsx"])
     if uploaded_file is not None:
-        data = load_and_preprocess_data(uploaded_file)
-        state_manager.save_uploaded_data(data)
-        st.session_state.data = data
-        st.session_state.uploaded = True
-        st.success("File uploaded and saved successfully!")
\ No newline at end of file
+        # The uploader keeps its file across reruns; ingest and save it only once
+        if st.session_state.get('uploaded_file_id') != uploaded_file.file_id:
+            ingest_report = {}
+            try:
+                data = load_and_preprocess_data(uploaded_file, ingest_report)
+            except AnalysisError as e:
+                st.error(str(e))
+                return
+            try:
+                version = state_manager.save_uploaded_data(data)
+            except Exception as e:
+                st.error(f"The file was read but could not be saved: {e}")
+                return
+            st.session_state.data = data
+            st.session_state.uploaded = True
+            st.session_state.data_version = version
+            st.session_state.date_range = None
+            st.session_state.uploaded_file_id = uploaded_file.file_id
+            st.session_state.ingest_report = ingest_report
+        ingest_report = st.session_state.ingest_report
+        st.success("File uploaded and saved successfully!")
+        show_throughput(ingest_report.get('throughput'))
+        show_date_report(ingest_report.get('dates', {}))
+        show_memory_report(ingest_report.get('memory'))
+
+def show_throughput(throughput):
+    """Display how fast the file was ingested."""
+    if not throughput or not throughput['rows_per_second']:
+        return
+    st.caption(
+        f"Ingested {throughput['rows']:,} rows in {throughput['seconds']:.1f}s "
+        f"({throughput['rows_per_second']:,.0f} rows/s, {throughput['chunks']} chunks; "
+        f"reading took {throughput['read_seconds']:.1f}s)."
+    )
+
+def show_date_report(reports):
+    """Display the detected format of each date column and how many values failed to parse."""
+    for column, report in reports.items():
+        if report['coerced']:
+            st.warning(f"{report['coerced']} values in '{column}' could not be parsed as {report['format']} and were left empty.")
+        else:
+            st.caption(f"'{column}' parsed as {report['format']} ({report['unique']} distinct values).")
+
+def show_memory_report(report):
+    """Display the memory used by the loaded dataset before and after dtype planning."""
+    if report is None:
+        return
+    
+    total = report.loc['total']
+    st.subheader("Memory Usage")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Before", f"{total['before_mb']:.1f} MB")
+    with col2:
+        st.metric("After", f"{total['after_mb']:.1f} MB")
+    with col3:
+        st.metric("Reduction", f"{total['reduction']:.1f}x")
+    
+    for column, error in report['error'].items():
+        if error:
+            st.warning(f"Column '{column}' kept its original dtype. {error}")
+    
+    with st.expander("Memory by column"):
+        st.dataframe(report, use_container_width=True)
\ No newline at end of file
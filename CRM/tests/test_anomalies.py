@@ -0,0 +1,82 @@
+"""
+Tests of the revenue and payment drop detection.
+
+Run from the CRM directory:
+
+    python -m unittest discover -s tests -t .
+"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.analytics import revenue_anomalies
+from utils.analytics.anomalies import detect_drops
+from utils.customer_keys import CUSTOMER_KEY_COLUMN, build_customer_keys
+
+
+def payments():
+    """Two years of monthly payments: steady, varying and one steady subscription that drops."""
+    rng = np.random.default_rng(11)
+    months = pd.date_range('2022-01-05', periods=24, freq='MS') + pd.Timedelta(days=4)
+    rows = []
+    for month, date in enumerate(months):
+        rows.append(('Ana Souza', date, 197.0))
+        rows.append(('Bruno Lima', date, round(float(rng.normal(300, 40)), 2)))
+        rows.append(('Carla Dias', date, 197.0 if month < 20 else 49.9))
+    data = pd.DataFrame(rows, columns=['Nome', 'Data de confirmação', 'Valor'])
+    data = data.sort_values('Data de confirmação', kind='stable', ignore_index=True)
+    data[CUSTOMER_KEY_COLUMN] = build_customer_keys(data, 'Nome')
+    return data
+
+
+class DetectDropsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.times = np.arange(9).astype('datetime64[D]').astype('datetime64[ns]')
+        self.values = np.array([197.0] * 8 + [49.9])
+
+    def test_drop_after_a_constant_history(self):
+        positions, baseline, z, *_ = detect_drops(np.zeros(9, dtype=np.int64), self.values, self.times)
+        self.assertEqual(positions.tolist(), [8])
+        self.assertAlmostEqual(baseline[0], 197.0)
+        self.assertLess(z[0], -3)
+        self.assertTrue(np.isfinite(z[0]) and z[0] > -1000)
+
+    def test_other_series_in_the_same_call_do_not_change_the_result(self):
+        alone = detect_drops(np.zeros(9, dtype=np.int64), self.values, self.times)
+        groups = np.repeat([0, 1], [5, 9])
+        values = np.concatenate(([100.0, 120.0, 90.0, 110.0, 130.0], self.values))
+        times = np.concatenate((self.times[:5], self.times))
+        together = detect_drops(groups, values, times)
+        self.assertEqual((together[0] - 5).tolist(), alone[0].tolist())
+        np.testing.assert_allclose(together[2], alone[2])
+
+
+class RevenueAnomaliesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data = payments()
+
+    def flags(self, result):
+        return sorted(zip(result.customers[CUSTOMER_KEY_COLUMN].tolist(), result.customers['date'].tolist()))
+
+    def test_steady_subscription_drop_is_flagged(self):
+        result = revenue_anomalies(self.data)
+        flagged = result.customers[result.customers['name'] == 'Carla Dias']
+        self.assertEqual(flagged['date'].tolist(), [self.data['Data de confirmação'][self.data['Valor'] == 49.9].min()])
+        self.assertNotIn('Ana Souza', result.customers['name'].tolist())
+
+    def test_incremental_run_equals_a_full_run(self):
+        earlier = self.data[self.data['Data de confirmação'] < '2023-10-01']
+        previous = revenue_anomalies(earlier)
+        continued = revenue_anomalies(self.data, previous.state)
+        full = revenue_anomalies(self.data)
+
+        self.assertGreater(continued.sources['continued'], 0)
+        self.assertEqual(self.flags(continued), self.flags(full))
+        self.assertEqual(sorted(continued.table['period_end']), sorted(full.table['period_end']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,231 @@
+"""
+Tests of the local JSON API against the fixture payment export.
+
+Run from the CRM directory:
+
+    python -m unittest discover -s tests -t .
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import date
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'payments.csv')
+
+LEADS = [
+    {'id': 'lead-1', 'name': 'Ana Souza', 'email': 'ana.souza@example.com', 'company': 'Acme', 'status': 'New', 'source': 'Website'},
+    {'id': 'lead-2', 'name': 'Igor Prado', 'email': 'igor@example.com', 'company': 'Initech', 'status': 'Contacted', 'source': 'Referral'},
+    {'id': 'lead-3', 'name': 'Julia Acme', 'email': 'julia@acme.com', 'company': 'Acme', 'status': 'Contacted', 'source': 'Website'}
+]
+
+
+def ingest_fixture():
+    from utils.analytics import load_and_preprocess_data
+
+    with open(FIXTURE, 'rb') as f:
+        return load_and_preprocess_data(f)
+
+
+class APIServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.mkdtemp(prefix='crm-api-test-')
+        cls.previous_data_dir = os.environ.get('CRM_DATA_DIR')
+        os.environ['CRM_DATA_DIR'] = cls.data_dir
+
+        from api_server import make_server
+        from utils.state_manager import StateManager
+
+        cls.state_manager = StateManager()
+        cls.data = ingest_fixture()
+        cls.state_manager.save_uploaded_data(cls.data)
+        cls.state_manager.save_leads(LEADS)
+
+        cls.server = make_server(port=0, workers=2, backlog=2, quiet=True)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        if cls.previous_data_dir is None:
+            os.environ.pop('CRM_DATA_DIR', None)
+        else:
+            os.environ['CRM_DATA_DIR'] = cls.previous_data_dir
+        shutil.rmtree(cls.data_dir, ignore_errors=True)
+
+    def get(self, path, headers=None):
+        """Return (status, headers, decoded JSON body or None)."""
+        try:
+            with urlopen(Request(self.base_url + path, headers=headers or {}), timeout=30) as response:
+                return response.status, response.headers, json.loads(response.read())
+        except HTTPError as e:
+            body = e.read()
+            return e.code, e.headers, json.loads(body) if body else None
+
+    def test_health_and_versions(self):
+        status, _, body = self.get('/health')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {'status': 'ok'})
+
+        status, _, body = self.get('/version')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['dataset_version'], self.state_manager.uploaded_data_version())
+        self.assertEqual(body['lead_version'], self.state_manager.leads_version())
+
+    def test_lists_analyses(self):
+        from utils.analytics import ANALYSES
+
+        status, _, body = self.get('/analytics')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['analyses'], list(ANALYSES))
+
+    def test_lifetime_value_matches_the_analysis(self):
+        from utils.analytics import lifetime_value
+
+        status, _, body = self.get('/analytics/lifetime_value')
+        self.assertEqual(status, 200)
+        expected = lifetime_value(self.data, 'Nome', 'Valor').table
+        self.assertEqual(len(body['rows']), len(expected))
+        totals = {row['nome']: row['total_value'] for row in body['rows']}
+        for name, total in expected['total_value'].items():
+            self.assertAlmostEqual(totals[name], total, places=6)
+        self.assertEqual(body['diagnostics']['rows'], len(self.data))
+
+    def test_date_range_limits_the_payments(self):
+        status, _, everything = self.get('/analytics/monthly_revenue')
+        self.assertEqual(status, 200)
+        status, _, body = self.get('/analytics/monthly_revenue?start=2023-03-01&end=2023-05-31')
+        self.assertEqual(status, 200)
+        months = [row['month'][:7] for row in body['rows']]
+        self.assertEqual(months, ['2023-03', '2023-04', '2023-05'])
+        self.assertLess(len(body['rows']), len(everything['rows']))
+        self.assertEqual(body['start'], '2023-03-01')
+
+    def test_customer_filter_on_per_customer_analysis(self):
+        status, _, body = self.get('/analytics/rfm_segments?customer=carla%20dias')
+        self.assertEqual(status, 200)
+        self.assertEqual([row['nome'] for row in body['rows']], ['Carla Dias'])
+
+        status, _, body = self.get('/analytics/lifetime_value?customer=Hugo.Costa@Example.com')
+        self.assertEqual(status, 200)
+        self.assertEqual([row['nome'] for row in body['rows']], ['Hugo Costa'])
+
+    def test_customer_filter_on_a_shared_name(self):
+        # Two customers are called Ana Souza; the email picks one of them
+        for name in ('customer_lifetime', 'lifetime_value', 'rfm_segments'):
+            status, _, body = self.get(f'/analytics/{name}?customer=ana.souza@example.org')
+            self.assertEqual(status, 200)
+            self.assertEqual(len(body['rows']), 1, name)
+            self.assertTrue(body['rows'][0]['nome'].startswith('Ana Souza'))
+
+        status, _, body = self.get('/analytics/customer_lifetime?customer=ana.souza@example.org')
+        self.assertAlmostEqual(body['rows'][0]['customer_lifetime_months'], round(62 / 30, 1))
+
+        status, _, body = self.get('/analytics/lifetime_value?customer=Ana%20Souza')
+        self.assertEqual(len(body['rows']), 2)
+        self.assertEqual(len({row['nome'] for row in body['rows']}), 2)
+
+    def test_customer_filter_on_monthly_analysis(self):
+        status, _, body = self.get('/analytics/monthly_revenue?customer=Ana%20Souza')
+        self.assertEqual(status, 200)
+        payments = self.data[self.data['nome'] == 'Ana Souza']
+        self.assertAlmostEqual(sum(row['valor'] for row in body['rows']), payments['valor'].sum())
+
+    def test_etag_revalidation(self):
+        status, headers, _ = self.get('/analytics/top_months')
+        self.assertEqual(status, 200)
+        etag = headers['ETag']
+        self.assertIn(f"d{self.state_manager.uploaded_data_version()}", etag)
+
+        status, headers, body = self.get('/analytics/top_months', {'If-None-Match': etag})
+        self.assertEqual(status, 304)
+        self.assertIsNone(body)
+
+        # Different parameters are a different resource
+        status, headers, _ = self.get('/analytics/top_months?start=2023-06-01')
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers['ETag'], etag)
+
+    def test_next_day_changes_the_etag_of_dated_analyses(self):
+        status, headers, _ = self.get('/analytics/cancellation_months')
+        self.assertEqual(status, 200)
+        etag = headers['ETag']
+        self.assertIn(date.today().isoformat(), etag)
+
+        with mock.patch('api_server.date') as next_day:
+            next_day.today.return_value = date.fromordinal(date.today().toordinal() + 1)
+            status, headers, _ = self.get('/analytics/cancellation_months', {'If-None-Match': etag})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers['ETag'], etag)
+
+    def test_new_upload_changes_the_etag(self):
+        status, headers, _ = self.get('/analytics/customer_lifetime')
+        self.assertEqual(status, 200)
+        etag = headers['ETag']
+
+        self.state_manager.save_uploaded_data(self.data.iloc[:60])
+        status, headers, body = self.get('/analytics/customer_lifetime', {'If-None-Match': etag})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers['ETag'], etag)
+        self.assertEqual(body['diagnostics']['rows'], 60)
+
+        # Restore the full fixture for the other tests
+        self.state_manager.save_uploaded_data(self.data)
+
+    def test_errors(self):
+        status, _, body = self.get('/analytics/unknown')
+        self.assertEqual(status, 404)
+        self.assertIn('Unknown analysis', body['error'])
+
+        status, _, body = self.get('/analytics/monthly_revenue?start=03/2023')
+        self.assertEqual(status, 400)
+
+        status, _, body = self.get('/analytics/cancellation_months?gap_months=0')
+        self.assertEqual(status, 400)
+
+        status, _, body = self.get('/nowhere')
+        self.assertEqual(status, 404)
+
+    def test_lead_search(self):
+        status, headers, body = self.get('/leads?q=acme')
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(lead['id'] for lead in body['leads']), ['lead-1', 'lead-3'])
+        self.assertIn(f"l{self.state_manager.leads_version()}", headers['ETag'])
+
+        status, _, body = self.get('/leads?q=acme&status=Contacted')
+        self.assertEqual([lead['id'] for lead in body['leads']], ['lead-3'])
+
+        status, _, body = self.get('/leads/funnel')
+        self.assertEqual(status, 200)
+        self.assertIsInstance(body['funnel'], list)
+
+    def test_busy_server_answers_503(self):
+        # Occupy every worker and backlog slot
+        slots = self.server.slots
+        taken = 0
+        while slots.acquire(blocking=False):
+            taken += 1
+        try:
+            status, headers, body = self.get('/health')
+            self.assertEqual(status, 503)
+            self.assertEqual(headers['Retry-After'], '1')
+        finally:
+            for _ in range(taken):
+                slots.release()
+
+        status, _, _ = self.get('/health')
+        self.assertEqual(status, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Tests of the lead event log shared by several readers.
+
+Run from the CRM directory:
+
+    python -m unittest discover -s tests -t .
+"""
+import shutil
+import tempfile
+import unittest
+
+from utils.lead_events import LeadEventLog
+
+
+class LeadEventLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix='crm-leads-test-')
+        self.writer = LeadEventLog(self.data_dir, compact_every=10 ** 6).load()
+        self.reader = LeadEventLog(self.data_dir).load()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def create(self, prefix, count):
+        for i in range(count):
+            self.writer.append('create', f'{prefix}{i}', name=f'Lead {prefix}{i}', status='New Lead')
+
+    def test_refresh_reads_only_new_events(self):
+        self.create('a', 5)
+        self.reader.refresh()
+        self.assertEqual(len(self.reader.leads), 5)
+        self.create('b', 3)
+        self.reader.refresh()
+        self.assertEqual(sorted(self.reader.leads), sorted(self.writer.leads))
+
+    def test_offset_from_before_a_compaction_is_not_reused(self):
+        self.create('a', 20)
+        self.reader.refresh()
+        self.writer.compact()
+        # The new tail grows past the reader's old offset
+        self.create('b', 40)
+        # Even if the snapshot stamp looks unchanged, the log generation is not
+        self.reader.snapshot_stamp = self.reader._snapshot_stamp()
+        self.reader.refresh()
+        self.assertEqual(len(self.reader.leads), 60)
+        self.assertEqual(self.reader.generation, self.writer.generation)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Tests of the distinct-count and quantile sketches behind the approximate metrics.
+
+Run from the CRM directory:
+
+    python -m unittest discover -s tests -t .
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.analytics import HyperLogLog, QuantileSketch, customer_lifetime, lifetime_value, top_months
+from utils.metric_sketches import MetricSketches
+from utils.partitioned_store import PartitionedDataset
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'payments.csv')
+
+
+def ingest_fixture():
+    from utils.analytics import load_and_preprocess_data
+
+    with open(FIXTURE, 'rb') as f:
+        return load_and_preprocess_data(f)
+
+
+class HyperLogLogTest(unittest.TestCase):
+
+    def test_count_within_the_error_bound(self):
+        for n in (50, 3000, 100000):
+            sketch = HyperLogLog().update(np.arange(n).astype(str))
+            self.assertLess(abs(sketch.count() - n) / n, 3 * sketch.relative_error)
+
+    def test_merge_counts_the_union(self):
+        values = np.arange(20000).astype(str)
+        left = HyperLogLog().update(values[:12000])
+        right = HyperLogLog().update(values[8000:])
+        whole = HyperLogLog().update(values)
+        self.assertTrue(np.array_equal(left.merge(right).registers, whole.registers))
+
+    def test_duplicates_and_missing_values_are_ignored(self):
+        once = HyperLogLog().update(['a', 'b', 'c'])
+        twice = HyperLogLog().update(['a', 'b', 'c', 'a', None, 'b'])
+        self.assertEqual(once.count(), twice.count())
+
+    def test_round_trip(self):
+        sketch = HyperLogLog().update(np.arange(500).astype(str))
+        restored = HyperLogLog.from_dict(json.loads(json.dumps(sketch.to_dict())))
+        self.assertEqual(restored.count(), sketch.count())
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.values = np.random.default_rng(7).lognormal(5, 2, 20000)
+
+    def test_quantiles_within_the_relative_accuracy(self):
+        sketch = QuantileSketch.from_values(self.values)
+        ordered = np.sort(self.values)
+        for q in (0, 0.1, 0.5, 0.9, 0.99, 1):
+            exact = ordered[int(np.floor(q * (len(ordered) - 1)))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), sketch.relative_accuracy * exact + 1e-9)
+
+    def test_merge_equals_one_sketch(self):
+        merged = QuantileSketch.from_values(self.values[:5000]).merge(QuantileSketch.from_values(self.values[5000:]))
+        whole = QuantileSketch.from_values(self.values)
+        self.assertEqual(merged.positive, whole.positive)
+        self.assertEqual(merged.count, whole.count)
+        self.assertAlmostEqual(merged.sum, whole.sum, places=6)
+
+    def test_zeros_and_negative_values(self):
+        sketch = QuantileSketch.from_values([-10, -1, 0, 0, np.nan, 5])
+        self.assertEqual(sketch.count, 5)
+        self.assertAlmostEqual(sketch.quantile(0), -10)
+        self.assertEqual(sketch.quantile(0.5), 0)
+        self.assertAlmostEqual(sketch.quantile(1), 5)
+
+    def test_round_trip(self):
+        sketch = QuantileSketch.from_values(self.values)
+        restored = QuantileSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+        self.assertEqual(restored.quantile(0.5), sketch.quantile(0.5))
+        self.assertTrue(np.isnan(QuantileSketch.from_dict(QuantileSketch().to_dict()).quantile(0.5)))
+
+
+
+class MetricSketchesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix='crm-sketches-test-')
+        self.dataset = PartitionedDataset(os.path.join(self.data_dir, 'uploaded_data'))
+        self.sketches = MetricSketches(self.data_dir)
+        self.data = ingest_fixture()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def save(self, data, version):
+        return self.sketches.update(data, self.dataset.write(data, version), version)
+
+    def test_metrics_match_the_exact_analyses(self):
+        self.save(self.data, 1)
+        sketches = self.sketches.load(1)
+
+        self.assertEqual(round(sketches['customers'].count()), self.data['customer_key'].nunique())
+        exact = top_months(self.data)
+        self.assertEqual(sketches['top_months'].counts.tolist(), exact.counts.tolist())
+        self.assertEqual(sketches['top_months'].total_years, exact.total_years)
+
+        for column, table in (('customer_lifetime_months', customer_lifetime(self.data).table),
+                              ('total_value', lifetime_value(self.data).table)):
+            sketch = sketches[column]
+            self.assertEqual(sketch.count, len(table))
+            self.assertAlmostEqual(sketch.sum, table[column].sum(), places=6)
+            median = np.sort(table[column].to_numpy())[(len(table) - 1) // 2]
+            self.assertLessEqual(abs(sketch.quantile(0.5) - median), sketch.relative_accuracy * median + 1e-9)
+
+    def test_only_changed_partitions_are_sketched_again(self):
+        partitions = self.save(self.data, 1)
+        self.assertEqual(self.save(self.data, 2), 0)
+
+        # A payment appended to the latest month changes only that partition
+        appended = self.data.tail(1).copy()
+        appended['valor'] = appended['valor'] + 1
+        self.assertEqual(self.save(pd.concat([self.data, appended], ignore_index=True), 3), 1)
+        self.assertIsNone(self.sketches.load(2))
+        self.assertIsNotNone(self.sketches.load(3))
+        self.assertEqual(len(os.listdir(self.sketches.partitions_dir)), partitions)
+
+
+if __name__ == '__main__':
+    unittest.main()
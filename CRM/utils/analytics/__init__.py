@@ -0,0 +1,35 @@
+"""
+Analytics compute core.
+
+Pure numpy/pandas code with no Streamlit or plotting imports, so worker
+processes, batch jobs and tests can import it cheaply; statsmodels and SciPy
+are only imported inside the analyses that need them. Every analysis returns a
+typed result holding its table and the Diagnostics of the run; data problems
+that stop an analysis raise AnalysisError. Rendering lives in
+screens/analytics_views.py.
+"""
+from utils.analytics.anomalies import revenue_anomalies
+from utils.analytics.columns import find_column, normalize_column_name
+from utils.analytics.customers import customer_lifetime, customer_metrics, enrollment_gaps, lifetime_value
+from utils.analytics.forecast import revenue_forecast
+from utils.analytics.ingest import load_and_preprocess_data, normalize_columns
+from utils.analytics.ranges import within_date_range
+from utils.analytics.report import ANALYSES, DATED_ANALYSES, customer_report, run_analysis
+from utils.analytics.rfm import rfm_segments
+from utils.analytics.results import (
+    AnalysisError,
+    AnomalyResult,
+    Diagnostics,
+    ForecastResult,
+    GapsResult,
+    LifetimeResult,
+    LifetimeValueResult,
+    MissingColumnError,
+    MonthlyCountsResult,
+    MonthlyRevenueResult,
+    RFMResult,
+    TableResult
+)
+from utils.analytics.sharded import sharded_customer_partials
+from utils.analytics.sketches import HyperLogLog, QuantileSketch, customer_distributions, sketch_top_months
+from utils.analytics.trends import cancellation_months, monthly_revenue, top_months
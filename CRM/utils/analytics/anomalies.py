@@ -0,0 +1,294 @@
+from importlib.util import find_spec
+
+import numpy as np
+import pandas as pd
+
+from utils.analytics.columns import AMOUNT_CANDIDATES, DATE_CANDIDATES, NAME_CANDIDATES, resolve_columns
+from utils.analytics.customers import customer_dates, payment_amounts
+from utils.analytics.forecast import TOTAL, monthly_series
+from utils.analytics.results import AnalysisError, AnomalyResult, Diagnostics, timed
+from utils.customer_keys import CUSTOMER_KEY_COLUMN, customer_labels
+
+# Weight of the newest observation in the exponentially weighted baseline
+ALPHA = 0.2
+
+# An observation is a drop when it is this many standard deviations below its baseline...
+Z_THRESHOLD = 3.0
+
+# ...and at least this fraction below it
+MIN_DROP = 0.15
+
+# Smallest residual spread, as a fraction of the baseline. A history that never
+# varied has no spread, only rounding leftovers that depend on the other series
+# filtered in the same call; below MIN_DROP / Z_THRESHOLD the floor does not
+# change which drops are flagged, it only bounds their z-scores
+MIN_SPREAD = 0.01
+
+# Observations a series needs before its baseline is trusted
+MIN_HISTORY = 6
+
+# Daily revenue is compared as a trailing sum over this many days, which evens out weekdays
+WINDOW_DAYS = 7
+
+# Prefix totals closer than this (in currency) are the same history
+CHECKSUM_TOLERANCE = 0.01
+
+# Filter state kept per series between runs
+STATE_COLUMNS = ['level', 'variance', 'observations', 'checksum', 'last']
+
+PERIOD_COLUMNS = ['series', 'period_start', 'period_end', 'revenue', 'baseline', 'drop', 'z_score']
+CUSTOMER_COLUMNS = [CUSTOMER_KEY_COLUMN, 'name', 'date', 'amount', 'baseline', 'drop', 'z_score']
+
+
+def grouped_ewma(values, starts, init, alpha=ALPHA):
+    """
+    Exponentially weighted average restarted at the start of every group.
+
+    The whole array goes through one scipy.signal.lfilter call. Since the
+    filter is linear, the value carried over from the previous group is then
+    swapped for the group's own initial value with one vectorized correction,
+    instead of filtering each group in a Python loop.
+
+    :param values: float64 observations, grouped contiguously
+    :param starts: Position of the first observation of each group, ascending from 0
+    :param init: Average before the first observation of each group
+    :param alpha: Weight of the newest observation
+    :return: Average after each observation
+    """
+    from scipy.signal import lfilter
+
+    lengths = np.diff(np.append(starts, len(values)))
+    group = np.repeat(np.arange(len(starts)), lengths)
+    offset = np.arange(len(values)) - starts[group]
+    smoothed = lfilter([alpha], [1.0, alpha - 1.0], values)
+    carried = np.where(starts > 0, smoothed[np.maximum(starts - 1, 0)], 0.0)
+    return smoothed + (1 - alpha) ** (offset + 1) * (init - carried)[group]
+
+
+def residual_scores(values, starts, level, variance, alpha=ALPHA):
+    """
+    Baseline and spread of each observation, from the observations before it in its group.
+
+    :param values: float64 observations, grouped contiguously
+    :param starts: Position of the first observation of each group, ascending from 0
+    :param level: Baseline of each group before its first observation
+    :param variance: Variance of the residuals of each group before its first observation
+    :return: Tuple of (baseline, residual standard deviation, level after each
+             observation, variance after each observation)
+    """
+    level_after = grouped_ewma(values, starts, level, alpha)
+    baseline = np.empty(len(values))
+    baseline[1:] = level_after[:-1]
+    baseline[starts] = level
+
+    variance_after = grouped_ewma((values - baseline) ** 2, starts, variance, alpha)
+    prior_variance = np.empty(len(values))
+    prior_variance[1:] = variance_after[:-1]
+    prior_variance[starts] = variance
+    # The restart correction can leave tiny negative variances from rounding
+    return baseline, np.sqrt(np.maximum(prior_variance, 0.0)), level_after, variance_after
+
+
+def detect_drops(groups, values, times, state=None, alpha=ALPHA):
+    """
+    Flag sudden drops in a set of series, continuing from their stored filter state.
+
+    A series continues from its state when its first `observations` values
+    still add up to the stored checksum and end at the stored time, i.e. only
+    observations were appended to it; only the appended observations are then
+    filtered. Any other series is filtered from its first observation.
+
+    :param groups: Series id of each observation, grouped by series in time order
+    :param values: float64 observations
+    :param times: datetime64[ns] time of each observation
+    :param state: DataFrame indexed by series id with STATE_COLUMNS, from a previous run
+    :param alpha: Weight of the newest observation in the baseline
+    :return: Tuple of (positions of the flagged observations, their baselines,
+             their z-scores, new state, ids of the continued series, number of
+             observations filtered)
+    """
+    ids, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+    position = np.arange(len(values)) - np.repeat(starts, counts)
+    running_total = np.concatenate(([0.0], np.cumsum(values)))
+    prefix = running_total[1:] - np.repeat(running_total[starts], counts)
+
+    # New series start at their first observation with no spread
+    done = np.zeros(len(ids), dtype=np.int64)
+    level = values[starts].astype('float64')
+    variance = np.zeros(len(ids))
+    continued = np.zeros(len(ids), dtype=bool)
+    if state is not None and len(state):
+        known = state.reindex(ids)
+        observations = known['observations'].fillna(0).to_numpy(dtype=np.int64)
+        comparable = (observations > 0) & (observations <= counts)
+        last = np.where(comparable, starts + observations - 1, 0)
+        continued = (
+            comparable
+            & (np.abs(prefix[last] - known['checksum'].to_numpy(dtype='float64')) <= CHECKSUM_TOLERANCE)
+            & (times[last] == known['last'].to_numpy(dtype='datetime64[ns]'))
+        )
+        done = np.where(continued, observations, 0)
+        level = np.where(continued, known['level'].to_numpy(dtype='float64'), level)
+        variance = np.where(continued, known['variance'].to_numpy(dtype='float64'), variance)
+
+    new = position >= np.repeat(done, counts)
+    new_counts = counts - done
+    has_new = new_counts > 0
+    new_values = values[new]
+    new_starts = np.concatenate(([0], np.cumsum(new_counts[has_new])[:-1])).astype(np.int64)
+
+    flagged = np.zeros(len(new_values), dtype=bool)
+    baseline = z = np.zeros(len(new_values))
+    if len(new_values):
+        baseline, scale, level_after, variance_after = residual_scores(
+            new_values, new_starts, level[has_new], variance[has_new], alpha
+        )
+        scale = np.maximum(scale, MIN_SPREAD * np.abs(baseline))
+        z = np.divide(new_values - baseline, scale, out=np.zeros(len(new_values)), where=scale > 0)
+        flagged = (position[new] >= MIN_HISTORY) & (z < -Z_THRESHOLD) & (new_values < (1 - MIN_DROP) * baseline)
+
+        ends = new_starts + new_counts[has_new] - 1
+        level[has_new] = level_after[ends]
+        variance[has_new] = variance_after[ends]
+
+    ends = starts + counts - 1
+    new_state = pd.DataFrame({
+        'level': level,
+        'variance': variance,
+        'observations': counts,
+        'checksum': prefix[ends],
+        'last': times[ends]
+    }, index=pd.Index(ids, name='series'))
+    return np.flatnonzero(new)[flagged], baseline[flagged], z[flagged], new_state, ids[continued], len(new_values)
+
+
+def daily_revenue(dates, amounts):
+    """
+    Trailing WINDOW_DAYS-day revenue of every day between the first and last payment.
+
+    :param dates: datetime64[ns] dates of the payments with a valid date
+    :param amounts: float64 amounts aligned with dates (NaN counts as zero)
+    :return: Tuple of (datetime64[ns] days, float64 trailing revenue)
+    """
+    from scipy.signal import lfilter
+
+    days = dates.astype('datetime64[D]')
+    first_day = days.min()
+    offsets = (days - first_day).astype(np.int64)
+    revenue = np.bincount(offsets, weights=np.nan_to_num(amounts), minlength=int(offsets.max()) + 1)
+    index = first_day + np.arange(len(revenue))
+    return index.astype('datetime64[ns]'), lfilter(np.ones(WINDOW_DAYS), [1.0], revenue)
+
+
+def period_flags(name, period_start, period_end, revenue, baseline, z):
+    """Table of the flagged periods of one revenue series."""
+    return pd.DataFrame({
+        'series': name,
+        'period_start': period_start,
+        'period_end': period_end,
+        'revenue': revenue,
+        'baseline': baseline,
+        'drop': 1 - revenue / baseline,
+        'z_score': z
+    }, columns=PERIOD_COLUMNS)
+
+
+def revenue_anomalies(data, state=None, nome_column='Nome', date_column='Data de confirmação', amount_column='Valor'):
+    """
+    Flag sudden drops in daily and monthly revenue and in customers' payment amounts.
+
+    Every observation is compared with an exponentially weighted baseline of
+    the observations before it in its series, and flagged when it falls at
+    least Z_THRESHOLD residual standard deviations and MIN_DROP below it. The
+    series are the trailing WINDOW_DAYS-day revenue, the revenue of each
+    complete month and the payment amounts of each customer; all customers
+    are filtered together (see grouped_ewma). With the state of a previous
+    run, series that only gained observations are continued from where that
+    run stopped, and their earlier flags are kept.
+
+    :param data: DataFrame containing client data
+    :param state: AnomalyResult.state of a previous run, or None
+    :param nome_column: Column name for client names
+    :param date_column: Column name for dates
+    :param amount_column: Column name for transaction amounts
+    :return: AnomalyResult with the flagged periods, newest first
+    """
+    if find_spec('scipy') is None:
+        raise AnalysisError("Anomaly detection requires scipy (pip install scipy).")
+    state = state or {}
+
+    diagnostics = Diagnostics(rows=len(data))
+    with timed(diagnostics):
+        nome_column, date_column, amount_column = resolve_columns(
+            data, diagnostics,
+            name=[nome_column] + NAME_CANDIDATES,
+            date=[date_column] + DATE_CANDIDATES,
+            amount=[amount_column] + AMOUNT_CANDIDATES
+        )
+        rows, keys, dates = customer_dates(data, nome_column, date_column, diagnostics)
+        amounts = payment_amounts(data, amount_column, diagnostics)
+        if not len(rows):
+            diagnostics.warn("No valid data found after processing dates.")
+            return AnomalyResult(pd.DataFrame(columns=PERIOD_COLUMNS), diagnostics,
+                                 customers=pd.DataFrame(columns=CUSTOMER_COLUMNS))
+
+        new_state = {}
+        sources = {'continued': 0, 'computed': 0, 'observations': 0}
+        periods = []
+
+        def run(name, groups, values, times):
+            positions, baseline, z, new_state[name], continued, filtered = detect_drops(groups, values, times, state.get(name))
+            sources['continued'] += len(continued)
+            sources['computed'] += len(new_state[name]) - len(continued)
+            sources['observations'] += filtered
+            return positions, baseline, z, continued
+
+        # Revenue series; payments without a customer still count as revenue
+        dated = ~np.isnat(dates)
+        days, revenue = daily_revenue(dates[dated], amounts[dated])
+        positions, baseline, z, continued = run('daily', np.zeros(len(days), dtype=np.int64), revenue, days)
+        window_end = days[positions]
+        periods.append(period_flags('Daily', window_end - np.timedelta64(WINDOW_DAYS - 1, 'D'), window_end,
+                                    revenue[positions], baseline, z))
+        if len(continued) and 'flagged_periods' in state:
+            periods.append(state['flagged_periods'][state['flagged_periods']['series'] == 'Daily'])
+
+        series, series_diagnostics = monthly_series(data, date_column, amount_column)
+        for warning in series_diagnostics.warnings:
+            if warning not in diagnostics.warnings:
+                diagnostics.warn(warning)
+        if TOTAL in series:
+            months = series[TOTAL].index.to_numpy(dtype='datetime64[ns]')
+            monthly = series[TOTAL].to_numpy(dtype='float64')
+            positions, baseline, z, continued = run('monthly', np.zeros(len(months), dtype=np.int64), monthly, months)
+            month_start = pd.DatetimeIndex(months[positions])
+            periods.append(period_flags('Monthly', month_start, month_start + pd.offsets.MonthEnd(0),
+                                        monthly[positions], baseline, z))
+            if len(continued) and 'flagged_periods' in state:
+                periods.append(state['flagged_periods'][state['flagged_periods']['series'] == 'Monthly'])
+
+        # Payment amounts of each customer, in date order
+        paid = rows[~np.isnan(amounts[rows])]
+        order = paid[np.lexsort((dates[paid], keys[paid]))]
+        positions, baseline, z, continued = run('payments', keys[order].astype(np.int64), amounts[order], dates[order])
+        flagged_rows = order[positions]
+        names = customer_labels(data, keys, nome_column)
+        customers = [pd.DataFrame({
+            CUSTOMER_KEY_COLUMN: keys[flagged_rows],
+            'name': names.reindex(keys[flagged_rows]).to_numpy(),
+            'date': dates[flagged_rows],
+            'amount': amounts[flagged_rows],
+            'baseline': baseline,
+            'drop': 1 - amounts[flagged_rows] / baseline,
+            'z_score': z
+        }, columns=CUSTOMER_COLUMNS)]
+        if len(continued) and 'flagged_customers' in state:
+            kept = state['flagged_customers']
+            customers.append(kept[np.isin(kept[CUSTOMER_KEY_COLUMN].to_numpy(), continued)])
+
+        periods = pd.concat([frame for frame in periods if len(frame)] or periods[:1], ignore_index=True)
+        periods = periods.sort_values('period_end', ascending=False, ignore_index=True)
+        customers = pd.concat([frame for frame in customers if len(frame)] or customers[:1], ignore_index=True)
+        customers = customers.sort_values('date', ascending=False, ignore_index=True)
+        new_state.update(flagged_periods=periods, flagged_customers=customers)
+    return AnomalyResult(periods, diagnostics, customers=customers, state=new_state, sources=sources)
@@ -0,0 +1,56 @@
+from utils.analytics.results import MissingColumnError
+
+# Candidate column names for each role, tried after the caller's own choice
+NAME_CANDIDATES = ['nome', 'name', 'client']
+DATE_CANDIDATES = ['data_de_pagamento', 'Data de confirmação', 'payment_date', 'data_confirmacao']
+AMOUNT_CANDIDATES = ['valor', 'amount', 'value']
+
+
+def normalize_column_name(col):
+    """Lowercase a column name, use underscores for spaces and drop Portuguese accents."""
+    return (str(col).lower()
+            .strip()
+            .replace(' ', '_')
+            .replace('ç', 'c')
+            .replace('ã', 'a')
+            .replace('é', 'e')
+            .replace('í', 'i')
+            .replace('ó', 'o'))
+
+
+def find_column(data, possible_columns):
+    """
+    Find the first matching column name in the DataFrame.
+
+    :param data: DataFrame to search
+    :param possible_columns: List of possible column names to match
+    :return: The first matching column name, or raises MissingColumnError (a KeyError)
+    """
+    column_mapping = {normalize_column_name(col): col for col in data.columns}
+
+    for candidate in possible_columns:
+        normalized_col = normalize_column_name(candidate)
+        if normalized_col in column_mapping:
+            return column_mapping[normalized_col]
+
+    raise MissingColumnError(
+        f"Could not find a column matching any of: {possible_columns}. "
+        f"Available columns: {list(data.columns)}"
+    )
+
+
+def resolve_columns(data, diagnostics, **roles):
+    """
+    Resolve the column used for each role and record the choice on the diagnostics.
+
+    :param data: DataFrame to search
+    :param diagnostics: Diagnostics receiving the resolved columns
+    :param roles: Role name -> list of candidate column names
+    :return: Tuple of resolved column names in the order of roles
+    """
+    resolved = []
+    for role, candidates in roles.items():
+        column = find_column(data, candidates)
+        diagnostics.columns[role] = column
+        resolved.append(column)
+    return tuple(resolved)
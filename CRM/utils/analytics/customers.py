@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+from utils.analytics.columns import AMOUNT_CANDIDATES, DATE_CANDIDATES, NAME_CANDIDATES, resolve_columns
+from utils.analytics.kernels import customer_partials
+from utils.analytics.results import (
+    Diagnostics,
+    GapsResult,
+    LifetimeResult,
+    LifetimeValueResult,
+    timed
+)
+from utils.analytics.sharded import sharded_customer_partials
+from utils.customer_keys import CUSTOMER_KEY_COLUMN, customer_labels, get_customer_keys, unique_labels
+from utils.date_parsing import ensure_datetime
+
+
+def customer_dates(data, nome_column, date_column, diagnostics):
+    """
+    Customer keys and parsed payment dates, recording the rows that cannot be used.
+
+    The input DataFrame is not modified; raw frames get their dates parsed here.
+
+    :param data: DataFrame containing client data
+    :param nome_column: Column name for client names
+    :param date_column: Column name for dates
+    :param diagnostics: Diagnostics receiving rows_used and warnings
+    :return: Tuple of (usable row positions, keys, datetime64[ns] dates), keys and dates
+             aligned with the rows of data
+    """
+    dates = ensure_datetime(data[date_column])
+    keys = get_customer_keys(data, nome_column)
+
+    invalid_dates = int(dates.isna().sum())
+    if invalid_dates:
+        diagnostics.warn(f"{invalid_dates} rows without a valid '{date_column}' were skipped.")
+    no_customer = int((keys < 0).sum())
+    if no_customer:
+        diagnostics.warn(f"{no_customer} rows without a customer identity were skipped.")
+
+    rows = np.flatnonzero((keys >= 0) & dates.notna().to_numpy())
+    diagnostics.rows_used = len(rows)
+    return rows, keys, dates.to_numpy(dtype='datetime64[ns]')
+
+
+def lifetime_frame(data, rows, keys, arrays, nome_column):
+    """
+    Build the lifetime table keyed by customer key from lifetime_arrays output.
+
+    :param data: DataFrame containing client data
+    :param rows: Positions of the rows with a customer and a valid date
+    :param keys: Customer keys aligned with the rows of data
+    :param arrays: Tuple returned by lifetime_arrays
+    :param nome_column: Column name for client names
+    :return: DataFrame indexed by customer key
+    """
+    customer_keys, first_payment, last_payment, total_days, gap_count = arrays
+    return pd.DataFrame({
+        nome_column: customer_labels(data.iloc[rows], keys[rows], nome_column).reindex(customer_keys).to_numpy(),
+        'min': first_payment,
+        'max': last_payment,
+        'customer_lifetime_months': np.round(total_days / 30, 1),
+        'gap_count': gap_count
+    }, index=pd.Index(customer_keys, name=CUSTOMER_KEY_COLUMN))
+
+
+def customer_metrics(keys, dates, amounts=None, jobs=1):
+    """
+    Per-customer partials, computed serially or sharded across worker processes.
+
+    Both paths run the same kernel on the same per-customer row order, so
+    their output is identical.
+
+    :param keys: Customer keys (no -1)
+    :param dates: datetime64[ns] payment dates aligned with keys
+    :param amounts: Optional float64 amounts aligned with keys
+    :param jobs: Worker processes; above 1 the customers are sharded by key
+    :return: Dictionary returned by customer_partials
+    """
+    if jobs > 1:
+        return sharded_customer_partials(keys, dates, amounts, jobs)
+    return customer_partials(keys, dates, amounts)
+
+
+def lifetime_by_key(data, rows, keys, dates, nome_column, jobs=1):
+    """
+    Compute customer lifetime metrics keyed by integer customer key.
+
+    :param data: DataFrame containing client data
+    :param rows: Positions of the rows with a customer and a valid date
+    :param keys: Customer keys aligned with the rows of data
+    :param dates: datetime64[ns] dates aligned with the rows of data
+    :param nome_column: Column name for client names
+    :param jobs: Worker processes used for the per-customer partials
+    :return: DataFrame indexed by customer key
+    """
+    metrics = customer_metrics(keys[rows], dates[rows], jobs=jobs)
+    return lifetime_frame(data, rows, keys, metrics['lifetime'], nome_column)
+
+
+def gaps_frame(data, gap_rows, gap_start, gap_end, months_to_next, nome_column, date_column):
+    """
+    Build the gaps table, one row per gap.
+
+    :param gap_rows: Positions (in data) of the payments that start a gap
+    """
+    return pd.DataFrame({
+        nome_column: data[nome_column].to_numpy()[gap_rows],
+        date_column: gap_start,
+        'gap_end': gap_end,
+        'months_to_next': months_to_next
+    }, index=data.index[gap_rows])
+
+
+def payment_amounts(data, amount_column, diagnostics):
+    """float64 amounts of every row, recording the rows without a numeric amount."""
+    amounts = pd.to_numeric(data[amount_column], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    missing_amounts = int(np.isnan(amounts).sum())
+    if missing_amounts:
+        diagnostics.warn(f"{missing_amounts} rows without a numeric '{amount_column}' were not counted.")
+    return amounts
+
+
+def ltv_frame(data, keys, lifetime, values, nome_column):
+    """
+    Combine lifetime and total value per customer into the LTV table.
+
+    :param lifetime: Lifetime table keyed by customer key
+    :param values: Tuple returned by customer_values
+    """
+    customer_keys, totals = values
+    result = pd.DataFrame({
+        CUSTOMER_KEY_COLUMN: customer_keys,
+        'total_value': totals,
+        'active_months': lifetime['customer_lifetime_months'].reindex(customer_keys).to_numpy(),
+        'gap_count': lifetime['gap_count'].reindex(customer_keys).to_numpy()
+    }, index=pd.Index(unique_labels(customer_labels(data, keys, nome_column)).reindex(customer_keys).to_numpy(), name=nome_column))
+
+    result['monthly_average'] = result['total_value'] / result['active_months'].replace(0, np.nan)
+    return result.sort_values('total_value', ascending=False)
+
+
+def enrollment_gaps(data, nome_column='Nome', date_column='Data de confirmação', jobs=1):
+    """
+    Identify payment gaps of 2+ months.
+
+    :param data: DataFrame containing client data
+    :param nome_column: Column name for client names
+    :param date_column: Column name for dates
+    :param jobs: Worker processes; above 1 the customers are sharded across a process pool
+    :return: GapsResult with one row per gap (name, gap start, gap_end, months_to_next)
+    """
+    diagnostics = Diagnostics(rows=len(data))
+    with timed(diagnostics):
+        nome_column, date_column = resolve_columns(
+            data, diagnostics,
+            name=[nome_column] + NAME_CANDIDATES,
+            date=[date_column] + DATE_CANDIDATES
+        )
+        rows, keys, dates = customer_dates(data, nome_column, date_column, diagnostics)
+        positions, _, gap_start, gap_end, months_to_next = customer_metrics(keys[rows], dates[rows], jobs=jobs)['gaps']
+        gaps = gaps_frame(data, rows[positions], gap_start, gap_end, months_to_next, nome_column, date_column)
+    return GapsResult(gaps, diagnostics)
+
+
+def customer_lifetime(data, nome_column='Nome', date_column='Data de confirmação', jobs=1):
+    """
+    Calculate customer lifetime in months, accounting for enrollment gaps.
+
+    :param data: DataFrame containing client data
+    :param nome_column: Column name for client names
+    :param date_column: Column name for dates
+    :param jobs: Worker processes; above 1 the customers are sharded across a process pool
+    :return: LifetimeResult indexed by customer name, longest lifetimes first
+    """
+    diagnostics = Diagnostics(rows=len(data))
+    with timed(diagnostics):
+        nome_column, date_column = resolve_columns(
+            data, diagnostics,
+            name=[nome_column] + NAME_CANDIDATES,
+            date=[date_column] + DATE_CANDIDATES
+        )
+        rows, keys, dates = customer_dates(data, nome_column, date_column, diagnostics)
+        if not len(rows):
+            diagnostics.warn("No valid data found after processing dates.")
+            return LifetimeResult(pd.DataFrame(), diagnostics)
+
+        lifetime = lifetime_by_key(data, rows, keys, dates, nome_column, jobs)
+        # Names shared by several customers carry their key, as in lifetime_value
+        labels = unique_labels(lifetime.pop(nome_column))
+        lifetime = lifetime.reset_index().set_index(pd.Index(labels.to_numpy(), name=nome_column))
+        lifetime = lifetime.sort_values(by='customer_lifetime_months', ascending=False)
+    return LifetimeResult(lifetime, diagnostics)
+
+
+def lifetime_value(data, nome_column='Nome', amount_column='Valor', date_column=None, jobs=1):
+    """
+    Calculate the Lifetime Value (LTV) as the sum of amounts for each client.
+
+    :param data: DataFrame containing client data
+    :param nome_column: Column name for client names
+    :param amount_column: Column name for transaction amounts
+    :param date_column: Column name for dates, used for the active months (auto-detected if None)
+    :param jobs: Worker processes; above 1 the customers are sharded across a process pool
+    :return: LifetimeValueResult indexed by customer name, highest value first
+    """
+    diagnostics = Diagnostics(rows=len(data))
+    with timed(diagnostics):
+        nome_column, amount_column, date_column = resolve_columns(
+            data, diagnostics,
+            name=[nome_column] + NAME_CANDIDATES,
+            amount=[amount_column] + AMOUNT_CANDIDATES,
+            date=([date_column] if date_column else []) + DATE_CANDIDATES
+        )
+        rows, keys, dates = customer_dates(data, nome_column, date_column, diagnostics)
+        if not len(rows):
+            diagnostics.warn("Could not calculate customer lifetime.")
+            return LifetimeValueResult(pd.DataFrame(), diagnostics)
+
+        # Total value per customer key; customers without a valid date still count
+        amounts = payment_amounts(data, amount_column, diagnostics)
+        present = np.flatnonzero(keys >= 0)
+        metrics = customer_metrics(keys[present], dates[present], amounts[present], jobs)
+
+        lifetime = lifetime_frame(data, rows, keys, metrics['lifetime'], nome_column)
+        result = ltv_frame(data, keys, lifetime, metrics['values'], nome_column)
+    return LifetimeValueResult(result, diagnostics)
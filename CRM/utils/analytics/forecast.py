@@ -0,0 +1,267 @@
+import hashlib
+from importlib.util import find_spec
+
+import numpy as np
+import pandas as pd
+
+from utils.analytics.columns import AMOUNT_CANDIDATES, DATE_CANDIDATES, find_column, resolve_columns
+from utils.analytics.results import AnalysisError, Diagnostics, ForecastResult, timed
+from utils.analytics.sharded import get_pool
+from utils.date_parsing import ensure_datetime
+
+# Holt-Winters with a yearly season once two full years are available, trend only before that
+SEASON_MONTHS = 12
+
+# Segments with fewer months of history are not forecast
+MIN_MONTHS = 6
+
+# Months appended through incremental updates before the parameters are fitted again
+REFIT_EVERY_MONTHS = 12
+
+# z-score of the 95% prediction interval
+INTERVAL_Z = 1.96
+
+# Segment name of the series over all payments
+TOTAL = 'Total'
+
+
+def monthly_series(data, date_column='data_de_confirmacao', amount_column='valor', segment_column=None):
+    """
+    Revenue per calendar month, with months without payments filled with zero.
+
+    The last month is left out when the latest payment falls before its last
+    day: a month still in progress would read as a drop in revenue.
+
+    :param data: DataFrame containing client data
+    :param date_column: Column name for dates
+    :param amount_column: Column name for transaction amounts
+    :param segment_column: Optional column splitting the revenue into one series per value
+    :return: Tuple of (dictionary of segment -> Series indexed by month start, Diagnostics)
+    """
+    diagnostics = Diagnostics(rows=len(data))
+    date_column, amount_column = resolve_columns(
+        data, diagnostics,
+        date=[date_column] + DATE_CANDIDATES,
+        amount=[amount_column] + AMOUNT_CANDIDATES
+    )
+    dates = ensure_datetime(data[date_column])
+    valid = dates.notna().to_numpy()
+    diagnostics.rows_used = int(valid.sum())
+    if diagnostics.rows_skipped:
+        diagnostics.warn(f"{diagnostics.rows_skipped} rows without a valid '{date_column}' were skipped.")
+    if not diagnostics.rows_used:
+        return {}, diagnostics
+
+    # Month of each payment as an offset from the first month, summed with bincount
+    months = dates[valid].to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+    first_month = months.min()
+    positions = (months - first_month).astype(np.int64)
+    n_months = int(positions.max()) + 1
+    amounts = pd.to_numeric(data[amount_column][valid], errors='coerce').fillna(0).to_numpy(dtype='float64')
+
+    latest = dates[valid].max()
+    if latest.day < latest.days_in_month:
+        diagnostics.warn(f"{latest:%m/%Y} is incomplete (payments through {latest:%d/%m/%Y}) and was left out.")
+        n_months -= 1
+        if not n_months:
+            return {}, diagnostics
+    index = pd.date_range(pd.Timestamp(first_month), periods=n_months, freq='MS')
+
+    series = {TOTAL: pd.Series(np.bincount(positions, weights=amounts, minlength=n_months + 1)[:n_months], index=index)}
+    if segment_column is not None:
+        segment_column = find_column(data, [segment_column])
+        codes, segments = pd.factorize(data[segment_column][valid])
+        known = codes >= 0
+        totals = np.bincount(
+            codes[known] * (n_months + 1) + positions[known],
+            weights=amounts[known],
+            minlength=len(segments) * (n_months + 1)
+        ).reshape(len(segments), n_months + 1)
+        for code, segment in enumerate(segments):
+            series[str(segment)] = pd.Series(totals[code, :n_months], index=index)
+    return series, diagnostics
+
+
+def series_version(series):
+    """Short stable hash of a monthly series (its first month and every value)."""
+    digest = hashlib.md5(str(series.index[0]).encode())
+    digest.update(np.ascontiguousarray(series.to_numpy(dtype='float64')).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def fit_model(series):
+    """
+    Fit additive Holt-Winters parameters to a monthly series.
+
+    Only what forecasting and incremental updates need is kept: the smoothing
+    parameters, the final level, trend and seasonal states, and the squared
+    one-step errors. The result is plain JSON-friendly data.
+
+    :param series: Monthly revenue Series indexed by month start
+    :return: Model dictionary
+    """
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    seasonal = len(series) >= 2 * SEASON_MONTHS
+    fitted = ExponentialSmoothing(
+        series.to_numpy(dtype='float64'),
+        trend='add',
+        seasonal='add' if seasonal else None,
+        seasonal_periods=SEASON_MONTHS if seasonal else None,
+        initialization_method='estimated'
+    ).fit()
+    params = fitted.params
+    return {
+        'alpha': float(params['smoothing_level']),
+        'beta': float(params['smoothing_trend']),
+        'gamma': float(params['smoothing_seasonal']) if seasonal else 0.0,
+        'level': float(fitted.level[-1]),
+        'trend': float(fitted.trend[-1]),
+        'season': [float(value) for value in fitted.season[-SEASON_MONTHS:]] if seasonal else [],
+        'sse': float(fitted.sse),
+        'observations': len(series),
+        'fitted_observations': len(series),
+        'start': series.index[0].isoformat(),
+        'values': [float(value) for value in series.to_numpy()],
+        'version': series_version(series)
+    }
+
+
+def update_model(model, series):
+    """
+    Extend a fitted model with the months appended to its series.
+
+    The Holt-Winters recursions are run over the new months only, keeping the
+    fitted parameters, so the update costs microseconds instead of a refit.
+
+    :param model: Model dictionary fitted on a prefix of series
+    :param series: The longer monthly series
+    :return: New model dictionary
+    """
+    alpha, beta, gamma = model['alpha'], model['beta'], model['gamma']
+    level, trend = model['level'], model['trend']
+    season = list(model['season'])
+    sse = model['sse']
+    for value in series.to_numpy(dtype='float64')[model['observations']:]:
+        seasonal = season[0] if season else 0.0
+        sse += (value - (level + trend + seasonal)) ** 2
+        new_level = alpha * (value - seasonal) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        if season:
+            season = season[1:] + [gamma * (value - level - trend) + (1 - gamma) * seasonal]
+        level, trend = new_level, new_trend
+    return dict(
+        model,
+        level=level,
+        trend=trend,
+        season=season,
+        sse=sse,
+        observations=len(series),
+        values=[float(value) for value in series.to_numpy()],
+        version=series_version(series)
+    )
+
+
+def forecast_model(model, horizon):
+    """
+    Forecast the months following a model's series, with 95% prediction intervals.
+
+    The interval widths use the closed-form forecast variance of the additive
+    Holt-Winters model, so no statsmodels import is needed.
+
+    :param model: Model dictionary
+    :param horizon: Number of months to forecast
+    :return: DataFrame with month, forecast, lower and upper
+    """
+    steps = np.arange(1, horizon + 1)
+    season = np.asarray(model['season'], dtype='float64')
+    seasonal = season[(steps - 1) % len(season)] if len(season) else 0.0
+    forecast = model['level'] + steps * model['trend'] + seasonal
+
+    # Var(h) = sigma^2 * (1 + sum over j < h of c_j^2), c_j = alpha * (1 + j * beta) + gamma * [j is a full season]
+    j = np.arange(1, horizon)
+    c = model['alpha'] * (1 + j * model['beta']) + model['gamma'] * ((j % SEASON_MONTHS) == 0)
+    variance = model['sse'] / model['observations'] * (1 + np.concatenate(([0.0], np.cumsum(c ** 2))))
+    margin = INTERVAL_Z * np.sqrt(variance)
+
+    last_month = pd.Timestamp(model['start']) + pd.DateOffset(months=model['observations'] - 1)
+    return pd.DataFrame({
+        'month': pd.date_range(last_month + pd.DateOffset(months=1), periods=horizon, freq='MS'),
+        # Revenue cannot be negative
+        'forecast': np.maximum(forecast, 0.0),
+        'lower': np.maximum(forecast - margin, 0.0),
+        'upper': np.maximum(forecast + margin, 0.0)
+    })
+
+
+def extends(model, series):
+    """Whether series is the model's series with zero or more months appended."""
+    known = model['values']
+    return (
+        pd.Timestamp(model['start']) == series.index[0]
+        and len(series) >= len(known)
+        and np.allclose(series.to_numpy(dtype='float64')[:len(known)], known)
+    )
+
+
+def revenue_forecast(data, horizon=6, segment_column=None, models=None, jobs=1,
+                     date_column='data_de_confirmacao', amount_column='valor'):
+    """
+    Forecast monthly revenue, in total and per segment.
+
+    A cached model is reused as is when its series version matches, updated
+    incrementally when months were only appended to its series (until
+    REFIT_EVERY_MONTHS months were added since the last fit), and fitted again
+    otherwise. Segments that need a fit are fitted in parallel on `jobs` workers.
+
+    :param data: DataFrame containing client data
+    :param horizon: Number of months to forecast
+    :param segment_column: Optional column splitting the revenue into segments
+    :param models: Dictionary of segment -> cached model dictionary
+    :param jobs: Worker processes fitting the segments (1 fits them serially)
+    :param date_column: Column name for dates
+    :param amount_column: Column name for transaction amounts
+    :return: ForecastResult with one row per segment and forecast month
+    """
+    models = models or {}
+    with timed(Diagnostics()) as timing:
+        series, diagnostics = monthly_series(data, date_column, amount_column, segment_column)
+
+        current = {}
+        to_fit = []
+        for segment, values in series.items():
+            if len(values) < MIN_MONTHS:
+                diagnostics.warn(f"'{segment}' has only {len(values)} months of revenue; at least {MIN_MONTHS} are needed to forecast it.")
+                continue
+            model = models.get(segment)
+            if model is not None and model['version'] == series_version(values):
+                current[segment] = (model, 'cached')
+            elif (model is not None and extends(model, values)
+                  and len(values) - model['fitted_observations'] < REFIT_EVERY_MONTHS):
+                current[segment] = (update_model(model, values), 'updated')
+            else:
+                to_fit.append(segment)
+
+        if to_fit:
+            if find_spec('statsmodels') is None:
+                raise AnalysisError("Revenue forecasting requires statsmodels (pip install statsmodels).")
+            if jobs > 1 and len(to_fit) > 1:
+                fitted = get_pool(jobs).map(fit_model, [series[segment] for segment in to_fit])
+            else:
+                fitted = map(fit_model, [series[segment] for segment in to_fit])
+            for segment, model in zip(to_fit, fitted):
+                current[segment] = (model, 'fitted')
+
+        forecasts = [forecast_model(model, horizon).assign(segment=segment) for segment, (model, _) in current.items()]
+        history = [values.rename_axis('month').rename(amount_column).reset_index().assign(segment=segment)
+                   for segment, values in series.items() if segment in current]
+
+    diagnostics.seconds = timing.seconds
+    columns = ['segment', 'month', 'forecast', 'lower', 'upper']
+    return ForecastResult(
+        pd.concat(forecasts, ignore_index=True)[columns] if forecasts else pd.DataFrame(columns=columns),
+        diagnostics,
+        history=pd.concat(history, ignore_index=True) if history else pd.DataFrame(columns=['month', amount_column, 'segment']),
+        models={segment: model for segment, (model, _) in current.items()},
+        sources={segment: source for segment, (_, source) in current.items()}
+    )
@@ -0,0 +1,183 @@
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.analytics.columns import NAME_CANDIDATES, find_column
+from utils.analytics.results import AnalysisError
+from utils.customer_keys import CUSTOMER_KEY_COLUMN, build_customer_keys
+from utils.date_parsing import parse_date_columns
+from utils.dtype_planner import optimize_dtypes
+
+# Rows read, typed and normalized at a time, for CSV and Excel alike
+CHUNK_ROWS = 50_000
+
+
+def normalize_columns(df):
+    """Normalize the headers of a raw export in place (lowercase, underscores, no accents)."""
+    df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_').str.replace('ç', 'c').str.replace('ã', 'a').str.replace('é', 'e')
+    return df
+
+
+def normalize_chunk(chunk):
+    """
+    Normalize one chunk of a raw export.
+
+    Headers are normalized and amount columns converted to numbers. Dates are
+    parsed once the chunks are joined, so each column's format is detected and
+    reported over the whole file.
+
+    :param chunk: Raw DataFrame chunk
+    :return: The normalized chunk
+    """
+    normalize_columns(chunk)
+    numeric_columns = [col for col in chunk.columns if 'valor' in col or 'amount' in col or 'preco' in col]
+    for col in numeric_columns:
+        chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+    return chunk
+
+
+def _column_array(values):
+    """
+    Build a typed array from one column of a batch of spreadsheet cells.
+
+    Numbers become float64 (int64 when complete and whole), dates datetime64
+    and anything else (text or mixed cells) stays as Python objects.
+    """
+    present = [value for value in values if value is not None]
+    if not present:
+        return np.full(len(values), np.nan)
+
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        if len(present) == len(values) and all(isinstance(value, int) for value in present):
+            return np.array(values, dtype=np.int64)
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+    if all(isinstance(value, datetime.datetime) for value in present):
+        return np.array([np.datetime64('NaT') if value is None else value for value in values], dtype='datetime64[ns]')
+
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _xlsx_headers(row):
+    """Header names of a sheet; repeated names get .1, .2... suffixes as pandas' readers do."""
+    headers = []
+    counts = {}
+    for position, value in enumerate(row):
+        header = f'Unnamed: {position}' if value is None else str(value)
+        count = counts.get(header, 0)
+        while count > 0:
+            counts[header] = count + 1
+            header = f'{header}.{count}'
+            count = counts.get(header, 0)
+        counts[header] = count + 1
+        headers.append(header)
+    return headers
+
+
+def _batch_frame(headers, batch):
+    columns = zip(*batch) if batch else [() for _ in headers]
+    return pd.DataFrame({header: _column_array(list(column)) for header, column in zip(headers, columns)})
+
+
+def read_xlsx_chunks(file, chunk_rows=CHUNK_ROWS):
+    """
+    Stream the first sheet of a workbook as DataFrame chunks.
+
+    The workbook is opened read-only, so openpyxl parses the sheet row by row
+    instead of building its whole object model; each batch of rows is turned
+    into typed column arrays.
+
+    :param file: Path or file object of an .xlsx workbook
+    :param chunk_rows: Rows per chunk
+    :return: Generator of raw DataFrame chunks
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = _xlsx_headers(next(rows, ()))
+        batch = []
+        yielded = False
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            # Short rows miss their trailing empty cells
+            batch.append(tuple(row[:len(headers)]) + (None,) * (len(headers) - len(row)))
+            if len(batch) == chunk_rows:
+                yield _batch_frame(headers, batch)
+                yielded = True
+                batch = []
+        if batch or not yielded:
+            yield _batch_frame(headers, batch)
+    finally:
+        workbook.close()
+
+
+def read_chunks(file, chunk_rows=CHUNK_ROWS):
+    """
+    Read an uploaded CSV or XLSX file as raw DataFrame chunks.
+
+    :param file: Uploaded file object (its name picks the reader)
+    :param chunk_rows: Rows per chunk
+    :return: Iterator of raw DataFrame chunks
+    """
+    if file.name.endswith('.csv'):
+        return pd.read_csv(file, chunksize=chunk_rows)
+    return read_xlsx_chunks(file, chunk_rows)
+
+
+def load_and_preprocess_data(file, ingest_report=None, chunk_rows=CHUNK_ROWS):
+    """
+    Load and preprocess the uploaded data file.
+
+    :param file: Uploaded file object
+    :param ingest_report: Optional dictionary filled with ingestion diagnostics
+                          ('dates': parse report per date column,
+                          'memory': per-column memory report,
+                          'throughput': rows, chunks, seconds and rows per second)
+    :param chunk_rows: Rows read and normalized at a time
+    :return: Preprocessed DataFrame; AnalysisError is raised for a file without data rows
+    """
+    started = time.perf_counter()
+
+    # Read and normalize the file chunk by chunk, whatever its format
+    try:
+        chunks = [normalize_chunk(chunk) for chunk in read_chunks(file, chunk_rows)]
+    except pd.errors.EmptyDataError:
+        chunks = []
+    # An empty file yields no chunks, a header-only one a single empty chunk
+    if not chunks or not any(len(chunk) for chunk in chunks):
+        raise AnalysisError(f"'{file.name}' has no data rows.")
+    df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    read_seconds = time.perf_counter() - started
+
+    # Convert date columns to datetime, detecting each column's format once
+    date_reports = parse_date_columns(df)
+
+    # Attach the dense integer customer key used by every per-customer analysis
+    try:
+        nome_column = find_column(df, NAME_CANDIDATES)
+        df[CUSTOMER_KEY_COLUMN] = build_customer_keys(df, nome_column)
+    except KeyError:
+        pass
+
+    # Store repeated text as categoricals and numerics in the smallest safe dtype
+    df, memory = optimize_dtypes(df)
+    if ingest_report is not None:
+        seconds = time.perf_counter() - started
+        ingest_report['dates'] = date_reports
+        ingest_report['memory'] = memory
+        ingest_report['throughput'] = {
+            'rows': len(df),
+            'chunks': len(chunks),
+            'read_seconds': read_seconds,
+            'seconds': seconds,
+            'rows_per_second': len(df) / seconds if seconds else None
+        }
+
+    return df
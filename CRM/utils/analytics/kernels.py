@@ -0,0 +1,131 @@
+import numpy as np
+
+# Months between two payments above which the customer is considered to have paused
+GAP_THRESHOLD_MONTHS = 2
+
+
+def payment_sequences(keys, dates):
+    """
+    Sort payments by customer key and date and flag payment gaps of 2+ months.
+
+    :param keys: int32 array of customer keys
+    :param dates: datetime64[ns] array of payment dates
+    :return: Tuple of (order, sorted keys, sorted dates, months to next payment, gap flags)
+    """
+    order = np.lexsort((dates, keys))
+    sorted_keys = keys[order]
+    sorted_dates = dates[order]
+
+    # Months until the same customer's next payment (NaN on each customer's last payment)
+    same_customer = sorted_keys[1:] == sorted_keys[:-1]
+    months_to_next = np.full(len(order), np.nan)
+    months_to_next[:-1] = np.where(
+        same_customer,
+        np.round((sorted_dates[1:] - sorted_dates[:-1]) / np.timedelta64(30, 'D'), 1),
+        np.nan
+    )
+
+    is_gap = months_to_next > GAP_THRESHOLD_MONTHS
+    return order, sorted_keys, sorted_dates, months_to_next, is_gap
+
+
+def lifetime_arrays(sorted_keys, sorted_dates, is_gap):
+    """
+    Per-customer lifetime partials from payments sorted by customer and date.
+
+    Active periods are split at payment gaps of 2+ months; each period
+    contributes its whole days. Every payment of a customer must be present,
+    but the customers can be any subset, which is what lets shards run this
+    on their own customers.
+
+    :param sorted_keys: Customer keys, as returned by payment_sequences
+    :param sorted_dates: Payment dates, as returned by payment_sequences
+    :param is_gap: Gap flags, as returned by payment_sequences
+    :return: Tuple of (customer keys ascending, first payment, last payment,
+             active days, gap count), one entry per customer
+    """
+    first_of_customer = np.ones(len(sorted_keys), dtype=bool)
+    first_of_customer[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    last_of_customer = np.ones(len(sorted_keys), dtype=bool)
+    last_of_customer[:-1] = first_of_customer[1:]
+
+    # Active periods start at a customer's first payment or right after a gap,
+    # and end at a gap or at the customer's last payment
+    period_start = first_of_customer.copy()
+    period_start[1:] |= is_gap[:-1]
+    period_end = is_gap | last_of_customer
+    starts = np.flatnonzero(period_start)
+    ends = np.flatnonzero(period_end)
+    period_days = (sorted_dates[ends] - sorted_dates[starts]) // np.timedelta64(1, 'D')
+
+    n_keys = int(sorted_keys.max()) + 1 if len(sorted_keys) else 0
+    total_days = np.bincount(sorted_keys[starts], weights=period_days, minlength=n_keys)
+    gap_count = np.bincount(sorted_keys[is_gap], minlength=n_keys)
+
+    customer_keys = sorted_keys[first_of_customer]
+    return (
+        customer_keys,
+        sorted_dates[first_of_customer],
+        sorted_dates[last_of_customer],
+        total_days[customer_keys],
+        gap_count[customer_keys]
+    )
+
+
+def gap_arrays(order, sorted_keys, sorted_dates, months_to_next, is_gap):
+    """
+    Details of every payment gap, in customer and date order.
+
+    :return: Tuple of (input positions of the payments starting a gap, customer keys,
+             gap start dates, gap end dates, months to the next payment)
+    """
+    gap_positions = np.flatnonzero(is_gap)
+    return (
+        order[gap_positions],
+        sorted_keys[gap_positions],
+        sorted_dates[gap_positions],
+        sorted_dates[gap_positions + 1],
+        months_to_next[gap_positions]
+    )
+
+
+def customer_values(keys, amounts):
+    """
+    Total amount per customer.
+
+    :param keys: Customer keys (no -1)
+    :param amounts: float64 amounts aligned with keys (NaN is not counted)
+    :return: Tuple of (customer keys ascending, total amount)
+    """
+    counted = ~np.isnan(amounts)
+    n_keys = int(keys.max()) + 1 if len(keys) else 0
+    totals = np.bincount(keys[counted], weights=amounts[counted], minlength=n_keys)
+    customer_keys = np.unique(keys)
+    return customer_keys, totals[customer_keys]
+
+
+def customer_partials(keys, dates, amounts=None):
+    """
+    Lifetime, gap and value partials of a set of customers.
+
+    Every payment of each customer in keys must be present; rows without a
+    valid date only count towards the value.
+
+    :param keys: Customer keys (no -1)
+    :param dates: datetime64[ns] payment dates aligned with keys (NaT allowed)
+    :param amounts: Optional float64 amounts aligned with keys
+    :return: Dictionary with 'lifetime' (lifetime_arrays output), 'gaps' (gap_arrays
+             output, positions relative to the input) and 'values' (customer_values
+             output, only when amounts are given)
+    """
+    dated = np.flatnonzero(~np.isnat(dates))
+    order, sorted_keys, sorted_dates, months_to_next, is_gap = payment_sequences(keys[dated], dates[dated])
+
+    positions, gap_keys, gap_start, gap_end, gap_months = gap_arrays(order, sorted_keys, sorted_dates, months_to_next, is_gap)
+    partials = {
+        'lifetime': lifetime_arrays(sorted_keys, sorted_dates, is_gap),
+        'gaps': (dated[positions], gap_keys, gap_start, gap_end, gap_months)
+    }
+    if amounts is not None:
+        partials['values'] = customer_values(keys, amounts)
+    return partials
@@ -0,0 +1,32 @@
+import pandas as pd
+
+from utils.analytics.columns import DATE_CANDIDATES, find_column
+from utils.date_parsing import ensure_datetime
+
+
+def end_of_day(end):
+    """An end bound given as a date includes that whole day."""
+    end = pd.Timestamp(end)
+    return end + pd.Timedelta(days=1) - pd.Timedelta(1, unit='ns') if end == end.normalize() else end
+
+
+def within_date_range(data, start=None, end=None, date_column='Data de confirmação'):
+    """
+    Keep the payments dated within [start, end].
+
+    :param data: DataFrame containing client data
+    :param start: Range start (None for unbounded)
+    :param end: Range end, inclusive (None for unbounded)
+    :param date_column: Column name for dates
+    :return: The filtered DataFrame (data itself when the range is unbounded)
+    """
+    if start is None and end is None:
+        return data
+    date_column = find_column(data, [date_column] + DATE_CANDIDATES)
+    dates = ensure_datetime(data[date_column])
+    within = dates.notna()
+    if start is not None:
+        within &= dates >= pd.Timestamp(start)
+    if end is not None:
+        within &= dates <= end_of_day(end)
+    return data[within.to_numpy()]
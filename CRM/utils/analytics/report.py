@@ -0,0 +1,75 @@
+from utils.analytics.customers import customer_lifetime, lifetime_value
+from utils.analytics.ranges import within_date_range
+from utils.analytics.rfm import rfm_segments
+from utils.analytics.trends import cancellation_months, monthly_revenue, top_months
+
+
+def _customer_lifetime(data, gap_months, jobs):
+    return customer_lifetime(data, 'Nome', 'Data de confirmação', jobs=jobs)
+
+
+def _lifetime_value(data, gap_months, jobs):
+    return lifetime_value(data, 'Nome', 'Valor', jobs=jobs)
+
+
+def _top_months(data, gap_months, jobs):
+    return top_months(data, 'Data de confirmação')
+
+
+def _cancellation_months(data, gap_months, jobs):
+    return cancellation_months(data, 'Data de confirmação', gap_months=gap_months)
+
+
+def _monthly_revenue(data, gap_months, jobs):
+    return monthly_revenue(data)
+
+
+def _rfm_segments(data, gap_months, jobs):
+    return rfm_segments(data, 'Nome', 'Data de confirmação', 'Valor')
+
+
+# Analyses shown on the Finance and Product screens, by name
+ANALYSES = {
+    'customer_lifetime': _customer_lifetime,
+    'lifetime_value': _lifetime_value,
+    'top_months': _top_months,
+    'cancellation_months': _cancellation_months,
+    'monthly_revenue': _monthly_revenue,
+    'rfm_segments': _rfm_segments
+}
+
+# Analyses measured against today, whose results change from one day to the next
+DATED_ANALYSES = {'cancellation_months'}
+
+
+def run_analysis(name, data, gap_months=3, jobs=1, date_range=None):
+    """
+    Run one of the standard analyses by name.
+
+    :param name: Key of ANALYSES
+    :param data: Preprocessed payment DataFrame
+    :param gap_months: Months without payment that count as a cancellation
+    :param jobs: Worker processes for the per-customer analyses (1 runs serially)
+    :param date_range: Optional (start, end) tuple; only payments within it are analyzed
+    :return: The analysis result object
+    """
+    if name not in ANALYSES:
+        raise ValueError(f"Unknown analysis: {name}")
+    if date_range is not None:
+        data = within_date_range(data, *date_range)
+    return ANALYSES[name](data, gap_months, jobs)
+
+
+def customer_report(data, gap_months=3, jobs=1, date_range=None):
+    """
+    Run every standard analysis.
+
+    :param data: Preprocessed payment DataFrame
+    :param gap_months: Months without payment that count as a cancellation
+    :param jobs: Worker processes for the per-customer analyses (1 runs serially)
+    :param date_range: Optional (start, end) tuple; only payments within it are analyzed
+    :return: Dictionary of analysis name -> result object
+    """
+    if date_range is not None:
+        data = within_date_range(data, *date_range)
+    return {name: run_analysis(name, data, gap_months, jobs) for name in ANALYSES}
@@ -0,0 +1,164 @@
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+
+class AnalysisError(ValueError):
+    """The input data cannot support an analysis (e.g. a required column is missing)."""
+
+
+class MissingColumnError(AnalysisError, KeyError):
+    """None of the candidate column names is present in the data."""
+
+    def __str__(self):
+        # KeyError would repr() the message
+        return str(self.args[0]) if self.args else ''
+
+
+@dataclass
+class Diagnostics:
+    """
+    What an analysis did with its input.
+
+    rows is the number of input rows and rows_used the rows that had both a
+    customer and a valid date. warnings are data problems that did not stop
+    the analysis, for the presentation layer to show. materialized is set when
+    the result was loaded from a stored view instead of computed.
+    """
+    rows: int = 0
+    rows_used: int = 0
+    columns: dict = field(default_factory=dict)
+    warnings: list = field(default_factory=list)
+    seconds: float = 0.0
+    materialized: bool = False
+
+    def warn(self, message):
+        self.warnings.append(message)
+
+    @property
+    def rows_skipped(self):
+        return self.rows - self.rows_used
+
+
+@contextmanager
+def timed(diagnostics):
+    """Record the wall time of the enclosed block on the diagnostics."""
+    start = time.perf_counter()
+    try:
+        yield diagnostics
+    finally:
+        diagnostics.seconds = time.perf_counter() - start
+
+
+@dataclass
+class TableResult:
+    """Base result holding one table and its diagnostics."""
+    table: pd.DataFrame
+    diagnostics: Diagnostics = field(default_factory=Diagnostics)
+
+    @property
+    def empty(self):
+        return self.table.empty
+
+    def to_frame(self):
+        """Flat copy of the table ready for columnar storage."""
+        named_index = not isinstance(self.table.index, pd.RangeIndex)
+        return self.table.reset_index() if named_index else self.table.copy()
+
+
+class GapsResult(TableResult):
+    """Payment gaps of 2+ months, one row per gap."""
+
+
+class LifetimeResult(TableResult):
+    """Customer lifetime in months, indexed by customer name (names shared by several customers carry their key), with the customer_key column."""
+
+
+class LifetimeValueResult(TableResult):
+    """Lifetime value per customer, indexed by customer name (names shared by several customers carry their key), with the customer_key column."""
+
+
+class MonthlyRevenueResult(TableResult):
+    """Total amount per calendar month."""
+
+
+class RFMResult(TableResult):
+    """Recency, frequency and monetary scores and segment, indexed by customer key."""
+
+    def segments(self):
+        """
+        Size and revenue share of each segment.
+
+        :return: DataFrame indexed by segment with customers, customer_share,
+                 revenue, revenue_share and the mean recency_days and frequency,
+                 largest revenue first
+        """
+        table = self.table
+        summary = table.groupby('segment').agg(
+            customers=('frequency', 'size'),
+            revenue=('monetary', 'sum'),
+            recency_days=('recency_days', 'mean'),
+            frequency=('frequency', 'mean')
+        )
+        summary.insert(1, 'customer_share', summary['customers'] / max(len(table), 1))
+        total = summary['revenue'].sum()
+        summary.insert(3, 'revenue_share', summary['revenue'] / total if total else 0.0)
+        return summary.sort_values('revenue', ascending=False)
+
+
+@dataclass
+class ForecastResult(TableResult):
+    """
+    Revenue forecast per segment and month, with 95% prediction intervals.
+
+    history holds the monthly series the models were fitted on, models the
+    model of each segment (for the caller to cache) and sources whether each
+    came from the cache ('cached'), was updated with new months ('updated')
+    or fitted ('fitted').
+    """
+    history: pd.DataFrame = None
+    models: dict = field(default_factory=dict)
+    sources: dict = field(default_factory=dict)
+
+
+@dataclass
+class AnomalyResult(TableResult):
+    """
+    Sudden drops in revenue, one row per flagged period, newest first.
+
+    customers holds the flagged payments of individual customers. state
+    holds the filter state of the 'daily', 'monthly' and per-customer
+    'payments' series plus the flags so far, as DataFrames for the caller to
+    pass to the next run, and sources counts the series continued from that state
+    ('continued'), filtered from the start ('computed') and the observations
+    filtered ('observations').
+    """
+    customers: pd.DataFrame = None
+    state: dict = field(default_factory=dict)
+    sources: dict = field(default_factory=dict)
+
+    @property
+    def empty(self):
+        return self.table.empty and (self.customers is None or self.customers.empty)
+
+
+@dataclass
+class MonthlyCountsResult:
+    """Customers counted by calendar month (1-12), aggregated across years."""
+    counts: pd.Series
+    total_years: int
+    label: str
+    diagnostics: Diagnostics = field(default_factory=Diagnostics)
+
+    @property
+    def empty(self):
+        return self.counts.empty
+
+    def to_frame(self):
+        return pd.DataFrame({
+            'month': self.counts.index,
+            self.label: self.counts.to_numpy(),
+            'total_years': self.total_years
+        })
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+from utils.analytics.columns import AMOUNT_CANDIDATES, DATE_CANDIDATES, NAME_CANDIDATES, resolve_columns
+from utils.analytics.customers import customer_dates, payment_amounts
+from utils.analytics.results import Diagnostics, RFMResult, timed
+from utils.customer_keys import CUSTOMER_KEY_COLUMN, customer_labels
+
+# Scores run from 1 to SCORE_BINS, each bin holding about the same number of customers
+SCORE_BINS = 5
+
+# Segment of each (recency score, frequency score) pair; row r-1, column f-1
+SEGMENT_NAMES = np.array([
+    'Hibernating', 'At Risk', "Can't Lose", 'About to Sleep', 'Need Attention',
+    'Loyal Customers', 'Promising', 'New Customers', 'Potential Loyalists', 'Champions'
+])
+SEGMENT_GRID = np.array([
+    # F:  1  2  3  4  5
+    [0, 0, 1, 1, 2],  # R = 1
+    [0, 0, 1, 1, 2],  # R = 2
+    [3, 3, 4, 5, 5],  # R = 3
+    [6, 8, 8, 5, 5],  # R = 4
+    [7, 8, 8, 9, 9],  # R = 5
+])
+
+RFM_COLUMNS = ['last_payment', 'recency_days', 'frequency', 'monetary', 'r_score', 'f_score', 'm_score', 'segment']
+
+
+def quantile_scores(values, higher_is_better=True):
+    """
+    Score values from 1 to SCORE_BINS by the quantile bin they fall in.
+
+    The bin edges are the 20/40/60/80% quantiles and a value equal to an edge
+    goes to the lower bin, so tied values (e.g. the many customers with a
+    single payment) always share a score.
+
+    :param values: Numeric array
+    :param higher_is_better: False to give the lowest values the highest score
+    :return: int8 array of scores
+    """
+    values = np.asarray(values, dtype='float64')
+    if not higher_is_better:
+        values = -values
+    if not len(values):
+        return np.zeros(0, dtype=np.int8)
+    edges = np.quantile(values, np.arange(1, SCORE_BINS) / SCORE_BINS)
+    return (np.searchsorted(edges, values, side='left') + 1).astype(np.int8)
+
+
+def score_customers(state, as_of=None):
+    """
+    Score and segment customers from their per-customer RFM state.
+
+    :param state: DataFrame indexed by customer key with the customer name first,
+                  then last_payment, frequency and monetary
+    :param as_of: Date recency is measured from (defaults to the latest payment)
+    :return: DataFrame with the name column and RFM_COLUMNS, best customers first
+    """
+    last_payment = state['last_payment'].to_numpy(dtype='datetime64[ns]')
+    if as_of is None:
+        as_of = last_payment.max() if len(last_payment) else np.datetime64('NaT', 'ns')
+    recency_days = ((np.datetime64(as_of, 'ns') - last_payment) // np.timedelta64(1, 'D')).astype(np.int64)
+
+    r_score = quantile_scores(recency_days, higher_is_better=False)
+    f_score = quantile_scores(state['frequency'].to_numpy())
+    m_score = quantile_scores(state['monetary'].to_numpy())
+    segments = SEGMENT_NAMES[SEGMENT_GRID[r_score - 1, f_score - 1]] if len(state) else np.array([], dtype=object)
+
+    scored = pd.DataFrame({
+        state.columns[0]: state.iloc[:, 0].to_numpy(),
+        'last_payment': last_payment,
+        'recency_days': recency_days,
+        'frequency': state['frequency'].to_numpy(dtype=np.int64),
+        'monetary': state['monetary'].to_numpy(dtype='float64'),
+        'r_score': r_score,
+        'f_score': f_score,
+        'm_score': m_score,
+        'segment': segments.astype(object)
+    }, index=state.index)
+    return scored.sort_values(['r_score', 'f_score', 'monetary'], ascending=False)
+
+
+def rfm_segments(data, nome_column='Nome', date_column='Data de confirmação', amount_column='Valor', as_of=None):
+    """
+    Recency, frequency and monetary scores and segment of every customer.
+
+    The per-customer last payment, payment count and total amount are
+    aggregated in one grouped pass over the key, date and amount arrays
+    (bincount and maximum.at), then each measure is scored 1-5 by quantile
+    bin and the customers are segmented on the recency and frequency scores.
+
+    :param data: DataFrame containing client data
+    :param nome_column: Column name for client names
+    :param date_column: Column name for dates
+    :param amount_column: Column name for transaction amounts
+    :param as_of: Date recency is measured from (defaults to the latest payment,
+                  so the result only depends on the data)
+    :return: RFMResult indexed by customer key
+    """
+    diagnostics = Diagnostics(rows=len(data))
+    with timed(diagnostics):
+        nome_column, date_column, amount_column = resolve_columns(
+            data, diagnostics,
+            name=[nome_column] + NAME_CANDIDATES,
+            date=[date_column] + DATE_CANDIDATES,
+            amount=[amount_column] + AMOUNT_CANDIDATES
+        )
+        rows, keys, dates = customer_dates(data, nome_column, date_column, diagnostics)
+        if not len(rows):
+            diagnostics.warn("No valid data found after processing dates.")
+            return RFMResult(pd.DataFrame(columns=[nome_column] + RFM_COLUMNS), diagnostics)
+
+        amounts = payment_amounts(data, amount_column, diagnostics)[rows]
+        row_keys = keys[rows]
+        n_keys = int(row_keys.max()) + 1
+        counted = ~np.isnan(amounts)
+
+        frequency = np.bincount(row_keys, minlength=n_keys)
+        monetary = np.bincount(row_keys[counted], weights=amounts[counted], minlength=n_keys)
+        last_payment = np.full(n_keys, np.iinfo(np.int64).min, dtype=np.int64)
+        np.maximum.at(last_payment, row_keys, dates[rows].view(np.int64))
+
+        customer_keys = np.flatnonzero(frequency)
+        state = pd.DataFrame({
+            nome_column: customer_labels(data.iloc[rows], row_keys, nome_column).reindex(customer_keys).to_numpy(),
+            'last_payment': last_payment[customer_keys].view('datetime64[ns]'),
+            'frequency': frequency[customer_keys],
+            'monetary': monetary[customer_keys]
+        }, index=pd.Index(customer_keys, name=CUSTOMER_KEY_COLUMN))
+        table = score_customers(state, as_of)
+    return RFMResult(table, diagnostics)
@@ -0,0 +1,159 @@
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils.analytics.kernels import customer_partials
+
+# More shards than workers evens out customers with very long histories
+SHARDS_PER_JOB = 4
+
+# Below this many payments, starting the shards costs more than it saves
+MIN_SHARDED_ROWS = 200_000
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(jobs):
+    """
+    Return the process pool for a worker count, started once per process and
+    shared by the sharded analyses and the forecast model fits.
+
+    Workers are spawned rather than forked, so they do not inherit the server's
+    threads, and they only import this module (numpy and pandas).
+    """
+    with _pools_lock:
+        if jobs not in _pools:
+            pool = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(pool.shutdown)
+            _pools[jobs] = pool
+        return _pools[jobs]
+
+
+def shard_of(keys, n_shards):
+    """
+    Shard of each customer key.
+
+    Keys are numbered in order of first appearance, so they are mixed with a
+    multiplicative hash first to keep early and late customers spread evenly.
+    """
+    mixed = keys.astype(np.uint32) * np.uint32(2654435761)
+    return ((mixed >> np.uint32(16)) % np.uint32(n_shards)).astype(np.uint16)
+
+
+def _share(arrays, order):
+    """
+    Copy arrays into shared memory, reordered so each shard is one contiguous slice.
+
+    :return: Tuple of (shared memory blocks, block specs for the workers)
+    """
+    blocks = []
+    specs = []
+    try:
+        for field, values in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            blocks.append(block)
+            np.take(values, order, out=np.ndarray(len(values), dtype=values.dtype, buffer=block.buf))
+            specs.append((field, block.name, values.dtype.str, len(values)))
+    except Exception:
+        _release(blocks)
+        raise
+    return blocks, specs
+
+
+def _release(blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def _run_shard(specs, start, stop):
+    """Worker entry point: compute the partials of one shard from shared memory."""
+    blocks = []
+    arrays = {}
+    try:
+        for field, name, dtype, length in specs:
+            block = shared_memory.SharedMemory(name=name)
+            blocks.append(block)
+            arrays[field] = np.ndarray(length, dtype=dtype, buffer=block.buf)[start:stop]
+        return customer_partials(arrays['keys'], arrays['dates'], arrays.get('amounts'))
+    finally:
+        # Views into the blocks must be gone before they can be closed
+        arrays.clear()
+        for block in blocks:
+            block.close()
+
+
+def _merge(shard_partials, shard_rows):
+    """
+    Merge shard partials into the layout the serial kernel returns.
+
+    Serial output is ordered by customer key, and within a customer by the
+    customer's own payment order, which a shard preserves; sorting the merged
+    per-customer arrays by key (stably) therefore reproduces it exactly.
+    """
+    def by_key(parts, key_field=0):
+        columns = [np.concatenate(column) for column in zip(*parts)]
+        order = np.argsort(columns[key_field], kind='stable')
+        return tuple(column[order] for column in columns)
+
+    merged = {'lifetime': by_key([partials['lifetime'] for partials in shard_partials])}
+
+    gaps = []
+    for partials, rows in zip(shard_partials, shard_rows):
+        positions, *details = partials['gaps']
+        gaps.append((rows[positions], *details))
+    merged['gaps'] = by_key(gaps, key_field=1)
+
+    if 'values' in shard_partials[0]:
+        merged['values'] = by_key([partials['values'] for partials in shard_partials])
+    return merged
+
+
+def sharded_customer_partials(keys, dates, amounts=None, jobs=2):
+    """
+    Compute customer_partials on shards of customers in a process pool.
+
+    Payments are partitioned by a hash of the customer key, so every customer
+    lives in exactly one shard. The input columns are placed in shared memory
+    once, each worker reads its shard's slice, and the per-customer partials
+    are merged back in key order. The result is identical to
+    customer_partials(keys, dates, amounts).
+
+    :param keys: Customer keys (no -1)
+    :param dates: datetime64[ns] payment dates aligned with keys
+    :param amounts: Optional float64 amounts aligned with keys
+    :param jobs: Number of worker processes
+    :return: Dictionary in the layout of customer_partials
+    """
+    if jobs <= 1 or len(keys) < MIN_SHARDED_ROWS:
+        return customer_partials(keys, dates, amounts)
+
+    n_shards = jobs * SHARDS_PER_JOB
+    shards = shard_of(keys, n_shards)
+    # A stable sort on small integers is a radix sort: one linear pass, and each
+    # shard keeps its payments in input order
+    order = np.argsort(shards, kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(shards, minlength=n_shards))))
+
+    arrays = {'keys': np.ascontiguousarray(keys, dtype=np.int32), 'dates': np.ascontiguousarray(dates, dtype='datetime64[ns]')}
+    if amounts is not None:
+        arrays['amounts'] = np.ascontiguousarray(amounts, dtype=np.float64)
+
+    blocks, specs = _share(arrays, order)
+    try:
+        pool = get_pool(jobs)
+        futures = [
+            pool.submit(_run_shard, specs, int(bounds[shard]), int(bounds[shard + 1]))
+            for shard in range(n_shards)
+        ]
+        shard_partials = [future.result() for future in futures]
+    finally:
+        _release(blocks)
+
+    shard_rows = [order[bounds[shard]:bounds[shard + 1]] for shard in range(n_shards)]
+    return _merge(shard_partials, shard_rows)
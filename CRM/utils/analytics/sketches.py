@@ -0,0 +1,252 @@
+import base64
+
+import numpy as np
+import pandas as pd
+
+from utils.analytics.columns import AMOUNT_CANDIDATES, DATE_CANDIDATES, NAME_CANDIDATES, resolve_columns
+from utils.analytics.customers import customer_dates, payment_amounts
+from utils.analytics.kernels import customer_partials
+from utils.analytics.results import Diagnostics, MonthlyCountsResult
+from utils.analytics.trends import MONTHS
+
+# 2^14 one-byte registers (16 KB): standard error 1.04 / sqrt(2^14) = 0.81%
+HLL_PRECISION = 14
+
+# Every quantile is returned within 1% of the exact value
+QUANTILE_RELATIVE_ACCURACY = 0.01
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter over 64-bit hashes.
+
+    Values are hashed with pandas' vectorized hash, which is stable across
+    processes, and each register keeps the longest run of leading zeros seen
+    among the hashes routed to it. Two sketches merge by taking the
+    register-wise maximum, so the sketch of a union of partitions is the
+    merge of their sketches. The estimate has a relative standard error of
+    1.04 / sqrt(registers); see relative_error.
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        """Relative standard error of count(); twice it bounds about 95% of estimates."""
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def update(self, values):
+        """Add values (strings or numbers; missing values are skipped)."""
+        values = pd.Series(values).dropna().to_numpy()
+        if not len(values):
+            return self
+        hashes = pd.util.hash_array(values)
+        low_bits = 64 - self.precision
+        index = (hashes >> np.uint64(low_bits)).astype(np.intp)
+        rest = hashes & np.uint64((1 << low_bits) - 1)
+        # rest < 2^50 is exact as float64; frexp's exponent is its bit length (0 for 0)
+        _, bit_length = np.frexp(rest.astype(np.float64))
+        np.maximum.at(self.registers, index, (low_bits - bit_length + 1).astype(np.uint8))
+        return self
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one."""
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        """Estimated number of distinct values."""
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = m * np.log(m / zeros)
+        return float(estimate)
+
+    def to_dict(self):
+        return {'precision': self.precision, 'registers': base64.b64encode(self.registers.tobytes()).decode()}
+
+    @classmethod
+    def from_dict(cls, stored):
+        registers = np.frombuffer(base64.b64decode(stored['registers']), dtype=np.uint8).copy()
+        return cls(stored['precision'], registers)
+
+
+class QuantileSketch:
+    """
+    Relative-error quantile sketch (the DDSketch bucketing).
+
+    Values fall into logarithmic buckets [gamma^(i-1), gamma^i) with
+    gamma = (1 + a) / (1 - a), and each bucket reports the value that is
+    within a (the relative accuracy) of everything in it, so every quantile
+    is within a of the exact one. Buckets are counters, so sketches merge by
+    adding counts; the count, sum, min and max are kept exactly. The number
+    of buckets grows with the log of the value range (about 700 for values
+    from 1 to 1,000,000 at 1%), not with the number of values.
+    """
+
+    def __init__(self, relative_accuracy=QUANTILE_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        # Bucket index -> count, for positive values and for the magnitude of negative ones
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @classmethod
+    def from_values(cls, values, relative_accuracy=QUANTILE_RELATIVE_ACCURACY):
+        return cls(relative_accuracy).update(values)
+
+    def _add(self, store, magnitudes):
+        indexes, counts = np.unique(np.ceil(np.log(magnitudes) / np.log(self.gamma)).astype(np.int64), return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            store[index] = store.get(index, 0) + count
+
+    def update(self, values):
+        """Add numeric values (NaN is skipped)."""
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self._add(self.positive, values[values > 0])
+        self._add(self.negative, -values[values < 0])
+        self.zeros += int(np.count_nonzero(values == 0))
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        return self
+
+    def merge(self, other):
+        """Fold another sketch of the same relative accuracy into this one."""
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_store.items():
+                store[index] = store.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else np.nan
+
+    def quantile(self, q):
+        """
+        Value at quantile q (0-1), within relative_accuracy of the exact value
+        of rank q * (count - 1).
+        """
+        if not self.count:
+            return np.nan
+        rank = q * (self.count - 1)
+        # Buckets in value order: negatives from the largest magnitude, zeros, positives
+        buckets = [(-self._value(index), count) for index, count in sorted(self.negative.items(), reverse=True)]
+        buckets.append((0.0, self.zeros))
+        buckets += [(self._value(index), count) for index, count in sorted(self.positive.items())]
+        seen = 0
+        for value, count in buckets:
+            seen += count
+            if seen > rank:
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def _value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'positive': [[index, count] for index, count in self.positive.items()],
+            'negative': [[index, count] for index, count in self.negative.items()],
+            'zeros': self.zeros,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, stored):
+        sketch = cls(stored['relative_accuracy'])
+        sketch.positive = {index: count for index, count in stored['positive']}
+        sketch.negative = {index: count for index, count in stored['negative']}
+        sketch.zeros, sketch.count, sketch.sum = stored['zeros'], stored['count'], stored['sum']
+        if sketch.count:
+            sketch.min, sketch.max = stored['min'], stored['max']
+        return sketch
+
+
+def sketch_top_months(monthly):
+    """
+    Estimate the new clients of each calendar month from per-month customer sketches.
+
+    A client is new in the month of their first payment, so the new clients
+    of a month are how much the distinct customers seen so far grow in it:
+    the count of the merged sketches up to that month minus the count up to
+    the month before. Each estimate carries the error of that running count,
+    about relative_error of the customers seen so far.
+
+    :param monthly: List of (year, month, HyperLogLog), in chronological order
+    :return: MonthlyCountsResult with estimated new clients per month (1-12) and the number of years seen
+    """
+    if not monthly:
+        return MonthlyCountsResult(pd.Series(dtype='int64'), 0, 'new_clients')
+
+    seen = HyperLogLog(monthly[0][2].precision)
+    previous = 0.0
+    years, months, new_clients = [], [], []
+    for year, month, sketch in monthly:
+        count = seen.merge(sketch).count()
+        years.append(year)
+        months.append(month)
+        new_clients.append(max(count - previous, 0.0))
+        previous = max(previous, count)
+
+    estimates = pd.DataFrame({'year': years, 'month': months, 'new_clients': new_clients})
+    counts = estimates.groupby('month')['new_clients'].sum().reindex(MONTHS, fill_value=0.0)
+    total_years = estimates.loc[estimates['new_clients'] >= 0.5, 'year'].nunique()
+    return MonthlyCountsResult(counts.round().astype('int64'), total_years, 'new_clients')
+
+
+def customer_distributions(data, nome_column='Nome', date_column='Data de confirmação', amount_column='Valor'):
+    """
+    Quantile sketches of the customer lifetime and lifetime value.
+
+    Both are per-customer totals over the whole history, which sketches of
+    separate partitions cannot add up, so they are sketched from one pass of
+    the per-customer kernel over the payments (no tables or labels are built).
+
+    :param data: Payment DataFrame
+    :param nome_column: Column name for client names
+    :param date_column: Column name for dates
+    :param amount_column: Column name for transaction amounts
+    :return: Dictionary with QuantileSketch values under 'customer_lifetime_months'
+             and 'total_value', the columns of the exact customer_lifetime and
+             lifetime_value tables
+    """
+    diagnostics = Diagnostics(rows=len(data))
+    nome_column, date_column, amount_column = resolve_columns(
+        data, diagnostics,
+        name=[nome_column] + NAME_CANDIDATES,
+        date=[date_column] + DATE_CANDIDATES,
+        amount=[amount_column] + AMOUNT_CANDIDATES
+    )
+    _, keys, dates = customer_dates(data, nome_column, date_column, diagnostics)
+    amounts = payment_amounts(data, amount_column, diagnostics)
+    present = np.flatnonzero(keys >= 0)
+    partials = customer_partials(keys[present], dates[present], amounts[present])
+    total_days = partials['lifetime'][3]
+    _, totals = partials['values']
+    return {
+        'customer_lifetime_months': QuantileSketch.from_values(np.round(total_days / 30, 1)),
+        'total_value': QuantileSketch.from_values(totals)
+    }
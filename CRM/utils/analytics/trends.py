@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+from utils.analytics.columns import AMOUNT_CANDIDATES, DATE_CANDIDATES, NAME_CANDIDATES, resolve_columns
+from utils.analytics.customers import customer_dates
+from utils.analytics.results import Diagnostics, MonthlyCountsResult, MonthlyRevenueResult, timed
+from utils.date_parsing import ensure_datetime
+
+MONTHS = range(1, 13)
+
+
+def top_months(data, date_column='Data de confirmação'):
+    """
+    Rank the calendar months by new clients, aggregated across all years.
+
+    A client is new in the month of their first payment.
+
+    :param data: DataFrame containing client data
+    :param date_column: Column name for dates
+    :return: MonthlyCountsResult with new clients per month (1-12) and the number of years seen
+    """
+    diagnostics = Diagnostics(rows=len(data))
+    with timed(diagnostics):
+        nome_column, date_column = resolve_columns(
+            data, diagnostics,
+            name=NAME_CANDIDATES,
+            date=[date_column] + DATE_CANDIDATES
+        )
+        rows, keys, dates = customer_dates(data, nome_column, date_column, diagnostics)
+        if not len(rows):
+            diagnostics.warn("No valid data found for month analysis.")
+            return MonthlyCountsResult(pd.Series(dtype='int64'), 0, 'new_clients', diagnostics)
+
+        first_payments = pd.Series(dates[rows]).groupby(keys[rows]).min()
+        total_years = first_payments.dt.year.nunique()
+        month_counts = first_payments.dt.month.value_counts().reindex(MONTHS, fill_value=0)
+    return MonthlyCountsResult(month_counts, total_years, 'new_clients', diagnostics)
+
+
+def cancellation_months(data, date_column='Data de confirmação', gap_months=3, as_of=None):
+    """
+    Rank the calendar months by client cancellations based on extended payment gaps.
+
+    A client counts as cancelled when their last payment is more than gap_months
+    before as_of, and the cancellation falls in the month of that last payment.
+
+    :param data: DataFrame containing client data
+    :param date_column: Column name for dates
+    :param gap_months: Number of months without payment to consider as cancellation
+    :param as_of: Reference date (defaults to now)
+    :return: MonthlyCountsResult with cancellations per month (1-12) and the number of years seen
+    """
+    diagnostics = Diagnostics(rows=len(data))
+    with timed(diagnostics):
+        nome_column, date_column = resolve_columns(
+            data, diagnostics,
+            name=NAME_CANDIDATES,
+            date=[date_column] + DATE_CANDIDATES
+        )
+        rows, keys, dates = customer_dates(data, nome_column, date_column, diagnostics)
+        if not len(rows):
+            diagnostics.warn("No valid data found for cancellation analysis.")
+            return MonthlyCountsResult(pd.Series(dtype='int64'), 0, 'cancellations', diagnostics)
+
+        last_payments = pd.Series(dates[rows]).groupby(keys[rows]).max()
+        as_of = pd.Timestamp.now() if as_of is None else pd.Timestamp(as_of)
+        months_since_last_payment = (as_of - last_payments) / pd.Timedelta(days=30)
+        cancelled = last_payments[months_since_last_payment > gap_months]
+
+        if cancelled.empty:
+            return MonthlyCountsResult(pd.Series(0, index=MONTHS), 0, 'cancellations', diagnostics)
+
+        cancellation_counts = cancelled.dt.month.value_counts().reindex(MONTHS, fill_value=0)
+        # Years are counted over every dated payment, with or without a customer
+        valid_dates = dates[~np.isnat(dates)]
+        total_years = pd.Series(valid_dates).dt.year.nunique()
+    return MonthlyCountsResult(cancellation_counts, total_years, 'cancellations', diagnostics)
+
+
+def monthly_revenue(data, date_column='data_de_confirmacao', amount_column='valor'):
+    """
+    Calculate total revenue per calendar month.
+
+    :param data: DataFrame containing client data
+    :param date_column: Column name for dates
+    :param amount_column: Column name for transaction amounts
+    :return: MonthlyRevenueResult with month (timestamp of the month start) and total amount
+    """
+    diagnostics = Diagnostics(rows=len(data))
+    with timed(diagnostics):
+        date_column, amount_column = resolve_columns(
+            data, diagnostics,
+            date=[date_column] + DATE_CANDIDATES,
+            amount=[amount_column] + AMOUNT_CANDIDATES
+        )
+        dates = ensure_datetime(data[date_column])
+        valid = dates.notna()
+        diagnostics.rows_used = int(valid.sum())
+        if diagnostics.rows_skipped:
+            diagnostics.warn(f"{diagnostics.rows_skipped} rows without a valid '{date_column}' were skipped.")
+
+        revenue = data[amount_column].groupby(dates.dt.to_period('M')).sum().reset_index()
+        revenue.columns = ['month', amount_column]
+        revenue['month'] = revenue['month'].dt.to_timestamp()
+    return MonthlyRevenueResult(revenue, diagnostics)
@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from utils.analytics import revenue_anomalies
+from utils.file_lock import FileLock, atomic_write
+
+
+class AnomalyBaselines:
+    """
+    Filter state of the revenue anomaly detection, persisted across dataset versions.
+
+    The state tables (per-series baselines and the flags so far) are written
+    as parquet files into a new snapshot directory under anomalies/, and
+    state.json is then swapped to point at it, like the partitioned dataset.
+    Like forecast models, the state survives new uploads: series that only
+    gained observations are continued from it instead of filtered again.
+    """
+
+    def __init__(self, data_dir):
+        self.root = os.path.join(data_dir, 'anomalies')
+        self.state_file = os.path.join(self.root, 'state.json')
+
+    def load(self):
+        """
+        Load the stored state.
+
+        :return: Dictionary of table name -> DataFrame, or None if no complete state is stored
+        """
+        try:
+            with open(self.state_file, 'r') as f:
+                stored = json.load(f)
+            return {
+                name: pd.read_parquet(os.path.join(self.root, stored['snapshot'], f'{name}.parquet'))
+                for name in stored['tables']
+            }
+        except (OSError, json.JSONDecodeError, KeyError):
+            return None
+
+    def store(self, state):
+        """Write a state as a new snapshot and make it the current one."""
+        # Serialize writers across workers, like writes of the partitioned dataset;
+        # readers keep the snapshot state.json pointed at when they opened it
+        with FileLock(self.root):
+            snapshot = f"{time.time_ns()}-{os.getpid()}"
+            os.makedirs(os.path.join(self.root, snapshot))
+            for name, table in state.items():
+                table.to_parquet(os.path.join(self.root, snapshot, f'{name}.parquet'))
+            stored = {'snapshot': snapshot, 'tables': list(state)}
+            atomic_write(self.state_file, lambda f: json.dump(stored, f))
+
+            # The previous snapshot may still be read by another worker
+            snapshots = sorted(
+                entry for entry in os.listdir(self.root)
+                if os.path.isdir(os.path.join(self.root, entry)) and entry != snapshot
+            )
+            for entry in snapshots[:-1]:
+                shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+
+    def detect(self, data):
+        """
+        Flag revenue drops, continuing the series from the stored state.
+
+        :param data: Preprocessed payment DataFrame
+        :return: AnomalyResult; AnalysisError is raised if the data cannot support it
+        """
+        result = revenue_anomalies(data, self.load())
+        if result.sources.get('observations'):
+            try:
+                self.store(result.state)
+            except Exception as e:
+                # A state that cannot be written only costs a full pass next time
+                print(f"Error storing anomaly baselines: {e}")
+        return result
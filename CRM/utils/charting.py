@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+
+# Maximum number of points any chart sends to the browser, regardless of data size
+DEFAULT_POINT_BUDGET = 1000
+DEFAULT_HISTOGRAM_BINS = 50
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Select the indices of a series to keep using Largest-Triangle-Three-Buckets.
+
+    :param x: 1-D array of numeric x values (sorted ascending)
+    :param y: 1-D array of numeric y values
+    :param threshold: Number of points to keep
+    :return: Array of selected indices (always includes first and last point)
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Split the inner points into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Pick the point of the current bucket forming the largest triangle
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return selected
+
+
+def line_chart(df, x, y, title, max_points=DEFAULT_POINT_BUDGET):
+    """
+    Build a line chart downsampled to a fixed point budget with LTTB.
+
+    :param df: DataFrame with the series to plot
+    :param x: Column name for the x axis (numeric or datetime)
+    :param y: Column name for the y axis
+    :param title: Chart title
+    :param max_points: Maximum number of points sent to the browser
+    :return: Plotly Figure
+    """
+    series = df[[x, y]].dropna().sort_values(x)
+    x_values = series[x]
+
+    if pd.api.types.is_datetime64_any_dtype(x_values):
+        x_numeric = x_values.to_numpy(dtype='datetime64[ns]').astype('int64')
+    else:
+        x_numeric = x_values.to_numpy(dtype='float64')
+
+    keep = lttb_indices(x_numeric, series[y].to_numpy(dtype='float64'), max_points)
+    sampled = series.iloc[keep]
+
+    fig = go.Figure(go.Scatter(x=sampled[x], y=sampled[y], mode='lines'))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y)
+    return fig
+
+
+def forecast_chart(history, forecast, x, y, title):
+    """
+    Build a line chart of a series followed by its forecast and prediction interval.
+
+    :param history: DataFrame with the observed series
+    :param forecast: DataFrame with forecast, lower and upper columns
+    :param x: Column name for the x axis (shared by both frames)
+    :param y: Column name for the observed values
+    :param title: Chart title
+    :return: Plotly Figure
+    """
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=history[x], y=history[y], mode='lines', name='actual'))
+    fig.add_trace(go.Scatter(x=forecast[x], y=forecast['upper'], mode='lines', line=dict(width=0), showlegend=False))
+    fig.add_trace(go.Scatter(
+        x=forecast[x], y=forecast['lower'], mode='lines', line=dict(width=0),
+        fill='tonexty', name='95% interval'
+    ))
+    fig.add_trace(go.Scatter(x=forecast[x], y=forecast['forecast'], mode='lines', line=dict(dash='dash'), name='forecast'))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y)
+    return fig
+
+
+def histogram_chart(values, title, x_label, bins=DEFAULT_HISTOGRAM_BINS):
+    """
+    Build a histogram from counts binned on the server with NumPy.
+
+    :param values: Array-like of numeric values
+    :param title: Chart title
+    :param x_label: Label for the x axis
+    :param bins: Number of bins (the point budget of the chart)
+    :return: Plotly Figure
+    """
+    values = pd.to_numeric(pd.Series(values), errors='coerce').dropna().to_numpy(dtype='float64')
+    if len(values) == 0:
+        counts, edges = np.array([]), np.array([0.0])
+    else:
+        counts, edges = np.histogram(values, bins=bins)
+
+    centers = (edges[:-1] + edges[1:]) / 2
+    fig = go.Figure(go.Bar(
+        x=centers,
+        y=counts,
+        width=np.diff(edges),
+        customdata=np.column_stack([edges[:-1], edges[1:]]) if len(counts) else None,
+        hovertemplate='%{customdata[0]:.1f} - %{customdata[1]:.1f}<br>count=%{y}<extra></extra>'
+    ))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title='count', bargap=0)
+    return fig
+
+
+def box_chart(values, title, x_label, max_outliers=DEFAULT_POINT_BUDGET):
+    """
+    Build a horizontal box plot from quartiles computed on the server with NumPy.
+
+    Only the summary statistics and at most ``max_outliers`` outlier points are
+    sent to the browser.
+
+    :param values: Array-like of numeric values
+    :param title: Chart title
+    :param x_label: Label for the value axis
+    :param max_outliers: Maximum number of outlier points to draw
+    :return: Plotly Figure
+    """
+    values = pd.to_numeric(pd.Series(values), errors='coerce').dropna().to_numpy(dtype='float64')
+    fig = go.Figure()
+    fig.update_layout(title=title, xaxis_title=x_label)
+    if len(values) == 0:
+        return fig
+
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+
+    fig.add_trace(go.Box(
+        y=[x_label],
+        q1=[q1],
+        median=[median],
+        q3=[q3],
+        lowerfence=[inside.min()],
+        upperfence=[inside.max()],
+        mean=[values.mean()],
+        orientation='h',
+        name=x_label,
+        boxpoints=False
+    ))
+
+    outliers = np.sort(values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)])
+    if len(outliers) > 0:
+        if len(outliers) > max_outliers:
+            # Evenly spaced by rank so both tails and the extremes stay visible
+            outliers = outliers[np.linspace(0, len(outliers) - 1, max_outliers).astype(np.int64)]
+        fig.add_trace(go.Scatter(
+            x=outliers,
+            y=[x_label] * len(outliers),
+            mode='markers',
+            name='outliers',
+            marker=dict(size=4)
+        ))
+
+    return fig
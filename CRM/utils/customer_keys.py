@@ -0,0 +1,136 @@
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+CUSTOMER_KEY_COLUMN = 'customer_key'
+
+# Candidate identity columns after load_and_preprocess_data normalized the headers
+NAME_COLUMNS = ['nome', 'name', 'client']
+DOCUMENT_COLUMNS = ['cpf_ou_cnpj', 'cpf', 'cnpj', 'documento']
+EMAIL_COLUMNS = ['email', 'e-mail']
+
+
+def _strip_accents(name):
+    return ''.join(c for c in unicodedata.normalize('NFKD', name) if not unicodedata.combining(c))
+
+
+def normalize_names(names):
+    """
+    Normalize customer names so spelling variants map to the same customer.
+
+    :param names: Series of raw names
+    :return: Series of lowercase, accent-free, single-spaced names (NaN kept)
+    """
+    normalized = names.astype('string').str.strip().str.lower().str.replace(r'\s+', ' ', regex=True)
+    # Accent stripping is per string, so only run it on the distinct values
+    uniques = normalized.dropna().unique()
+    return normalized.map({name: _strip_accents(name) for name in uniques}).astype('string')
+
+
+def normalize_name(name):
+    """Normalize a single name exactly as normalize_names does."""
+    return _strip_accents(re.sub(r'\s+', ' ', name.strip().lower()))
+
+
+def _first_present(data, candidates):
+    lowered = {str(col).lower(): col for col in data.columns}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    return None
+
+
+def customer_identities(data, nome_column=None):
+    """
+    Build the identity string of each payment row.
+
+    A valid CPF/CNPJ wins over the email, which wins over the normalized name.
+    Masked documents (as produced by DataAnonimizer) are not valid identities.
+
+    :param data: Payment DataFrame
+    :param nome_column: Column name for client names (auto-detected if None)
+    :return: Series of identity strings (NaN when the row has no identity)
+    """
+    nome_column = nome_column or _first_present(data, NAME_COLUMNS)
+    if nome_column is None:
+        raise KeyError(f"Could not find a customer name column. Available columns: {list(data.columns)}")
+
+    identities = 'name:' + normalize_names(data[nome_column])
+
+    email_column = _first_present(data, EMAIL_COLUMNS)
+    if email_column is not None:
+        emails = data[email_column].astype('string').str.strip().str.lower()
+        valid = emails.str.contains('@', regex=False).fillna(False).astype(bool)
+        identities = identities.mask(valid, 'email:' + emails)
+
+    document_column = _first_present(data, DOCUMENT_COLUMNS)
+    if document_column is not None:
+        digits = data[document_column].astype('string').str.replace(r'\D', '', regex=True)
+        valid = (digits.str.len() >= 11).fillna(False).astype(bool)
+        identities = identities.mask(valid, 'doc:' + digits)
+
+    return identities
+
+
+def build_customer_keys(data, nome_column=None):
+    """
+    Map every customer to a dense int32 key.
+
+    The keys follow the order in which customers first appear; a customer's
+    display name is its first raw name (see customer_labels).
+
+    :param data: Payment DataFrame
+    :param nome_column: Column name for client names (auto-detected if None)
+    :return: int32 array aligned with the rows of data (-1 for rows without identity)
+    """
+    codes, _ = pd.factorize(customer_identities(data, nome_column), use_na_sentinel=True)
+    return codes.astype(np.int32)
+
+
+def get_customer_keys(data, nome_column):
+    """
+    Return the customer keys of a payment DataFrame.
+
+    Uses the customer_key column written at ingestion, building the keys on
+    the fly for data persisted before the column existed.
+
+    :param data: Payment DataFrame
+    :param nome_column: Column name for client names
+    :return: int32 array of customer keys aligned with the rows of data
+    """
+    if CUSTOMER_KEY_COLUMN in data.columns:
+        return data[CUSTOMER_KEY_COLUMN].fillna(-1).to_numpy(dtype=np.int32)
+    return build_customer_keys(data, nome_column)
+
+
+def customer_labels(data, keys, nome_column):
+    """
+    Display name of each customer key present in data.
+
+    :param data: Payment DataFrame
+    :param keys: Customer keys aligned with the rows of data
+    :param nome_column: Column name for client names
+    :return: Series of names indexed by customer key
+    """
+    present = np.flatnonzero(keys >= 0)
+    unique_keys, first_rows = np.unique(keys[present], return_index=True)
+    return pd.Series(data[nome_column].to_numpy()[present[first_rows]], index=unique_keys)
+
+
+def unique_labels(labels):
+    """
+    Make customer labels usable as an index.
+
+    Names shared by several customer keys get the key appended, e.g. "Ana Souza (12)".
+
+    :param labels: Series of names indexed by customer key, as returned by customer_labels
+    :return: Series of distinct labels indexed by customer key
+    """
+    shared = labels.duplicated(keep=False).to_numpy()
+    if not shared.any():
+        return labels
+    labels = labels.astype(object).copy()
+    labels[shared] = [f"{name} ({key})" for name, key in zip(labels[shared], labels.index[shared])]
+    return labels
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+# Tried in order; on ties the earlier format wins, so day-first beats month-first
+CANDIDATE_FORMATS = [
+    '%d/%m/%Y',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    'ISO8601',
+    '%d-%m-%Y',
+    '%d.%m.%Y',
+    '%d/%m/%y',
+    '%m/%d/%Y',
+]
+
+# Number of distinct strings used to detect the format of a column
+SAMPLE_SIZE = 1000
+
+
+def is_date_column(column):
+    """Date columns are recognized by name, as in the original ingestion."""
+    return 'data' in column or 'date' in column
+
+
+def detect_date_format(values):
+    """
+    Detect the date format of a column from a sample of its distinct values.
+
+    :param values: Array of distinct non-null date strings
+    :return: The candidate format parsing most of the sample, or 'mixed' if none does
+    """
+    sample = pd.Series(values[:SAMPLE_SIZE]).astype(str).str.strip()
+    best_format, best_parsed = 'mixed', 0
+    for fmt in CANDIDATE_FORMATS:
+        parsed = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        if parsed > best_parsed:
+            best_format, best_parsed = fmt, parsed
+        if best_parsed == len(sample):
+            break
+    return best_format
+
+
+def parse_dates(series, date_format=None):
+    """
+    Parse a column of date strings, converting each distinct string only once.
+
+    :param series: Series of raw dates
+    :param date_format: Format to use (detected from the data if None)
+    :return: Tuple of (datetime Series, report dictionary with format, unique and coerced counts)
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series, {'format': 'datetime', 'unique': None, 'coerced': 0}
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    uniques = np.asarray(uniques, dtype=object)
+    if len(uniques) == 0:
+        return pd.to_datetime(series, errors='coerce'), {'format': None, 'unique': 0, 'coerced': 0}
+    if date_format is None:
+        date_format = detect_date_format(uniques)
+
+    strings = pd.Series(uniques).astype(str).str.strip()
+    if date_format == 'mixed':
+        parsed_uniques = pd.to_datetime(strings, format='mixed', dayfirst=True, errors='coerce')
+    else:
+        parsed_uniques = pd.to_datetime(strings, format=date_format, errors='coerce')
+
+    # Map the parsed distinct values back to the rows (-1 marks missing input)
+    parsed = parsed_uniques.iloc[np.maximum(codes, 0)].where(codes >= 0)
+    parsed.index = series.index
+    parsed.name = series.name
+
+    report = {
+        'format': date_format,
+        'unique': len(uniques),
+        'coerced': int(parsed_uniques.isna().to_numpy()[codes[codes >= 0]].sum())
+    }
+    return parsed, report
+
+
+def ensure_datetime(series):
+    """
+    Return a column as datetime, parsing it only if ingestion has not already done so.
+
+    :param series: Series of dates (datetime or raw strings)
+    :return: datetime Series
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    parsed, _ = parse_dates(series)
+    return parsed
+
+
+def parse_date_columns(df):
+    """
+    Parse every date column of a DataFrame in place.
+
+    :param df: DataFrame with normalized column names
+    :return: Dictionary mapping each date column to its parse report
+    """
+    reports = {}
+    for col in df.columns:
+        if is_date_column(col):
+            df[col], reports[col] = parse_dates(df[col])
+            if reports[col]['coerced']:
+                print(f"{reports[col]['coerced']} values of {col} could not be parsed as {reports[col]['format']}")
+    return reports
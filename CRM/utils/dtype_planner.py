@@ -0,0 +1,140 @@
+from importlib.util import find_spec
+
+import numpy as np
+import pandas as pd
+
+# Checked without importing pyarrow, which pandas loads only when the dtype is used;
+# without pyarrow, high-cardinality text stays as Python objects
+STRING_DTYPE = 'string[pyarrow]' if find_spec('pyarrow') is not None else None
+
+# Text columns with at most this share of distinct values become categoricals
+MAX_CATEGORY_RATIO = 0.5
+
+# Columns holding money amounts, matched the same way load_and_preprocess_data does
+AMOUNT_MARKERS = ('valor', 'amount', 'preco')
+
+# Columns whose dtype is part of a contract with other modules
+SKIP_COLUMNS = ('customer_key',)
+
+
+def _smallest_int_dtype(values):
+    low, high = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype).name
+    return None
+
+
+def _plan_numeric(series, column):
+    values = series.dropna()
+    if values.empty:
+        return None
+
+    # Amounts keep their dtype (float64 in reais) so sums and arithmetic
+    # on them can neither overflow nor lose cents
+    if any(marker in str(column) for marker in AMOUNT_MARKERS):
+        return None
+
+    if pd.api.types.is_integer_dtype(series):
+        return _smallest_int_dtype(values)
+
+    # Complete float columns holding whole numbers only (e.g. installment counts)
+    # are stored as integers; columns with missing values stay float so NaN survives
+    if len(values) == len(series) and np.array_equal(values, np.round(values)):
+        return _smallest_int_dtype(values.astype(np.int64))
+
+    # Other floats only drop to float32 when the round trip is exact
+    as_float32 = values.astype(np.float32).astype(np.float64)
+    if np.array_equal(as_float32.to_numpy(), values.to_numpy()):
+        return 'float32'
+    return None
+
+
+def _plan_text(series):
+    values = series.dropna()
+    if values.empty:
+        return None
+
+    if values.nunique() <= MAX_CATEGORY_RATIO * len(series):
+        return 'category'
+    return STRING_DTYPE
+
+
+def plan_dtypes(df):
+    """
+    Decide a memory-compact dtype for every column of an ingested DataFrame.
+
+    :param df: DataFrame as produced by ingestion
+    :return: Dictionary mapping column names to target dtypes (only columns that change)
+    """
+    plan = {}
+    for column in df.columns:
+        series = df[column]
+        if column in SKIP_COLUMNS or pd.api.types.is_datetime64_any_dtype(series):
+            continue
+
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        elif pd.api.types.is_numeric_dtype(series):
+            dtype = _plan_numeric(series, column)
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            dtype = _plan_text(series)
+        else:
+            dtype = None
+
+        if dtype is not None and dtype != str(series.dtype):
+            plan[column] = dtype
+    return plan
+
+
+def apply_dtype_plan(df, plan):
+    """
+    Convert the columns of a DataFrame according to a dtype plan.
+
+    Columns that fail to convert keep their original dtype.
+
+    :param df: DataFrame to convert
+    :param plan: Dictionary mapping column names to target dtypes
+    :return: Tuple of (converted DataFrame, dictionary of column -> error of the failed conversions)
+    """
+    failures = {}
+    for column, dtype in plan.items():
+        try:
+            df[column] = df[column].astype(dtype)
+        except (TypeError, ValueError) as e:
+            failures[column] = f"Could not convert to {dtype}: {e}"
+    return df, failures
+
+
+def memory_report(before, after, failures=None):
+    """
+    Compare the per-column memory usage of a DataFrame before and after planning.
+
+    :param before: Per-column memory usage in bytes (Series from memory_usage(deep=True))
+    :param after: Converted DataFrame
+    :param failures: Optional dictionary of column -> error returned by apply_dtype_plan
+    :return: DataFrame with dtype, megabytes before/after and the conversion error (if any) for each column
+    """
+    after_bytes = after.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({
+        'dtype': after.dtypes.astype(str),
+        'before_mb': before.reindex(after_bytes.index) / 1024 ** 2,
+        'after_mb': after_bytes / 1024 ** 2,
+        'error': pd.Series(failures or {}, dtype=object).reindex(after_bytes.index).fillna('')
+    })
+    report.loc['total'] = ['', report['before_mb'].sum(), report['after_mb'].sum(), '']
+    report['reduction'] = report['before_mb'] / report['after_mb'].replace(0, np.nan)
+    return report
+
+
+def optimize_dtypes(df):
+    """
+    Plan and apply memory-compact dtypes to an ingested DataFrame.
+
+    :param df: DataFrame as produced by ingestion
+    :return: Tuple of (converted DataFrame, memory report)
+    """
+    before = df.memory_usage(index=False, deep=True)
+    df, failures = apply_dtype_plan(df, plan_dtypes(df))
+    return df, memory_report(before, df, failures)
@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows development machines run a single worker, so locking is skipped there
+    fcntl = None
+
+
+class FileLock:
+    """
+    Cross-process exclusive lock on a sidecar lock file.
+
+    The lock is held through flock, so it is released by the OS if the
+    process dies. A thread lock is taken first, because flock does not
+    exclude threads of the same process that open the file separately.
+    """
+
+    _thread_locks = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self, path):
+        self.lock_file = path + '.lock'
+        with FileLock._thread_locks_guard:
+            self.thread_lock = FileLock._thread_locks.setdefault(self.lock_file, threading.Lock())
+        self.handle = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            self.handle = open(self.lock_file, 'a')
+            if fcntl is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX)
+        except Exception:
+            self.thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+            self.handle.close()
+        finally:
+            self.handle = None
+            self.thread_lock.release()
+
+
+def atomic_write(path, write, mode='w'):
+    """
+    Write a file so readers see either the old or the new content, never a mix.
+
+    The content goes to a temporary file in the same directory, is fsynced
+    and renamed over the target.
+
+    :param path: Target file path
+    :param write: Callable receiving the open temporary file
+    :param mode: File mode ('w' or 'wb')
+    """
+    temp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_file, mode) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+class VersionCounter:
+    """
+    Per-resource version numbers shared by all worker processes.
+
+    Writers bump a resource's version after changing it; readers compare the
+    version they loaded with the current one to know when to pull updates,
+    which costs a single small file read instead of reloading the data.
+    """
+
+    def __init__(self, data_dir):
+        self.versions_file = os.path.join(data_dir, 'versions.json')
+
+    def read(self):
+        """Return all resource versions (empty if nothing was written yet)."""
+        try:
+            with open(self.versions_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def get(self, resource):
+        return self.read().get(resource, 0)
+
+    def bump(self, resource):
+        """
+        Increment the version of a resource.
+
+        :param resource: Resource name, e.g. 'leads' or 'uploaded_data'
+        :return: The new version
+        """
+        with FileLock(self.versions_file):
+            versions = self.read()
+            versions[resource] = versions.get(resource, 0) + 1
+            atomic_write(self.versions_file, lambda f: json.dump(versions, f))
+        return versions[resource]
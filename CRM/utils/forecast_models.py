@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+
+from utils.analytics import revenue_forecast
+from utils.file_lock import atomic_write
+
+
+class ForecastModels:
+    """
+    Fitted revenue forecast models, persisted across dataset versions.
+
+    Each segment's model is one JSON file under
+    forecasts/<segment column>/<segment hash>.json holding the fitted
+    parameters, the final states and the version of the series it was fitted
+    on. Unlike materialized views, models are not dropped when a new dataset
+    is saved: a series that only gained months is updated from its stored
+    model instead of fitted again.
+    """
+
+    def __init__(self, data_dir):
+        self.root = os.path.join(data_dir, 'forecasts')
+
+    def segment_dir(self, segment_column):
+        return os.path.join(self.root, segment_column or 'total')
+
+    def model_file(self, segment_column, segment):
+        name = hashlib.md5(str(segment).encode()).hexdigest()[:12]
+        return os.path.join(self.segment_dir(segment_column), f'{name}.json')
+
+    def load(self, segment_column=None):
+        """
+        Load the stored models of a segmentation.
+
+        :param segment_column: Column the revenue was segmented by (None for the total only)
+        :return: Dictionary of segment -> model dictionary
+        """
+        directory = self.segment_dir(segment_column)
+        if not os.path.isdir(directory):
+            return {}
+        models = {}
+        for entry in os.listdir(directory):
+            if not entry.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, entry), 'r') as f:
+                    stored = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            models[stored['segment']] = stored['model']
+        return models
+
+    def store(self, segment_column, models):
+        """Write the models of a segmentation, one file per segment."""
+        os.makedirs(self.segment_dir(segment_column), exist_ok=True)
+        for segment, model in models.items():
+            stored = {'segment': segment, 'model': model}
+            atomic_write(self.model_file(segment_column, segment), lambda f: json.dump(stored, f))
+
+    def forecast(self, data, horizon=6, segment_column=None, jobs=1):
+        """
+        Forecast monthly revenue, reusing and updating the stored models.
+
+        :param data: Preprocessed payment DataFrame
+        :param horizon: Number of months to forecast
+        :param segment_column: Optional column splitting the revenue into segments
+        :param jobs: Worker processes fitting the segments that need a fit
+        :return: ForecastResult; AnalysisError is raised if the data cannot support it
+        """
+        result = revenue_forecast(data, horizon, segment_column, self.load(segment_column), jobs)
+        changed = {segment: model for segment, model in result.models.items() if result.sources[segment] != 'cached'}
+        if changed:
+            try:
+                self.store(segment_column, changed)
+            except Exception as e:
+                # A model that cannot be written only costs a refit next time
+                print(f"Error storing forecast models: {e}")
+        return result
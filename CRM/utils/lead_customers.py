@@ -0,0 +1,145 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from utils.analytics.columns import AMOUNT_CANDIDATES, DATE_CANDIDATES, NAME_CANDIDATES, find_column
+from utils.customer_keys import DOCUMENT_COLUMNS, EMAIL_COLUMNS, get_customer_keys, normalize_name, normalize_names
+from utils.date_parsing import ensure_datetime
+
+# Lead fields that may hold a CPF/CNPJ
+LEAD_DOCUMENT_FIELDS = ('cpf', 'cnpj', 'cpf_ou_cnpj', 'document')
+
+
+def normalize_email(email):
+    """Lowercase, trimmed email, or None when the value is not an email."""
+    if not isinstance(email, str) or '@' not in email:
+        return None
+    return email.strip().lower()
+
+
+def anonymized_email(email):
+    """The address DataAnonimizer writes in place of an email."""
+    return hashlib.md5(email.encode()).hexdigest()[:8] + '@anonymous.com'
+
+
+def _lookup(values, keys):
+    """
+    Hash table from identity value to customer key.
+
+    Values shared by several customers (e.g. a common name) are ambiguous and left out.
+
+    :param values: Series of identity values aligned with keys
+    :param keys: Customer keys aligned with values
+    :return: Dictionary of value -> customer key
+    """
+    pairs = pd.DataFrame({'value': values.to_numpy(), 'key': keys})
+    pairs = pairs[pairs['value'].notna() & (pairs['key'] >= 0)].drop_duplicates()
+    unique = pairs.drop_duplicates('value', keep=False)
+    return dict(zip(unique['value'], unique['key'].astype(int)))
+
+
+class LeadCustomerIndex:
+    """
+    Join index from Kanban leads to the customers of the payment history.
+
+    The payments are scanned once to build hash tables from normalized email,
+    CPF/CNPJ digits and normalized name to customer key, and the per-customer
+    totals (LTV, payments, last payment) are aggregated in the same pass.
+    Each lead is then linked with a few dictionary lookups, in priority
+    order: document, email, the email as DataAnonimizer hashes it (for
+    anonymized exports), and finally the name when it is unambiguous. Leads
+    are linked, re-linked and dropped one at a time as they change, like
+    LeadSearchIndex, and a new dataset version gets a new index.
+    """
+
+    def __init__(self, data, leads=None):
+        nome_column = find_column(data, NAME_CANDIDATES)
+        keys = get_customer_keys(data, nome_column)
+
+        self.lookups = {'name': _lookup(normalize_names(data[nome_column]), keys)}
+        email_column = next((column for column in EMAIL_COLUMNS if column in data.columns), None)
+        if email_column is not None:
+            emails = data[email_column].astype('string').str.strip().str.lower()
+            self.lookups['email'] = _lookup(emails.where(emails.str.contains('@', regex=False).fillna(False)), keys)
+        document_column = next((column for column in DOCUMENT_COLUMNS if column in data.columns), None)
+        if document_column is not None:
+            digits = data[document_column].astype('string').str.replace(r'\D', '', regex=True)
+            self.lookups['doc'] = _lookup(digits.where(digits.str.len() >= 11), keys)
+
+        self.customers = self._customer_totals(data, keys)
+        self.links = {}
+        for lead in leads or []:
+            self.update(lead)
+
+    @staticmethod
+    def _customer_totals(data, keys):
+        """LTV, payment count and last payment date per customer key."""
+        amount_column = find_column(data, AMOUNT_CANDIDATES)
+        date_column = find_column(data, ['data_de_confirmacao'] + DATE_CANDIDATES)
+        present = keys >= 0
+        n_customers = int(keys.max()) + 1 if present.any() else 0
+        amounts = pd.to_numeric(data[amount_column], errors='coerce').fillna(0).to_numpy(dtype='float64')
+        dates = ensure_datetime(data[date_column]).to_numpy(dtype='datetime64[ns]')
+
+        dated = present & ~np.isnat(dates)
+        last_payment = pd.Series(dates[dated]).groupby(keys[dated]).max().reindex(range(n_customers))
+
+        return pd.DataFrame({
+            'ltv': np.bincount(keys[present], weights=amounts[present], minlength=n_customers),
+            'payments': np.bincount(keys[present], minlength=n_customers),
+            'last_payment': last_payment.to_numpy()
+        })
+
+    def match(self, lead):
+        """
+        Customer key of a lead, or None when no identity of the lead is in the payments.
+
+        :param lead: Lead dictionary (name, email and optionally a CPF/CNPJ field)
+        """
+        for field in LEAD_DOCUMENT_FIELDS:
+            digits = ''.join(c for c in str(lead.get(field) or '') if c.isdigit())
+            if len(digits) >= 11 and digits in self.lookups.get('doc', {}):
+                return self.lookups['doc'][digits]
+
+        emails = self.lookups.get('email', {})
+        email = normalize_email(lead.get('email'))
+        if email is not None:
+            for candidate in (email, anonymized_email(lead['email']), anonymized_email(email)):
+                if candidate in emails:
+                    return emails[candidate]
+
+        name = lead.get('name')
+        if isinstance(name, str) and name.strip():
+            return self.lookups['name'].get(normalize_name(name))
+        return None
+
+    def update(self, lead):
+        """Link a new or edited lead; returns its customer key or None."""
+        key = self.match(lead)
+        if key is None:
+            self.links.pop(lead['id'], None)
+        else:
+            self.links[lead['id']] = key
+        return key
+
+    def remove(self, lead_id):
+        """Drop a deleted lead; unknown IDs are ignored."""
+        self.links.pop(lead_id, None)
+
+    def customer(self, lead_id):
+        """
+        Payment totals of the customer a lead is linked to.
+
+        :return: Dictionary with customer_key, ltv, payments and last_payment, or None
+        """
+        key = self.links.get(lead_id)
+        if key is None:
+            return None
+        totals = self.customers.iloc[key]
+        return {
+            'customer_key': key,
+            'ltv': float(totals['ltv']),
+            'payments': int(totals['payments']),
+            'last_payment': totals['last_payment']
+        }
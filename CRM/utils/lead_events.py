@@ -0,0 +1,381 @@
+import copy
+import json
+import os
+import threading
+import time
+import uuid
+
+from utils.file_lock import FileLock, VersionCounter, atomic_write
+
+# Stages of the lead funnel, in board order
+FUNNEL_STAGES = ["New Lead", "Contacted", "Pitched", "Converted"]
+
+# Number of tail events after which the log is folded into a new snapshot
+COMPACT_EVERY = 200
+
+EVENT_TYPES = ('create', 'update', 'move', 'delete')
+
+# Journal ids of recently applied changes, kept so journal replays are idempotent.
+# Only this many changes back are recognized, so a write queue flushes at most
+# this many changes per batch (a replay can only repeat the last batch)
+RECENT_JIDS = 1000
+
+
+def empty_funnel():
+    """Funnel counters maintained incrementally from the event stream."""
+    return {
+        'current': {},        # leads currently in each stage
+        'entered': {},        # leads that ever entered each stage
+        'exits': {},          # leads that left each stage (by move or delete)
+        'seconds_in_stage': {},  # total time spent in a stage by the leads that left it
+        'transitions': {},    # "from -> to" move counts
+        'stage_since': {}     # lead id -> timestamp of entering its current stage
+    }
+
+
+def _increment(counter, key, amount=1):
+    counter[key] = counter.get(key, 0) + amount
+
+
+def _enter_stage(funnel, lead_id, status, ts):
+    _increment(funnel['current'], status)
+    _increment(funnel['entered'], status)
+    funnel['stage_since'][lead_id] = ts
+
+
+def _leave_stage(funnel, lead_id, status, ts):
+    _increment(funnel['current'], status, -1)
+    _increment(funnel['exits'], status)
+    since = funnel['stage_since'].pop(lead_id, ts)
+    _increment(funnel['seconds_in_stage'], status, ts - since)
+
+
+def apply_event(leads, funnel, event):
+    """
+    Apply one lead event to the board and the funnel counters.
+
+    :param leads: Dictionary of lead id -> lead, updated in place
+    :param funnel: Funnel counters, updated in place
+    :param event: Event dictionary with seq, ts, type, lead_id and data
+    """
+    lead_id = event['lead_id']
+    ts = event['ts']
+    data = event.get('data', {})
+
+    if event['type'] == 'create':
+        lead = dict(data, id=lead_id)
+        lead.setdefault('status', FUNNEL_STAGES[0])
+        leads[lead_id] = lead
+        _enter_stage(funnel, lead_id, lead['status'], ts)
+    elif lead_id not in leads:
+        # Events for leads deleted or never created are ignored on replay
+        return
+    elif event['type'] == 'update':
+        leads[lead_id].update({key: value for key, value in data.items() if key not in ('id', 'status')})
+    elif event['type'] == 'move':
+        previous = leads[lead_id].get('status', FUNNEL_STAGES[0])
+        if previous == data['status']:
+            return
+        leads[lead_id]['status'] = data['status']
+        _leave_stage(funnel, lead_id, previous, ts)
+        _enter_stage(funnel, lead_id, data['status'], ts)
+        _increment(funnel['transitions'], f"{previous} -> {data['status']}")
+    elif event['type'] == 'delete':
+        lead = leads.pop(lead_id)
+        _leave_stage(funnel, lead_id, lead.get('status', FUNNEL_STAGES[0]), ts)
+
+
+class LeadEventLog:
+    """
+    Append-only log of lead creates, edits, status moves and deletes.
+
+    The current board is the last snapshot plus the events appended after it.
+    Every COMPACT_EVERY events the board and the funnel counters are written
+    to a new snapshot and the log is truncated, so loads only replay a short tail
+    and funnel metrics never rescan history. A truncated log starts with a
+    header line naming its generation; a reader whose byte offset belongs to
+    an earlier generation reloads instead of seeking past the new events.
+
+    Writers from every worker process serialize on a file lock and bump the
+    'leads' version; readers call refresh() to apply only the events appended
+    since their last read.
+    """
+
+    def __init__(self, data_dir, compact_every=COMPACT_EVERY):
+        self.events_file = os.path.join(data_dir, 'lead_events.jsonl')
+        self.snapshot_file = os.path.join(data_dir, 'lead_snapshot.json')
+        self.compact_every = compact_every
+        self.versions = VersionCounter(data_dir)
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.seq = 0
+        self.leads = {}
+        self.funnel = empty_funnel()
+        self.tail_events = 0
+        self.recent_jids = []
+        self.snapshot_stamp = None
+        self.generation = None
+        self.offset = 0
+
+    def exists(self):
+        return os.path.exists(self.snapshot_file) or os.path.exists(self.events_file)
+
+    def _snapshot_stamp(self):
+        try:
+            stat = os.stat(self.snapshot_file)
+            return stat.st_ino, stat.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _log_generation(self):
+        """Generation named in the header of the events file (None for a log never truncated)."""
+        try:
+            with open(self.events_file, 'rb') as f:
+                first_line = f.readline()
+        except FileNotFoundError:
+            return None
+        try:
+            header = json.loads(first_line)
+        except json.JSONDecodeError:
+            return None
+        return header.get('generation') if isinstance(header, dict) else None
+
+    def load(self):
+        """Load the snapshot and replay the events appended after it."""
+        with self.lock:
+            while True:
+                self._reset()
+                self.snapshot_stamp = self._snapshot_stamp()
+                if self.snapshot_stamp is not None:
+                    with open(self.snapshot_file, 'r') as f:
+                        snapshot = json.load(f)
+                    self.seq = snapshot['seq']
+                    self.leads = {lead['id']: lead for lead in snapshot['leads']}
+                    self.funnel = snapshot['funnel']
+                    self.recent_jids = snapshot.get('recent_jids', [])
+                self._replay_tail()
+                # A compaction in another process between the two reads means
+                # the tail may be missing events; start over from the new snapshot
+                if self._snapshot_stamp() == self.snapshot_stamp:
+                    return self
+
+    def refresh(self):
+        """
+        Bring the board up to date, reading only the events appended since the last read.
+
+        Falls back to a full load when another process compacted the log.
+        """
+        with self.lock:
+            try:
+                events_size = os.path.getsize(self.events_file)
+            except FileNotFoundError:
+                events_size = 0
+            if (self._snapshot_stamp() != self.snapshot_stamp or events_size < self.offset
+                    or self._log_generation() != self.generation):
+                return self.load()
+            if events_size > self.offset:
+                self._replay_tail()
+            return self
+
+    def _replay_tail(self):
+        if not os.path.exists(self.events_file):
+            return
+        with open(self.events_file, 'rb') as f:
+            f.seek(self.offset)
+            for line in iter(f.readline, b''):
+                if not line.endswith(b'\n'):
+                    # A line still being written is read again on the next refresh
+                    break
+                self.offset = f.tell()
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn line from a crash mid-append is dropped
+                    print(f"Skipping unreadable lead event: {line!r}")
+                    continue
+                if 'generation' in event:
+                    # Header of a log truncated by a compaction
+                    self.generation = event['generation']
+                    continue
+                # Events already folded into the snapshot are skipped
+                if event['seq'] <= self.seq:
+                    continue
+                apply_event(self.leads, self.funnel, event)
+                self._remember_jids(event)
+                self.seq = event['seq']
+                self.tail_events += 1
+
+    def _remember_jids(self, event):
+        if event.get('jids'):
+            self.recent_jids = (self.recent_jids + event['jids'])[-RECENT_JIDS:]
+
+    def has_applied(self, jid):
+        """Whether a journaled change (by journal id) is already in the log."""
+        return jid in self.recent_jids
+
+    def current_leads(self):
+        """Return the current board as a list of lead dictionaries."""
+        return [dict(lead) for lead in self.leads.values()]
+
+    def with_changes(self, changes):
+        """
+        Return a detached copy of the log with not-yet-written changes applied.
+
+        :param changes: Changes with ts, type, lead_id, data and jid
+        :return: LeadEventLog copy; the shared log is left untouched
+        """
+        with self.lock:
+            view = copy.copy(self)
+            view.leads = {lead_id: dict(lead) for lead_id, lead in self.leads.items()}
+            view.funnel = copy.deepcopy(self.funnel)
+        for change in changes:
+            if not view.has_applied(change['jid']):
+                apply_event(view.leads, view.funnel, change)
+        return view
+
+    def append(self, event_type, lead_id, **data):
+        """
+        Durably append one event and apply it to the in-memory board.
+
+        :param event_type: One of 'create', 'update', 'move' or 'delete'
+        :param lead_id: ID of the lead the event applies to
+        :param data: Lead fields for create/update, or status for move
+        :return: The appended event
+        """
+        return self.append_many([{'type': event_type, 'lead_id': lead_id, 'data': data}])[-1]
+
+    def append_many(self, changes):
+        """
+        Durably append a batch of events with a single fsync.
+
+        Changes whose journal ids are all already in the log are skipped.
+
+        :param changes: List of dictionaries with type, lead_id, data and optionally
+                        ts and jids (journal ids of the changes folded into the event)
+        :return: The appended events
+        """
+        for change in changes:
+            if change['type'] not in EVENT_TYPES:
+                raise ValueError(f"Unknown lead event type: {change['type']}")
+
+        with self.lock, FileLock(self.events_file):
+            # Other workers may have appended since our last read
+            self.refresh()
+
+            events = []
+            for change in changes:
+                if change.get('jids') and all(self.has_applied(jid) for jid in change['jids']):
+                    continue
+                self.seq += 1
+                events.append({
+                    'seq': self.seq,
+                    'ts': change.get('ts', time.time()),
+                    'type': change['type'],
+                    'lead_id': change['lead_id'],
+                    'data': change.get('data', {})
+                })
+                if change.get('jids'):
+                    events[-1]['jids'] = change['jids']
+            if not events:
+                return events
+
+            with open(self.events_file, 'a') as f:
+                f.write(''.join(json.dumps(event) + '\n' for event in events))
+                f.flush()
+                os.fsync(f.fileno())
+                self.offset = f.tell()
+
+            for event in events:
+                apply_event(self.leads, self.funnel, event)
+                self._remember_jids(event)
+            self.tail_events += len(events)
+
+            if self.tail_events >= self.compact_every:
+                self._write_snapshot()
+            self.versions.bump('leads')
+        return events
+
+    def compact(self, leads=None):
+        """
+        Write the current board and funnel counters to a new snapshot and truncate the log.
+
+        :param leads: Optional list of leads replacing the whole board
+        """
+        with self.lock, FileLock(self.events_file):
+            self.refresh()
+            if leads is not None:
+                self.leads = {lead['id']: dict(lead) for lead in leads}
+                current = {}
+                for lead_id, lead in self.leads.items():
+                    status = lead.get('status', FUNNEL_STAGES[0])
+                    _increment(current, status)
+                    # Leads the funnel has not seen yet count as entering their stage now
+                    if lead_id not in self.funnel['stage_since']:
+                        _increment(self.funnel['entered'], status)
+                self.funnel['current'] = current
+                self.funnel['stage_since'] = {
+                    lead_id: self.funnel['stage_since'].get(lead_id, time.time()) for lead_id in self.leads
+                }
+            self._write_snapshot()
+            self.versions.bump('leads')
+
+    def _write_snapshot(self):
+        snapshot = {
+            'seq': self.seq,
+            'leads': list(self.leads.values()),
+            'funnel': self.funnel,
+            'recent_jids': self.recent_jids
+        }
+        atomic_write(self.snapshot_file, lambda f: json.dump(snapshot, f))
+        self.snapshot_stamp = self._snapshot_stamp()
+
+        # The snapshot covers every event up to seq, so the tail can be dropped;
+        # the new generation tells readers their offsets into the old tail are void
+        generation = uuid.uuid4().hex
+        with open(self.events_file, 'w') as f:
+            f.write(json.dumps({'generation': generation, 'seq': self.seq}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+            self.offset = f.tell()
+        self.generation = generation
+        self.tail_events = 0
+        print(f"Compacted lead event log at seq {self.seq}")
+
+    def funnel_metrics(self):
+        """
+        Summarize the funnel counters per stage.
+
+        :return: List of dictionaries with current leads, leads entered, conversion to the
+                 next stage and average days spent in each stage
+        """
+        metrics = []
+        for position, stage in enumerate(FUNNEL_STAGES):
+            entered = self.funnel['entered'].get(stage, 0)
+            exits = self.funnel['exits'].get(stage, 0)
+            next_entered = self.funnel['entered'].get(FUNNEL_STAGES[position + 1], 0) if position + 1 < len(FUNNEL_STAGES) else None
+            metrics.append({
+                'stage': stage,
+                'current': self.funnel['current'].get(stage, 0),
+                'entered': entered,
+                'conversion_to_next': next_entered / entered if entered and next_entered is not None else None,
+                'avg_days_in_stage': self.funnel['seconds_in_stage'].get(stage, 0) / exits / 86400 if exits else None
+            })
+        return metrics
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_lead_log(data_dir):
+    """
+    Return the process-wide lead event log for a data directory, loaded once.
+
+    Sessions share it and call refresh() to pull the events other workers appended.
+    """
+    with _logs_lock:
+        if data_dir not in _logs:
+            _logs[data_dir] = LeadEventLog(data_dir).load()
+        return _logs[data_dir]
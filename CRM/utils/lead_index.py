@@ -0,0 +1,147 @@
+import re
+import unicodedata
+from bisect import bisect_left, insort
+
+# Lead fields covered by the search index
+INDEXED_FIELDS = ('name', 'email', 'company', 'status', 'source')
+
+
+def tokenize(text):
+    """
+    Split a field value into lowercase, accent-free search tokens.
+
+    Emails are split on '@' and '.', so 'ana.silva@acme.com' is found by 'silva' or 'acme'.
+
+    :param text: Raw field value
+    :return: List of tokens
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [token for token in re.split(r'[^0-9a-z]+', text) if token]
+
+
+class LeadSearchIndex:
+    """
+    In-process inverted index over the lead store with token and prefix lookup.
+
+    Tokens map to the set of lead IDs containing them, and a sorted token list
+    answers prefix queries with a binary search. Field values are also kept
+    per field so the board can filter on exact status or source, and the
+    leads themselves by ID so matches are returned without scanning the store.
+    """
+
+    def __init__(self, leads=None):
+        self.postings = {}
+        self.sorted_tokens = []
+        self.field_values = {field: {} for field in INDEXED_FIELDS}
+        self.lead_tokens = {}
+        self.lead_fields = {}
+        # Lead ID -> (position in the store, lead); re-indexing keeps the position
+        self.leads = {}
+        self.next_position = 0
+        for lead in leads or []:
+            self._index(lead, keep_sorted=False)
+        self.sorted_tokens = sorted(self.postings)
+
+    def __len__(self):
+        return len(self.lead_tokens)
+
+    def __contains__(self, lead_id):
+        return lead_id in self.lead_tokens
+
+    def add(self, lead):
+        """Index a new lead (or re-index an existing one)."""
+        self._index(lead, keep_sorted=True)
+
+    def _index(self, lead, keep_sorted):
+        lead_id = lead['id']
+        position = self.leads[lead_id][0] if lead_id in self.leads else self.next_position
+        if lead_id in self.lead_tokens:
+            self.remove(lead_id)
+        if position == self.next_position:
+            self.next_position += 1
+        self.leads[lead_id] = (position, lead)
+
+        tokens = set()
+        fields = {}
+        for field in INDEXED_FIELDS:
+            value = lead.get(field)
+            if not value:
+                continue
+            tokens.update(tokenize(value))
+            fields[field] = value
+            self.field_values[field].setdefault(value, set()).add(lead_id)
+
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                if keep_sorted:
+                    insort(self.sorted_tokens, token)
+            self.postings[token].add(lead_id)
+
+        self.lead_tokens[lead_id] = tokens
+        self.lead_fields[lead_id] = fields
+
+    def update(self, lead):
+        """Re-index a lead after an edit."""
+        self.add(lead)
+
+    def remove(self, lead_id):
+        """Drop a lead from the index; unknown IDs are ignored."""
+        self.leads.pop(lead_id, None)
+        for token in self.lead_tokens.pop(lead_id, ()):
+            ids = self.postings[token]
+            ids.discard(lead_id)
+            if not ids:
+                del self.postings[token]
+                del self.sorted_tokens[bisect_left(self.sorted_tokens, token)]
+
+        for field, value in self.lead_fields.pop(lead_id, {}).items():
+            ids = self.field_values[field][value]
+            ids.discard(lead_id)
+            if not ids:
+                del self.field_values[field][value]
+
+    def get_leads(self, lead_ids):
+        """
+        Look up leads by ID, in the order they were first indexed.
+
+        :param lead_ids: Iterable of lead IDs, e.g. the result of search()
+        :return: List of lead dictionaries (unknown IDs are skipped)
+        """
+        found = [self.leads[lead_id] for lead_id in lead_ids if lead_id in self.leads]
+        return [lead for _, lead in sorted(found, key=lambda entry: entry[0])]
+
+    def _prefix_matches(self, prefix):
+        matches = set()
+        position = bisect_left(self.sorted_tokens, prefix)
+        while position < len(self.sorted_tokens) and self.sorted_tokens[position].startswith(prefix):
+            matches |= self.postings[self.sorted_tokens[position]]
+            position += 1
+        return matches
+
+    def search(self, query='', **filters):
+        """
+        Find the leads matching a free-text query and exact field filters.
+
+        Every query token must match the start of a token of the lead.
+
+        :param query: Free text, e.g. 'ana acme'
+        :param filters: Exact field values, e.g. status='Contacted'
+        :return: Set of matching lead IDs
+        """
+        groups = [self._prefix_matches(token) for token in tokenize(query)]
+        groups += [self.field_values.get(field, {}).get(value, set()) for field, value in filters.items() if value]
+        if not groups:
+            return set(self.lead_tokens)
+
+        # Intersecting from the smallest group keeps every step cheap
+        groups.sort(key=len)
+        candidates = set(groups[0])
+        for ids in groups[1:]:
+            if not candidates:
+                break
+            candidates &= ids
+        return candidates
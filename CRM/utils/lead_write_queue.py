@@ -0,0 +1,228 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+from utils.file_lock import atomic_write
+from utils.lead_events import EVENT_TYPES, RECENT_JIDS, get_lead_log
+
+# Mutations arriving within this window are flushed together
+FLUSH_INTERVAL = 0.5
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_lead_write_queue(data_dir):
+    """
+    Return the process-wide write-behind queue for a data directory.
+
+    Streamlit creates a new StateManager on every rerun, so the queue and its
+    flush thread live at module level, one per data directory.
+    """
+    with _queues_lock:
+        if data_dir not in _queues:
+            _queues[data_dir] = LeadWriteQueue(data_dir)
+        return _queues[data_dir]
+
+
+def coalesce(changes):
+    """
+    Merge a batch of lead changes into the fewest events with the same end state.
+
+    Edits of the same lead fold into its earlier create or edit, and a lead
+    created and deleted within the batch disappears entirely. Status moves are
+    kept one by one so the funnel still counts every transition.
+
+    :param changes: Journaled changes in arrival order
+    :return: List of changes ready for LeadEventLog.append_many
+    """
+    merged = []
+    mergeable = {}
+    created = set()
+    for change in changes:
+        lead_id = change['lead_id']
+        jids = change.get('jids', [change['jid']])
+
+        if change['type'] == 'update' and lead_id in mergeable:
+            target = merged[mergeable[lead_id]]
+            target['data'] = dict(target['data'], **change['data'])
+            target['jids'] = target['jids'] + jids
+            continue
+
+        if change['type'] == 'delete':
+            # Pending edits of a deleted lead no longer matter, and a lead created
+            # in this batch leaves no trace at all
+            for position, entry in enumerate(merged):
+                if entry is not None and entry['lead_id'] == lead_id and (
+                        lead_id in created or entry['type'] == 'update'):
+                    merged[position] = None
+            mergeable.pop(lead_id, None)
+            if lead_id in created:
+                created.discard(lead_id)
+                continue
+
+        merged.append({
+            'type': change['type'],
+            'lead_id': lead_id,
+            'ts': change['ts'],
+            'data': dict(change['data']),
+            'jids': list(jids)
+        })
+        if change['type'] in ('create', 'update'):
+            mergeable[lead_id] = len(merged) - 1
+        if change['type'] == 'create':
+            created.add(lead_id)
+    return [entry for entry in merged if entry is not None]
+
+
+class LeadWriteQueue:
+    """
+    Write-behind queue for lead mutations.
+
+    enqueue() appends the change to a per-process journal and fsyncs it
+    before returning, so an acknowledged change survives a host crash.
+    A background thread collects the changes arriving within FLUSH_INTERVAL,
+    coalesces them and appends them to the lead event log with one fsync.
+    Journals left by crashed processes are replayed on startup, and every
+    change carries a journal id so a replay never applies it twice; the log
+    remembers the last RECENT_JIDS ids, so a batch never holds more changes.
+    """
+
+    def __init__(self, data_dir, flush_interval=FLUSH_INTERVAL):
+        self.data_dir = data_dir
+        self.log = get_lead_log(data_dir)
+        self.journal_file = os.path.join(data_dir, f'lead_journal.{os.getpid()}.jsonl')
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.closed = False
+
+        self.recover()
+
+        self.thread = threading.Thread(target=self._run, name='lead-write-behind', daemon=True)
+        self.thread.start()
+        # Flush whatever is still pending when the server shuts down
+        atexit.register(self.close)
+
+    def enqueue(self, event_type, lead_id, **data):
+        """
+        Journal a lead change and schedule it for the next flush.
+
+        :param event_type: One of 'create', 'update', 'move' or 'delete'
+        :param lead_id: ID of the lead that changed
+        :param data: Lead fields for create/update, or status for move
+        :return: The journaled change
+        """
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Unknown lead event type: {event_type}")
+        change = {'jid': uuid.uuid4().hex, 'ts': time.time(), 'type': event_type, 'lead_id': lead_id, 'data': data}
+
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Lead write queue is closed")
+            # On disk before the change is acknowledged, so it survives a host crash
+            with open(self.journal_file, 'a') as f:
+                f.write(json.dumps(change) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending.append(change)
+            self.condition.notify()
+        return change
+
+    def pending_changes(self):
+        """Changes acknowledged to the UI but not yet in the event log."""
+        with self.condition:
+            return list(self.pending)
+
+    def flush(self):
+        """
+        Append the pending changes to the event log in one durable batch.
+
+        At most RECENT_JIDS changes are flushed; the flush thread picks up the rest.
+
+        :return: Number of journaled changes flushed
+        """
+        with self.flush_lock:
+            with self.condition:
+                # A replay after a crash can only be recognized RECENT_JIDS changes back
+                batch = self.pending[:RECENT_JIDS]
+            if not batch:
+                return 0
+
+            # Changes already in the log (by journal id) are skipped by append_many
+            changes = coalesce(batch)
+            if changes:
+                changes = self.log.append_many(changes)
+
+            with self.condition:
+                del self.pending[:len(batch)]
+                self._rewrite_journal(self.journal_file, self.pending)
+            print(f"Flushed {len(batch)} lead changes as {len(changes)} events")
+            return len(batch)
+
+    def close(self):
+        """Stop the flush thread and write out everything still pending."""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify()
+        self.thread.join(timeout=5)
+        while self.flush():
+            pass
+
+    def recover(self):
+        """Replay the journals of processes that stopped before flushing."""
+        for journal_file in glob.glob(os.path.join(self.data_dir, 'lead_journal.*.jsonl')):
+            pid = int(journal_file.rsplit('.', 2)[-2])
+            if pid != os.getpid() and _process_alive(pid):
+                continue
+
+            changes = []
+            with open(journal_file, 'r') as f:
+                for line in f:
+                    try:
+                        changes.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        print(f"Skipping unreadable journal entry: {line!r}")
+
+            changes = self.log.append_many(coalesce(changes)) if changes else []
+            if changes:
+                print(f"Recovered {len(changes)} lead events from {journal_file}")
+            os.remove(journal_file)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                # Give the changes of a rapid triage a window to batch up
+                deadline = time.monotonic() + self.flush_interval
+                while not self.closed and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+                if self.closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing lead changes, retrying: {e}")
+                time.sleep(self.flush_interval)
+
+    @staticmethod
+    def _rewrite_journal(journal_file, changes):
+        atomic_write(journal_file, lambda f: f.write(''.join(json.dumps(change) + '\n' for change in changes)))
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
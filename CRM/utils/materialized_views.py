@@ -0,0 +1,216 @@
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.analytics import (
+    ANALYSES,
+    Diagnostics,
+    GapsResult,
+    LifetimeResult,
+    LifetimeValueResult,
+    MonthlyCountsResult,
+    MonthlyRevenueResult,
+    RFMResult,
+    run_analysis
+)
+
+# Bumped whenever the stored layout or an analysis' output changes, so views
+# written by older code are recomputed instead of misread
+VIEW_FORMAT = 2
+
+RESULT_TYPES = {cls.__name__: cls for cls in (
+    GapsResult, LifetimeResult, LifetimeValueResult, MonthlyCountsResult, MonthlyRevenueResult, RFMResult
+)}
+
+
+def params_key(params):
+    """Short stable hash of an analysis' parameters."""
+    encoded = json.dumps(dict(params, format=VIEW_FORMAT), sort_keys=True, default=str)
+    return hashlib.md5(encoded.encode()).hexdigest()[:12]
+
+
+def _save_column(directory, position, values):
+    """
+    Store one column as .npy files and return its metadata.
+
+    Numeric, boolean and datetime columns are stored as they are. Text and other
+    object columns are stored as int32 codes plus a fixed-width array of the
+    distinct values, so they can be memory-mapped too.
+    """
+    values = pd.Series(values)
+    dtype = values.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+        np.save(os.path.join(directory, f'c{position}.npy'), values.to_numpy())
+        return {'encoding': 'plain'}
+
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    np.save(os.path.join(directory, f'c{position}.npy'), codes.astype(np.int32))
+    np.save(os.path.join(directory, f'c{position}.values.npy'), np.asarray(uniques, dtype=str))
+    return {'encoding': 'codes'}
+
+
+def _load_column(directory, position, meta):
+    values = np.load(os.path.join(directory, f'c{position}.npy'), mmap_mode='r')
+    if meta['encoding'] == 'plain':
+        return values
+
+    uniques = np.load(os.path.join(directory, f'c{position}.values.npy'), mmap_mode='r').astype(object)
+    decoded = np.empty(len(values), dtype=object)
+    present = values >= 0
+    decoded[present] = uniques[values[present]]
+    decoded[~present] = None
+    return decoded
+
+
+def save_table(directory, table):
+    """
+    Write a DataFrame (index included) as one .npy file per column.
+
+    :return: Metadata needed by load_table
+    """
+    columns = [table.index] + [table[column] for column in table.columns]
+    return {
+        'index_name': table.index.name,
+        'columns': list(table.columns),
+        'encodings': [_save_column(directory, position, values) for position, values in enumerate(columns)]
+    }
+
+
+def load_table(directory, meta):
+    """Rebuild a DataFrame written by save_table, with numeric columns memory-mapped."""
+    arrays = [_load_column(directory, position, encoding) for position, encoding in enumerate(meta['encodings'])]
+    index = pd.Index(arrays[0], name=meta['index_name'])
+    return pd.DataFrame(dict(zip(meta['columns'], arrays[1:])), index=index, columns=meta['columns'], copy=False)
+
+
+class MaterializedViews:
+    """
+    Analysis results persisted to disk, keyed by dataset version and parameters.
+
+    Each view is a directory of .npy column files plus meta.json under
+    views/v<dataset version>/<analysis>-<params hash>/. Views are loaded
+    memory-mapped, so a fresh server process or session serves them without
+    recomputing. Saving a new dataset version drops every older view.
+    """
+
+    def __init__(self, data_dir):
+        self.root = os.path.join(data_dir, 'views')
+
+    def version_dir(self, dataset_version):
+        return os.path.join(self.root, f'v{dataset_version}')
+
+    def view_dir(self, name, dataset_version, params):
+        return os.path.join(self.version_dir(dataset_version), f'{name}-{params_key(params)}')
+
+    def load(self, name, dataset_version, **params):
+        """
+        Load a stored view.
+
+        :param name: Analysis name
+        :param dataset_version: Version of the uploaded data the view was computed from
+        :param params: Analysis parameters
+        :return: Result object, or None if the view was never stored
+        """
+        directory = self.view_dir(name, dataset_version, params)
+        try:
+            with open(os.path.join(directory, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        table = load_table(directory, meta['table'])
+        diagnostics = Diagnostics(**dict(meta['diagnostics'], materialized=True))
+        result_type = RESULT_TYPES[meta['result_type']]
+        if result_type is MonthlyCountsResult:
+            return MonthlyCountsResult(table['count'], meta['total_years'], meta['label'], diagnostics)
+        return result_type(table, diagnostics)
+
+    def store(self, name, dataset_version, result, **params):
+        """
+        Persist a result as a view.
+
+        The view is written to a temporary directory and renamed into place, so
+        readers in other processes never see a partial view.
+
+        :param name: Analysis name
+        :param dataset_version: Version of the uploaded data the result was computed from
+        :param result: Result object returned by the analysis
+        :param params: Analysis parameters
+        """
+        directory = self.view_dir(name, dataset_version, params)
+        temp_dir = f"{directory}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(temp_dir, exist_ok=True)
+        try:
+            meta = {
+                'result_type': type(result).__name__,
+                'diagnostics': dataclasses.asdict(result.diagnostics)
+            }
+            if isinstance(result, MonthlyCountsResult):
+                table = result.counts.rename('count').to_frame()
+                meta.update(total_years=int(result.total_years), label=result.label)
+            else:
+                table = result.table
+            meta['table'] = save_table(temp_dir, table)
+            with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+                json.dump(meta, f, default=str)
+            try:
+                os.rename(temp_dir, directory)
+            except OSError:
+                # Another worker stored the same view first
+                pass
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def get(self, name, data, dataset_version, gap_months=3, jobs=1, date_range=None):
+        """
+        Return an analysis result, computing and storing it only if no view exists.
+
+        :param name: Analysis name (key of utils.analytics.ANALYSES)
+        :param data: Preprocessed payment DataFrame of that dataset version
+        :param dataset_version: Version of the uploaded data
+        :param gap_months: Months without payment that count as a cancellation
+        :param jobs: Worker processes for the per-customer analyses on a miss
+        :param date_range: Optional (start, end) tuple the analysis is limited to
+        :return: Result object
+        """
+        params = {}
+        if name == 'cancellation_months':
+            # Cancellations are measured against today, so the view is kept for one day
+            params = {'gap_months': gap_months, 'as_of': pd.Timestamp.now().date().isoformat()}
+        if date_range is not None:
+            params.update(start=date_range[0], end=date_range[1])
+        result = self.load(name, dataset_version, **params)
+        if result is not None:
+            return result
+
+        result = run_analysis(name, data, gap_months, jobs, date_range)
+        try:
+            self.store(name, dataset_version, result, **params)
+        except Exception as e:
+            # A view that cannot be written only costs a recompute next time
+            print(f"Error storing materialized view {name}: {e}")
+        return result
+
+    def materialize(self, data, dataset_version, gap_months=3, jobs=1):
+        """Compute and store every standard analysis for a dataset version."""
+        for name in ANALYSES:
+            self.get(name, data, dataset_version, gap_months, jobs)
+
+    def invalidate(self, keep_version=None):
+        """
+        Drop the views of every dataset version except keep_version.
+
+        Processes still holding a dropped view memory-mapped keep reading it safely.
+        """
+        if not os.path.isdir(self.root):
+            return
+        for entry in os.listdir(self.root):
+            if keep_version is not None and entry == f'v{keep_version}':
+                continue
+            shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
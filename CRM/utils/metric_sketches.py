@@ -0,0 +1,155 @@
+import json
+import os
+
+import pandas as pd
+
+from utils.analytics import (
+    AnalysisError,
+    Diagnostics,
+    HyperLogLog,
+    MonthlyCountsResult,
+    QuantileSketch,
+    customer_distributions,
+    sketch_top_months
+)
+from utils.analytics.trends import MONTHS
+from utils.customer_keys import get_customer_keys
+from utils.file_lock import FileLock, atomic_write
+from utils.partitioned_store import partition_keys, partition_name
+
+
+def _partition_file_name(name):
+    return name.replace('/', '_') + '.json'
+
+
+class MetricSketches:
+    """
+    Mergeable sketches behind the approximate metrics mode, built when a dataset is saved.
+
+    sketches/partitions/ holds a HyperLogLog of the customers of every
+    year/month partition, tagged with the partition's fingerprint from the
+    dataset manifest; a new upload sketches only the partitions whose rows
+    changed. sketches/v<dataset version>.json holds what the approximate
+    metrics of one dataset version read: the merge of the partition sketches
+    (distinct customers), the new clients per calendar month estimated from
+    them (enrollment trends) and quantile sketches of the customer lifetime
+    and lifetime value. Reading it costs a small JSON file however long the
+    history is, and no analysis view is computed.
+    """
+
+    def __init__(self, data_dir):
+        self.root = os.path.join(data_dir, 'sketches')
+        self.partitions_dir = os.path.join(self.root, 'partitions')
+
+    def version_file(self, dataset_version):
+        return os.path.join(self.root, f'v{dataset_version}.json')
+
+    def _load_partition(self, name):
+        try:
+            with open(os.path.join(self.partitions_dir, _partition_file_name(name)), 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def partition_sketches(self, df, manifest):
+        """
+        HyperLogLog of the customers of every partition, sketching only the changed ones.
+
+        :param df: The DataFrame the manifest was written from
+        :param manifest: Manifest returned by PartitionedDataset.write
+        :return: Tuple of (list of ((year, month), HyperLogLog) in partition order,
+                 number of partitions sketched again)
+        """
+        fingerprints = {partition['name']: partition.get('fingerprint') for partition in manifest['partitions']}
+        # The fingerprint covers the customer_key column, so a partition kept from
+        # an earlier upload counts its customers under the keys of this one
+        keys = get_customer_keys(df, None)
+        _, groups = partition_keys(df)
+
+        os.makedirs(self.partitions_dir, exist_ok=True)
+        sketches = []
+        sketched = 0
+        for (year, month), rows in sorted(df.groupby(groups, sort=True).indices.items()):
+            name = partition_name(year, month)
+            stored = self._load_partition(name)
+            fingerprint = fingerprints.get(name)
+            if stored is not None and fingerprint is not None and stored['fingerprint'] == fingerprint:
+                sketch = HyperLogLog.from_dict(stored['customers'])
+            else:
+                customer_keys = keys[rows]
+                sketch = HyperLogLog().update(customer_keys[customer_keys >= 0])
+                stored = {'fingerprint': fingerprint, 'customers': sketch.to_dict()}
+                atomic_write(
+                    os.path.join(self.partitions_dir, _partition_file_name(name)),
+                    lambda f: json.dump(stored, f)
+                )
+                sketched += 1
+            sketches.append(((year, month), sketch))
+
+        # Partitions no longer in the dataset
+        current = {_partition_file_name(name) for name in fingerprints}
+        for entry in os.listdir(self.partitions_dir):
+            if entry.endswith('.json') and entry not in current:
+                os.remove(os.path.join(self.partitions_dir, entry))
+        return sketches, sketched
+
+    def update(self, df, manifest, dataset_version):
+        """
+        Sketch a newly saved dataset version and drop the sketches of older ones.
+
+        :param df: Preprocessed DataFrame just written as that version
+        :param manifest: Manifest returned by PartitionedDataset.write
+        :param dataset_version: Version of the uploaded data
+        :return: Number of partitions sketched again
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with FileLock(self.root):
+            sketches, sketched = self.partition_sketches(df, manifest)
+
+            customers = HyperLogLog()
+            for _, sketch in sketches:
+                customers.merge(sketch)
+            trends = sketch_top_months([(year, month, sketch) for (year, month), sketch in sketches if year >= 0])
+            stored = {
+                'customers': customers.to_dict(),
+                'new_clients': trends.counts.tolist(),
+                'total_years': int(trends.total_years)
+            }
+            try:
+                for column, sketch in customer_distributions(df).items():
+                    stored[column] = sketch.to_dict()
+            except AnalysisError as e:
+                # Without dates or amounts only the customer counts are sketched
+                print(f"Skipping lifetime sketches: {e}")
+            atomic_write(self.version_file(dataset_version), lambda f: json.dump(stored, f))
+
+            keep = os.path.basename(self.version_file(dataset_version))
+            for entry in os.listdir(self.root):
+                if entry.startswith('v') and entry.endswith('.json') and entry != keep:
+                    os.remove(os.path.join(self.root, entry))
+        return sketched
+
+    def load(self, dataset_version):
+        """
+        Load the sketches of a dataset version.
+
+        :param dataset_version: Version of the uploaded data
+        :return: Dictionary with 'customers' (HyperLogLog), 'top_months'
+            (MonthlyCountsResult of estimated new clients) and, when the data
+            had dates and amounts, 'customer_lifetime_months' and 'total_value'
+            (QuantileSketch); None if the version was not sketched
+        """
+        try:
+            with open(self.version_file(dataset_version), 'r') as f:
+                stored = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        counts = pd.Series(stored['new_clients'], index=MONTHS if stored['new_clients'] else None, dtype='int64')
+        sketches = {
+            'customers': HyperLogLog.from_dict(stored['customers']),
+            'top_months': MonthlyCountsResult(counts, stored['total_years'], 'new_clients', Diagnostics(materialized=True))
+        }
+        for column in ('customer_lifetime_months', 'total_value'):
+            if column in stored:
+                sketches[column] = QuantileSketch.from_dict(stored[column])
+        return sketches
@@ -0,0 +1,226 @@
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from utils.analytics.columns import DATE_CANDIDATES, find_column
+from utils.analytics.ranges import end_of_day
+from utils.dtype_planner import optimize_dtypes
+from utils.file_lock import atomic_write
+
+# Column the dataset is partitioned on, tried in this order
+PARTITION_DATE_CANDIDATES = ['data_de_confirmacao'] + DATE_CANDIDATES
+
+# Partition holding the rows without a valid date; it never overlaps a date range,
+# unless the dataset has no date column at all and is read whole
+UNDATED = 'undated'
+
+
+def _stat(value):
+    """JSON-friendly min/max statistic (dates as ISO strings, NaN as None)."""
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return value.item() if hasattr(value, 'item') else value
+
+
+def partition_stats(part, date_column):
+    """
+    Row count and min/max of the date and numeric columns of one partition.
+
+    :param part: Rows of the partition
+    :param date_column: Partitioning date column (None for a dataset without dates)
+    :return: Dictionary of statistics
+    """
+    dates = part[date_column] if date_column is not None else pd.Series(dtype='datetime64[ns]')
+    stats = {'rows': len(part), 'min': _stat(dates.min()), 'max': _stat(dates.max()), 'columns': {}}
+    for column in part.columns:
+        if column != date_column and pd.api.types.is_numeric_dtype(part[column]) and not pd.api.types.is_bool_dtype(part[column]):
+            stats['columns'][column] = {'min': _stat(part[column].min()), 'max': _stat(part[column].max())}
+    return stats
+
+
+def partition_fingerprint(part):
+    """
+    Content hash of one partition, unchanged as long as its rows are.
+
+    Row hashes are summed, so the fingerprint does not depend on row order.
+
+    :param part: Rows of the partition
+    :return: Hex string
+    """
+    total = pd.util.hash_pandas_object(part, index=False).sum()
+    return f"{int(total) & 0xFFFFFFFFFFFFFFFF:016x}"
+
+
+def partition_keys(df):
+    """
+    Partitioning date column and the year/month partition of every row.
+
+    :param df: Preprocessed DataFrame
+    :return: Tuple of (date column or None if the dataset has no dates,
+             [year, month] Series to group the rows by; -1 for rows without a valid date)
+    """
+    try:
+        date_column = find_column(df, PARTITION_DATE_CANDIDATES)
+        dates = pd.to_datetime(df[date_column], errors='coerce')
+    except KeyError:
+        # Without a date column every row goes to the undated partition
+        date_column = None
+        dates = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    return date_column, [dates.dt.year.fillna(-1).astype(int), dates.dt.month.fillna(-1).astype(int)]
+
+
+def partition_name(year, month):
+    """Manifest name of the partition of a year and month (-1 for the undated one)."""
+    return UNDATED if year < 0 else f"year={year}/month={month:02d}"
+
+
+def overlaps(partition, start=None, end=None):
+    """
+    Whether a partition may hold rows within [start, end].
+
+    :param partition: Manifest entry with min and max dates
+    :param start: Range start (None for unbounded)
+    :param end: Range end, inclusive (None for unbounded)
+    """
+    if start is None and end is None:
+        return True
+    if partition['min'] is None:
+        return False
+    if start is not None and pd.Timestamp(partition['max']) < pd.Timestamp(start):
+        return False
+    if end is not None and pd.Timestamp(partition['min']) > end_of_day(end):
+        return False
+    return True
+
+
+class PartitionedDataset:
+    """
+    The uploaded dataset stored as one Parquet file per year and month.
+
+    manifest.json lists every partition with its row count, min/max
+    statistics and content fingerprint, so a date-bounded read opens only the partitions overlapping
+    the range. Each save writes a new directory of partitions and then swaps
+    the manifest atomically; readers holding the previous manifest can still
+    finish, since the previous directory is kept until the next save.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest_file = os.path.join(root, 'manifest.json')
+
+    def exists(self):
+        return os.path.exists(self.manifest_file)
+
+    def manifest(self):
+        """Return the current manifest, or None if nothing was saved yet."""
+        try:
+            with open(self.manifest_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def write(self, df, version=None):
+        """
+        Write a dataset as year/month partitions and make it the current one.
+
+        Callers serialize writers (StateManager holds a file lock).
+
+        :param df: Preprocessed DataFrame
+        :param version: Dataset version recorded in the manifest
+        :return: The new manifest
+        """
+        date_column, keys = partition_keys(df)
+        snapshot = f"{time.time_ns()}-{os.getpid()}"
+        snapshot_dir = os.path.join(self.root, snapshot)
+        partitions = []
+        for (year, month), part in df.groupby(keys, sort=True):
+            name = partition_name(year, month)
+            path = os.path.join(snapshot_dir, f"{name}.parquet")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            part.to_parquet(path, index=False)
+            partitions.append(dict(
+                partition_stats(part, date_column), name=name, path=os.path.relpath(path, self.root),
+                fingerprint=partition_fingerprint(part)
+            ))
+
+        manifest = {
+            'version': version,
+            'snapshot': snapshot,
+            'date_column': date_column,
+            'rows': len(df),
+            'columns': list(df.columns),
+            'partitions': partitions
+        }
+        atomic_write(self.manifest_file, lambda f: json.dump(manifest, f, indent=4))
+        self._drop_old_snapshots(keep=snapshot)
+        return manifest
+
+    def _drop_old_snapshots(self, keep):
+        snapshots = sorted(
+            entry for entry in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, entry)) and entry != keep
+        )
+        # The newest previous snapshot may still be read by another worker
+        for entry in snapshots[:-1]:
+            shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+
+    def bounds(self):
+        """
+        Earliest and latest date in the dataset, from the manifest alone.
+
+        :return: Tuple of (min, max) Timestamps, or None
+        """
+        manifest = self.manifest()
+        if manifest is None:
+            return None
+        dated = [partition for partition in manifest['partitions'] if partition['min'] is not None]
+        if not dated:
+            return None
+        return (min(pd.Timestamp(partition['min']) for partition in dated),
+                max(pd.Timestamp(partition['max']) for partition in dated))
+
+    def read(self, start=None, end=None, columns=None):
+        """
+        Read the dataset, opening only the partitions overlapping [start, end].
+
+        :param start: Range start (None for unbounded)
+        :param end: Range end, inclusive; a date includes the whole day (None for unbounded)
+        :param columns: Optional subset of columns to read
+        :return: Tuple of (DataFrame of the rows within the range, read report), or (None, None)
+        """
+        manifest = self.manifest()
+        if manifest is None:
+            return None, None
+
+        # A dataset without a date column cannot be limited to a range
+        date_column = manifest['date_column']
+        if date_column is None:
+            start = end = None
+
+        selected = [partition for partition in manifest['partitions'] if overlaps(partition, start, end)]
+        report = {'partitions': len(selected), 'total_partitions': len(manifest['partitions'])}
+        if not selected:
+            report['rows'] = 0
+            return pd.DataFrame(columns=columns or manifest['columns']), report
+
+        parts = [pd.read_parquet(os.path.join(self.root, partition['path']), columns=columns) for partition in selected]
+        df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+        # Partitions at the edges of the range may hold rows outside it
+        if (start is not None or end is not None) and date_column in df.columns:
+            within = df[date_column].notna()
+            if start is not None:
+                within &= df[date_column] >= pd.Timestamp(start)
+            if end is not None:
+                within &= df[date_column] <= end_of_day(end)
+            df = df[within].reset_index(drop=True)
+
+        # Each file restores its own categories; re-plan the dtypes of the combined frame
+        df, _ = optimize_dtypes(df)
+        report['rows'] = len(df)
+        return df, report
@@ -1,19 +1,35 @@
 import os
 import json
 import pandas as pd
+from utils.date_parsing import parse_date_columns
+from utils.dtype_planner import optimize_dtypes
+from utils.anomaly_baselines import AnomalyBaselines
+from utils.file_lock import FileLock, VersionCounter
+from utils.forecast_models import ForecastModels
+from utils.lead_events import get_lead_log
+from utils.lead_write_queue import get_lead_write_queue
+from utils.analytics import revenue_anomalies, revenue_forecast, within_date_range
+from utils.materialized_views import MaterializedViews
+from utils.metric_sketches import MetricSketches
+from utils.partitioned_store import PartitionedDataset
+
+# Worker processes used to compute per-customer analytics (1 keeps them in the server process)
+ANALYTICS_JOBS = int(os.environ.get('CRM_ANALYTICS_JOBS', '1'))
 
 class StateManager:
     def __init__(self):
-        # Dynamically resolve the base directory
+        # Dynamically resolve the base directory; CRM_DATA_DIR points a run
+        # (e.g. a load test) at a separate data directory
         base_dir = os.path.dirname(os.path.abspath(__file__))
-        self.data_dir = os.path.join(base_dir, 'data')
+        self.data_dir = os.environ.get('CRM_DATA_DIR') or os.path.join(base_dir, 'data')
         self.leads_file = os.path.join(self.data_dir, 'leads.json')
         self.uploaded_data_file = os.path.join(self.data_dir, 'uploaded_data.csv')
+        self.uploaded_data_dir = os.path.join(self.data_dir, 'uploaded_data')
 
         # Debug: Verify paths
         print(f"Resolved data directory: {self.data_dir}")
         print(f"Resolved leads file path: {self.leads_file}")
-        print(f"Resolved uploaded data file path: {self.uploaded_data_file}")
+        print(f"Resolved uploaded data path: {self.uploaded_data_dir}")
 
         # Create directory and initialize the leads file
         try:
@@ -24,6 +40,15 @@ class StateManager:
         
         if not os.path.exists(self.leads_file):
             self.initialize_leads_file()
+        
+        self.versions = VersionCounter(self.data_dir)
+        self.lead_log = get_lead_log(self.data_dir)
+        self.lead_queue = get_lead_write_queue(self.data_dir)
+        self.views = MaterializedViews(self.data_dir)
+        self.dataset = PartitionedDataset(self.uploaded_data_dir)
+        self.forecasts = ForecastModels(self.data_dir)
+        self.anomalies = AnomalyBaselines(self.data_dir)
+        self.sketches = MetricSketches(self.data_dir)
 
     def initialize_leads_file(self):
         try:
@@ -36,50 +61,244 @@ class StateManager:
             print(f"Error initializing leads file: {e}")
             return False
         
+    def load_legacy_leads(self):
+        """Read the board from leads.json, as written before the lead event log existed."""
+        if not os.path.exists(self.leads_file) or os.path.getsize(self.leads_file) == 0:
+            return []
+        with open(self.leads_file, 'r') as f:
+            leads = json.load(f)
+        return leads if isinstance(leads, list) else []
+
     def load_leads(self):
         try:
-            if not os.path.exists(self.leads_file):
-                print("Leads file does not exist. Initializing...")
-                return self.initialize_leads_file()
-
-            if os.path.getsize(self.leads_file) == 0:
-                print("Leads file is empty. Initializing...")
-                return self.initialize_leads_file()
-
-            with open(self.leads_file, 'r') as f:
-                leads = json.load(f)
-                print(f"Loaded leads from file: {leads}")
-                return leads if isinstance(leads, list) else []
+            if not self.lead_log.exists():
+                # First run with the event log: seed its snapshot from leads.json
+                leads = self.load_legacy_leads()
+                print(f"Seeding lead event log with {len(leads)} leads from {self.leads_file}")
+                self.lead_log.compact(leads)
+                return self.lead_log.current_leads()
+
+            leads = self.load_lead_log().current_leads()
+            print(f"Loaded {len(leads)} leads from event log")
+            return leads
         except Exception as e:
             print(f"Error loading leads: {e}")
             return []
 
+    def load_lead_log(self):
+        """
+        Pull new lead events and overlay the changes still waiting in the write-behind queue.
 
-    def save_leads(self, leads):
-        print(f"Leads file path: {self.leads_file}")
+        :return: Detached LeadEventLog view of the current board
+        """
+        return self.lead_log.refresh().with_changes(self.lead_queue.pending_changes())
+
+    def leads_version(self):
+        """Version of the lead store, bumped by every worker that writes to it."""
+        return self.versions.get('leads')
+
+    def uploaded_data_version(self):
+        """Version of the uploaded dataset, bumped on every save."""
+        return self.versions.get('uploaded_data')
 
+    def save_leads(self, leads):
+        """Replace the whole board with a new snapshot of the lead event log."""
         try:
-            print(f"Attempting to save leads: {leads}")  # Debug log
-            with open(self.leads_file, 'w') as f:
-                json.dump(leads, f, indent=4)
-                f.flush()
-                os.fsync(f.fileno())
-            print(f"Leads successfully saved to {self.leads_file}")  # Debug log
+            self.lead_queue.flush()
+            self.lead_log.compact(leads)
+            print(f"Leads successfully saved to {self.lead_log.snapshot_file}")  # Debug log
             return True
         except Exception as e:
             print(f"Error saving leads: {e}")  # Debug log
             return False
 
+    def record_lead_event(self, event_type, lead_id, **data):
+        """
+        Queue one lead change for the lead event log.
+
+        The change is journaled and acknowledged immediately; the write-behind
+        queue appends it to the event log in the next batch.
+
+        :param event_type: One of 'create', 'update', 'move' or 'delete'
+        :param lead_id: ID of the lead that changed
+        :param data: Lead fields for create/update, or status for move
+        :return: True if the change was journaled
+        """
+        try:
+            if not self.lead_log.exists():
+                self.load_leads()
+            self.lead_queue.enqueue(event_type, lead_id, **data)
+            print(f"Queued lead event {event_type} for {lead_id}")  # Debug log
+            return True
+        except Exception as e:
+            print(f"Error recording lead event: {e}")  # Debug log
+            return False
+
+    def load_lead_funnel(self):
+        """Return the funnel metrics maintained by the lead event log."""
+        try:
+            return self.load_lead_log().funnel_metrics()
+        except Exception as e:
+            print(f"Error loading lead funnel: {e}")
+            return []
+
 
 
     def save_uploaded_data(self, df):
+        """
+        Store an ingested dataset as the new version of the uploaded data.
+
+        :param df: Preprocessed DataFrame
+        :return: The new dataset version; the error is re-raised if the data could not be saved
+        """
         try:
-            df.to_csv(self.uploaded_data_file, index=False)
-            print(f"Data successfully saved to {self.uploaded_data_file}")
+            # Serialize writers across workers; readers keep the previous partitions
+            # until the manifest is swapped, and see the new version only after that
+            with FileLock(self.uploaded_data_dir):
+                manifest = self.dataset.write(df, self.uploaded_data_version() + 1)
+                version = self.versions.bump('uploaded_data')
+            print(f"Data successfully saved to {self.uploaded_data_dir} "
+                  f"({len(manifest['partitions'])} partitions, version {version})")
         except Exception as e:
             print(f"Error saving uploaded data: {e}")
+            raise
+        
+        # Views of older versions are stale. The views of the new version are
+        # computed on first use (or ahead of time by materialize()), not here
+        try:
+            self.views.invalidate(keep_version=version)
+        except Exception as e:
+            print(f"Error dropping stale analytics views: {e}")
+
+        # The sketches are built from the rows in memory, only for the partitions that changed
+        try:
+            sketched = self.sketches.update(df, manifest, version)
+            print(f"Updated metric sketches ({sketched} partitions sketched)")
+        except Exception as e:
+            # Without sketches the approximate metrics fall back to the exact ones
+            print(f"Error updating metric sketches: {e}")
+        return version
+
+    def materialize(self):
+        """
+        Precompute the analytics views and anomaly baselines of the stored dataset.
+
+        Pages compute whatever is missing on first use, so this only warms them
+        up; it runs off the request path (python batch_analytics.py --materialize).
+
+        :return: Dataset version materialized, or None if nothing was uploaded
+        """
+        version = self.uploaded_data_version()
+        df = self.load_uploaded_data()
+        if df is None:
+            return None
+
+        self.views.materialize(df, version, jobs=ANALYTICS_JOBS)
+        print(f"Materialized analytics views for version {version}")
+
+        # Filter only the payments appended since the last run into the anomaly baselines
+        result = self.anomalies.detect(df)
+        print(f"Updated anomaly baselines ({result.sources.get('observations', 0)} new observations)")
+        return version
     
-    def load_uploaded_data(self):
+    def load_analysis(self, name, data, data_version, gap_months=3, date_range=None):
+        """
+        Return an analysis result from its materialized view, computing it on a miss.
+
+        :param name: Analysis name (key of utils.analytics.ANALYSES)
+        :param data: Uploaded DataFrame of that version
+        :param data_version: Version of the uploaded data, as loaded into the session
+        :param gap_months: Months without payment that count as a cancellation
+        :param date_range: Optional (start, end) tuple the analysis is limited to
+        :return: Result object; AnalysisError is raised if the data cannot support it
+        """
+        return self.views.get(name, data, data_version, gap_months, ANALYTICS_JOBS, date_range)
+
+    def load_forecast(self, data, horizon=6, segment_column=None, date_range=None):
+        """
+        Forecast monthly revenue from the stored models, fitting only what changed.
+
+        A date-limited dataset is fitted on its own, leaving the stored models
+        of the full history untouched.
+
+        :param data: Uploaded DataFrame, as loaded into the session
+        :param horizon: Number of months to forecast
+        :param segment_column: Optional column splitting the revenue into segments
+        :param date_range: Optional (start, end) tuple the session data is limited to
+        :return: ForecastResult; AnalysisError is raised if the data cannot support it
+        """
+        if date_range is not None:
+            return revenue_forecast(data, horizon, segment_column, jobs=ANALYTICS_JOBS)
+        return self.forecasts.forecast(data, horizon, segment_column, ANALYTICS_JOBS)
+
+    def load_anomalies(self, data, date_range=None):
+        """
+        Flag revenue drops, continuing from the stored baselines.
+
+        A date-limited dataset is analyzed on its own, leaving the stored
+        baselines of the full history untouched.
+
+        :param data: Uploaded DataFrame, as loaded into the session
+        :param date_range: Optional (start, end) tuple the session data is limited to
+        :return: AnomalyResult; AnalysisError is raised if the data cannot support it
+        """
+        if date_range is not None:
+            return revenue_anomalies(data)
+        return self.anomalies.detect(data)
+
+    def load_sketches(self, data_version, date_range=None):
+        """
+        Sketches behind the approximate metrics of a dataset version.
+
+        The sketches summarize the full history; a date-limited session gets
+        None and shows the exact metrics of its range.
+
+        :param data_version: Version of the uploaded data, as loaded into the session
+        :param date_range: Optional (start, end) tuple the session data is limited to
+        :return: Dictionary of sketches (see MetricSketches.load), or None
+        """
+        if date_range is not None:
+            return None
+        return self.sketches.load(data_version)
+
+    def uploaded_data_bounds(self):
+        """
+        Earliest and latest payment date of the uploaded dataset.
+
+        :return: Tuple of (min, max) Timestamps, or None if unknown
+        """
+        try:
+            return self.dataset.bounds()
+        except Exception as e:
+            print(f"Error reading uploaded data bounds: {e}")
+            return None
+
+    def load_uploaded_data(self, start=None, end=None):
+        """
+        Load the uploaded dataset, optionally only the payments within [start, end].
+
+        Only the year/month partitions overlapping the range are read.
+
+        :param start: Range start (None for unbounded)
+        :param end: Range end, inclusive (None for unbounded)
+        :return: Preprocessed DataFrame, or None if nothing was uploaded
+        """
+        try:
+            if self.dataset.exists():
+                df, report = self.dataset.read(start, end)
+                if df is None or (df.empty and start is None and end is None):
+                    print("Loaded DataFrame is empty")
+                    return None
+                print(f"Loaded {report['rows']:,} rows from {report['partitions']} of "
+                      f"{report['total_partitions']} partitions")
+                return df
+            return self.load_legacy_uploaded_data(start, end)
+        except Exception as e:
+            print(f"Error loading uploaded data: {e}")
+            return None
+
+    def load_legacy_uploaded_data(self, start=None, end=None):
+        """Read uploaded_data.csv, as written before the dataset was partitioned."""
         try:
             if not os.path.exists(self.uploaded_data_file):
                 print("Uploaded data file does not exist")
@@ -93,7 +312,12 @@ class StateManager:
             if df.empty:
                 print("Loaded DataFrame is empty")
                 return None
-                
+            
+            # CSV does not keep dtypes, so parse dates and plan dtypes again on every load
+            parse_date_columns(df)
+            df = within_date_range(df, start, end, 'data_de_confirmacao')
+            df, memory = optimize_dtypes(df)
+            print(f"Loaded uploaded data using {memory.loc['total', 'after_mb']:.1f} MB")
             return df
             
         except pd.errors.EmptyDataError: